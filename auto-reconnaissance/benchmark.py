@@ -0,0 +1,410 @@
+import argparse
+import asyncio
+import json
+import logging
+import math
+import platform
+import random
+import resource
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone, timedelta
+
+import entities_api as anduril_entities
+import numpy as np
+
+from services.arbiter import Arbiter
+from services.cache_manager import CacheManager
+from utils.distance_calculator import DistanceCalculator
+from utils.entity_decoder import decode_entity_events
+from utils.expiring_cache import ExpiringCache
+
+DEFAULT_SIZES = "10,100,1000,10000,100000"
+DEFAULT_DISPOSITIONS = ("DISPOSITION_UNKNOWN=0.6,DISPOSITION_HOSTILE=0.2,DISPOSITION_SUSPICIOUS=0.1,"
+                        "DISPOSITION_FRIENDLY=0.1")
+# centre of the synthetic area, next to the simulated asset and track defaults
+ORIGIN_LATITUDE = 1.0
+ORIGIN_LONGITUDE = 1.0
+# standard deviation of the position change of a moved entity per tick, about 0.07 miles
+MOVE_DEGREES = 0.001
+EXPIRY_OFFSET = 3600
+PERCENTILES = (50, 90, 99)
+
+
+class Population:
+    def __init__(self, size: int, asset_fraction: float, density: float, dispositions: dict, seed: int):
+        """
+        A synthetic picture of assets and tracks spread uniformly over a square centred on the origin, sized so the
+        entities have the requested density. Track dispositions are drawn from the given mix.
+
+        Args:
+            size (int): The total number of entities.
+            asset_fraction (float): The fraction of the entities that are assets.
+            density (float): The number of entities per square degree.
+            dispositions (dict): The track dispositions mapped to their relative weight.
+            seed (int): The random seed, the same seed always generates the same population and moves.
+        """
+        self.rng = random.Random(seed)
+        self.asset_count = min(max(1, round(size * asset_fraction)), size - 1) if size > 1 else size
+        self.track_count = size - self.asset_count
+        half_side = math.sqrt(size / density) / 2
+        self.entity_ids = [f"asset-{index}" for index in range(self.asset_count)] + \
+                          [f"track-{index}" for index in range(self.track_count)]
+        self.templates = ["TEMPLATE_ASSET"] * self.asset_count + ["TEMPLATE_TRACK"] * self.track_count
+        self.latitudes = [ORIGIN_LATITUDE + self.rng.uniform(-half_side, half_side) for _ in range(size)]
+        self.longitudes = [ORIGIN_LONGITUDE + self.rng.uniform(-half_side, half_side) for _ in range(size)]
+        self.dispositions = ["DISPOSITION_FRIENDLY"] * self.asset_count + \
+                            self.rng.choices(list(dispositions), weights=list(dispositions.values()),
+                                             k=self.track_count)
+        self.speeds = [self.rng.uniform(0, 20) for _ in range(size)]
+        self.headings = [self.rng.uniform(0, 2 * math.pi) for _ in range(size)]
+
+    def __len__(self):
+        return len(self.entity_ids)
+
+    def entity(self, index: int) -> anduril_entities.Entity:
+        return anduril_entities.Entity(
+            entity_id=self.entity_ids[index],
+            is_live=True,
+            expiry_time=datetime.now(timezone.utc) + timedelta(seconds=EXPIRY_OFFSET),
+            location=anduril_entities.Location(
+                position=anduril_entities.Position(
+                    latitudeDegrees=self.latitudes[index],
+                    longitudeDegrees=self.longitudes[index],
+                    altitudeHaeMeters=0
+                ),
+                speedMps=self.speeds[index],
+                velocityEnu=anduril_entities.ENU(
+                    e=self.speeds[index] * math.sin(self.headings[index]),
+                    n=self.speeds[index] * math.cos(self.headings[index]),
+                    u=0
+                )
+            ),
+            mil_view=anduril_entities.MilView(
+                disposition=self.dispositions[index],
+                environment="ENVIRONMENT_SURFACE",
+            ),
+            provenance=anduril_entities.Provenance(
+                data_type="Benchmark",
+                integration_name="auto-reconnaissance-benchmark",
+                source_update_time=datetime.now(timezone.utc),
+            ),
+            ontology=anduril_entities.Ontology(
+                template=self.templates[index],
+                platform_type="USV" if self.templates[index] == "TEMPLATE_ASSET" else "UNKNOWN"
+            )
+        )
+
+    def entity_json(self, index: int) -> dict:
+        """
+        The entity as the Lattice JSON API serializes it, with camelCase field names.
+        """
+        now = datetime.now(timezone.utc)
+        return {
+            "entityId": self.entity_ids[index],
+            "isLive": True,
+            "expiryTime": (now + timedelta(seconds=EXPIRY_OFFSET)).isoformat(),
+            "location": {
+                "position": {"latitudeDegrees": self.latitudes[index], "longitudeDegrees": self.longitudes[index],
+                             "altitudeHaeMeters": 0},
+                "speedMps": self.speeds[index],
+                "velocityEnu": {"e": self.speeds[index] * math.sin(self.headings[index]),
+                                "n": self.speeds[index] * math.cos(self.headings[index]), "u": 0},
+            },
+            "milView": {"disposition": self.dispositions[index], "environment": "ENVIRONMENT_SURFACE"},
+            "provenance": {"dataType": "Benchmark", "integrationName": "auto-reconnaissance-benchmark",
+                           "sourceUpdateTime": now.isoformat()},
+            "ontology": {"template": self.templates[index],
+                         "platformType": "USV" if self.templates[index] == "TEMPLATE_ASSET" else "UNKNOWN"},
+        }
+
+    def entities(self) -> list:
+        return [self.entity(index) for index in range(len(self))]
+
+    def move_indices(self, fraction: float) -> list:
+        """
+        Move a random sample of the entities and return their indices.
+        """
+        count = max(1, round(len(self) * fraction))
+        indices = self.rng.sample(range(len(self)), min(count, len(self)))
+        for index in indices:
+            self.latitudes[index] += self.rng.gauss(0, MOVE_DEGREES)
+            self.longitudes[index] += self.rng.gauss(0, MOVE_DEGREES)
+        return indices
+
+    def move(self, fraction: float) -> list:
+        """
+        Move a random sample of the entities and return their updated entities.
+        """
+        return [self.entity(index) for index in self.move_indices(fraction)]
+
+
+class StubOverrideManager:
+    def __init__(self):
+        self.forgotten = 0
+
+    def forget(self, entity_id: str):
+        self.forgotten += 1
+
+
+class StubEntityHandler:
+    def __init__(self):
+        """
+        Stands in for the entity handler so arbitration runs without the Entities API, it only counts calls.
+        """
+        self.override_manager = StubOverrideManager()
+        self.overrides = 0
+
+    def override_track_disposition(self, track):
+        self.overrides += 1
+
+
+class StubTasker:
+    def __init__(self):
+        """
+        Stands in for the tasker so arbitration runs without the Tasks API, every task stays executing.
+        """
+        self.tasks = 0
+
+    def is_reserved(self, entity_id: str) -> bool:
+        return False
+
+    def idempotency_key(self, asset_id: str, track_id: str) -> str:
+        return f"task-{asset_id}-{track_id}"
+
+    def submit(self, asset, track, on_done, task_id: str = None) -> bool:
+        self.tasks += 1
+        on_done(asset, track, task_id or f"task-{self.tasks}")
+        return True
+
+    async def get_task_status(self, task_id: str) -> str:
+        return "STATUS_EXECUTING"
+
+
+def bench_handle_response(population: Population, args):
+    cache_manager = CacheManager(len(population), len(population))
+    for entity in population.entities():
+        cache_manager.handle_response(entity)
+
+    def prepare():
+        return population.move(args.update_fraction)
+
+    def step(entities):
+        for entity in entities:
+            cache_manager.handle_response(entity)
+
+    return prepare, step
+
+
+def bench_decode_events(population: Population, args):
+    """
+    Decode long poll response bodies of the moved entities into records, the work the stream does per poll.
+    """
+    def prepare():
+        events = [{"eventType": "EVENT_TYPE_UPDATE", "entity": population.entity_json(index)}
+                  for index in population.move_indices(args.update_fraction)]
+        return json.dumps({"sessionToken": "benchmark", "entityEvents": events}).encode()
+
+    def step(payload):
+        decode_entity_events(payload)
+
+    return prepare, step
+
+
+def bench_arbitrate_isr(population: Population, args):
+    logger = logging.getLogger("EARS-BENCHMARK")
+    arbiter = Arbiter(logger, "localhost", "benchmark", max_assets=len(population), max_tracks=len(population))
+    arbiter.entity_handler = StubEntityHandler()
+    arbiter.tasker = StubTasker()
+    arbiter.task_monitor.tasker = arbiter.tasker
+    for entity in population.entities():
+        arbiter.cache_manager.handle_response(entity)
+    loop = asyncio.new_event_loop()
+    # the first pass evaluates the whole picture, ticks measure the steady state after it
+    loop.run_until_complete(arbiter.arbitrate_isr())
+
+    def prepare():
+        for entity in population.move(args.update_fraction):
+            arbiter.cache_manager.handle_response(entity)
+
+    def step(_):
+        loop.run_until_complete(arbiter.arbitrate_isr())
+
+    return prepare, step
+
+
+def bench_expiring_cache(population: Population, args):
+    cache = ExpiringCache(len(population))
+    now = time.time()
+    for entity_id in population.entity_ids:
+        cache.put(entity_id, entity_id, now + population.rng.uniform(0, EXPIRY_OFFSET))
+
+    def prepare():
+        count = max(1, round(len(population) * args.update_fraction))
+        return population.rng.sample(population.entity_ids, min(count, len(population)))
+
+    def step(entity_ids):
+        now = time.time()
+        for entity_id in entity_ids:
+            cache.get(entity_id)
+            cache.put(entity_id, entity_id, now + EXPIRY_OFFSET)
+        cache.expire(now)
+
+    return prepare, step
+
+
+def distance_pairs(population: Population) -> list:
+    assets = range(population.asset_count)
+    tracks = [population.rng.randrange(population.asset_count, len(population)) for _ in assets]
+    return list(zip(assets, tracks))
+
+
+def bench_distance_calculate(population: Population, args):
+    pairs = [(population.entity(asset), population.entity(track)) for asset, track in distance_pairs(population)]
+
+    def prepare():
+        return pairs
+
+    def step(pairs):
+        for asset, track in pairs:
+            DistanceCalculator.calculate(asset, track)
+
+    return prepare, step
+
+
+def bench_distance_within_threshold(population: Population, args):
+    pairs = distance_pairs(population)
+    asset_indices = np.array([asset for asset, _ in pairs], dtype=np.intp)
+    track_indices = np.array([track for _, track in pairs], dtype=np.intp)
+    latitudes = np.asarray(population.latitudes)
+    longitudes = np.asarray(population.longitudes)
+
+    def prepare():
+        return None
+
+    def step(_):
+        DistanceCalculator.within_threshold(latitudes[asset_indices], longitudes[asset_indices],
+                                            latitudes[track_indices], longitudes[track_indices], 5)
+
+    return prepare, step
+
+
+BENCHMARKS = {
+    "handle_response": bench_handle_response,
+    "decode_events": bench_decode_events,
+    "arbitrate_isr": bench_arbitrate_isr,
+    "expiring_cache": bench_expiring_cache,
+    "distance_calculate": bench_distance_calculate,
+    "distance_within_threshold": bench_distance_within_threshold,
+}
+
+
+def run_benchmark(name: str, size: int, dispositions: dict, args) -> dict:
+    """
+    Run one benchmark at one population size. A traced pass measures the memory of the setup and the allocations
+    of a few ticks, then an untraced pass measures the tick latency, so tracing does not skew the timings.
+
+    Returns:
+        dict: The latency percentiles, allocations and peak memory of the benchmark.
+    """
+    population = Population(size, args.asset_fraction, args.density, dispositions, args.seed)
+    tracemalloc.start()
+    prepare, step = BENCHMARKS[name](population, args)
+    setup_bytes, setup_peak_bytes = tracemalloc.get_traced_memory()
+    allocated = []
+    for _ in range(args.memory_ticks):
+        payload = prepare()
+        before, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        step(payload)
+        after, peak = tracemalloc.get_traced_memory()
+        allocated.append(peak - before)
+    retained_bytes, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = []
+    for _ in range(args.ticks):
+        payload = prepare()
+        start = time.perf_counter()
+        step(payload)
+        latencies.append((time.perf_counter() - start) * 1000)
+    latency = {f"p{percentile}": value for percentile, value in zip(PERCENTILES,
+                                                                    np.percentile(latencies, PERCENTILES).tolist())}
+    latency.update(mean=float(np.mean(latencies)), max=float(np.max(latencies)))
+    return {
+        "benchmark": name,
+        "size": size,
+        "assets": population.asset_count,
+        "tracks": population.track_count,
+        "ticks": args.ticks,
+        "latency_ms": latency,
+        "allocated_bytes_per_tick": {"mean": float(np.mean(allocated)) if allocated else None,
+                                     "max": int(max(allocated)) if allocated else None},
+        "setup_bytes": setup_bytes,
+        "retained_bytes": retained_bytes,
+        "peak_bytes": max(peak_bytes, setup_peak_bytes),
+    }
+
+
+def parse_dispositions(value: str) -> dict:
+    dispositions = {}
+    for item in value.split(","):
+        disposition, weight = item.split("=")
+        dispositions[disposition.strip()] = float(weight)
+    return dispositions
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Entity Recon System Benchmarks')
+    parser.add_argument('--benchmarks', type=str, default=",".join(BENCHMARKS),
+                        help='Comma separated benchmarks to run')
+    parser.add_argument('--sizes', type=str, default=DEFAULT_SIZES, help='Comma separated total entity counts')
+    parser.add_argument('--asset-fraction', type=float, default=0.1, help='Fraction of the entities that are assets')
+    parser.add_argument('--density', type=float, default=1000, help='Entities per square degree')
+    parser.add_argument('--dispositions', type=str, default=DEFAULT_DISPOSITIONS,
+                        help='Comma separated DISPOSITION=weight mix of the track dispositions')
+    parser.add_argument('--update-fraction', type=float, default=0.1,
+                        help='Fraction of the entities updated per tick')
+    parser.add_argument('--ticks', type=int, default=20, help='Timed ticks per benchmark and size')
+    parser.add_argument('--memory-ticks', type=int, default=3, help='Traced ticks measuring allocations')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed of the synthetic population')
+    parser.add_argument('--output', type=str, help='Path of the JSON report, defaults to stdout')
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig()
+    logger = logging.getLogger("EARS-BENCHMARK")
+    logger.setLevel(logging.WARNING)
+    args = parse_arguments()
+    dispositions = parse_dispositions(args.dispositions)
+    names = [name.strip() for name in args.benchmarks.split(",")]
+    for name in names:
+        if name not in BENCHMARKS:
+            raise ValueError(f"unknown benchmark {name}, expected one of {', '.join(BENCHMARKS)}")
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    results = []
+    for name in names:
+        for size in sizes:
+            print(f"running {name} with {size} entities", file=sys.stderr)
+            results.append(run_benchmark(name, size, dispositions, args))
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": vars(args),
+        "max_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,18 @@ from asyncio import run
 import yaml
 
 from services.arbiter import Arbiter
+from services.assignment import ASSIGNMENT_TIME_BUDGET_SECONDS
+from services.cache_manager import MAX_CACHED_ASSETS, MAX_CACHED_TRACKS
+from services.ingest_queue import INGEST_QUEUE_SIZE, INGEST_BATCH_SIZE
+from services.kinetic_scheduler import PREDICTION_HORIZON_SECONDS, MAX_PEER_SPEED_MPS
+from services.partition_manager import PARTITION_COUNT, LEASE_TTL_SECONDS
+from services.sweep_scheduler import RECON_INTERVAL_SECONDS, RECON_MIN_INTERVAL_SECONDS, RECON_MAX_INTERVAL_SECONDS
+from services.tasker import MAX_TASK_CREATIONS_IN_FLIGHT
+from utils.engagement_rules import EngagementRules
+from utils.snapshot_store import SNAPSHOT_INTERVAL_SECONDS, SNAPSHOT_RESTORE_TTL_SECONDS
+from utils.lattice_executor import DEFAULT_LATTICE_SCHEME, DEFAULT_MAX_WORKERS, DEFAULT_TIMEOUT_SECONDS
+from utils.tracing import (TRACER, FlightRecorder, TRACE_BUFFER_SIZE, TRACE_DUMP_DIR, SLOW_TICK_SECONDS,
+                           PROFILE_SECONDS)
 
 
 def validate_config(cfg):
@@ -33,8 +45,42 @@ async def main_async(cfg):
     logger.setLevel(logging.DEBUG)
     logger.info("starting entity auto reconnaissance system")
     try:
+        TRACER.configure(cfg.get("tracing-buffer-size", TRACE_BUFFER_SIZE), cfg.get("tracing-enabled", False))
+        profile_seconds = cfg.get("profile-seconds", PROFILE_SECONDS)
+        # the recorder writes the trace buffer and profiles, with neither enabled it has nothing to write
+        flight_recorder = None
+        if TRACER.enabled or profile_seconds > 0:
+            flight_recorder = FlightRecorder(logger, TRACER, cfg.get("trace-dump-dir", TRACE_DUMP_DIR),
+                                             cfg.get("slow-tick-seconds", SLOW_TICK_SECONDS), profile_seconds)
         # Set up the application with the config
-        arbiter = Arbiter(logger, cfg["lattice-ip"], cfg["lattice-bearer-token"])
+        arbiter = Arbiter(logger, cfg["lattice-ip"], cfg["lattice-bearer-token"],
+                          io_workers=cfg.get("lattice-max-connections", DEFAULT_MAX_WORKERS),
+                          io_timeout_seconds=cfg.get("lattice-timeout-seconds", DEFAULT_TIMEOUT_SECONDS),
+                          max_assets=cfg.get("max-cached-assets", MAX_CACHED_ASSETS),
+                          max_tracks=cfg.get("max-cached-tracks", MAX_CACHED_TRACKS),
+                          arbitration_workers=cfg.get("arbitration-workers", 0),
+                          assignment_time_budget_seconds=cfg.get("assignment-time-budget-ms",
+                                                                 ASSIGNMENT_TIME_BUDGET_SECONDS * 1000) / 1000,
+                          lattice_scheme=cfg.get("lattice-scheme", DEFAULT_LATTICE_SCHEME),
+                          metrics_port=cfg.get("metrics-port"),
+                          flight_recorder=flight_recorder,
+                          ingest_queue_size=cfg.get("ingest-queue-size", INGEST_QUEUE_SIZE),
+                          ingest_batch_size=cfg.get("ingest-batch-size", INGEST_BATCH_SIZE),
+                          task_creations_in_flight=cfg.get("task-creations-in-flight", MAX_TASK_CREATIONS_IN_FLIGHT),
+                          snapshot_path=cfg.get("snapshot-path"),
+                          snapshot_interval_seconds=cfg.get("snapshot-interval-seconds", SNAPSHOT_INTERVAL_SECONDS),
+                          snapshot_restore_ttl_seconds=cfg.get("snapshot-restore-ttl-seconds",
+                                                               SNAPSHOT_RESTORE_TTL_SECONDS),
+                          prediction_horizon_seconds=cfg.get("prediction-horizon-seconds", PREDICTION_HORIZON_SECONDS),
+                          max_peer_speed_mps=cfg.get("prediction-max-speed-mps", MAX_PEER_SPEED_MPS),
+                          recon_interval_seconds=cfg.get("recon-interval-seconds", RECON_INTERVAL_SECONDS),
+                          recon_min_interval_seconds=cfg.get("recon-min-interval-seconds", RECON_MIN_INTERVAL_SECONDS),
+                          recon_max_interval_seconds=cfg.get("recon-max-interval-seconds", RECON_MAX_INTERVAL_SECONDS),
+                          engagement_rules=EngagementRules.from_config(cfg.get("engagement-rules")),
+                          lease_store_path=cfg.get("lease-store-path"),
+                          instance_id=cfg.get("instance-id"),
+                          partitions=cfg.get("partitions", PARTITION_COUNT),
+                          lease_ttl_seconds=cfg.get("lease-ttl-seconds", LEASE_TTL_SECONDS))
         await arbiter.start()
     except (KeyboardInterrupt, SystemExit):
         logger.info("shutting down entity auto reconnaissance system")
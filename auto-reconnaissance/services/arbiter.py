@@ -1,27 +1,118 @@
 import asyncio
+import time
 from logging import Logger
 
+import numpy as np
+
 from utils.distance_calculator import DistanceCalculator
+from utils.engagement_rules import EngagementRules
+from utils.lease_store import LeaseStore
+from utils.metrics import REGISTRY, MetricsServer, measure_event_loop_lag
+from utils.snapshot_store import Snapshot, SnapshotStore, SNAPSHOT_INTERVAL_SECONDS, SNAPSHOT_RESTORE_TTL_SECONDS
+from utils.tracing import TRACER, FlightRecorder
+from utils.lattice_executor import DEFAULT_LATTICE_SCHEME, DEFAULT_MAX_WORKERS, DEFAULT_TIMEOUT_SECONDS
 
-from services.cache_manager import CacheManager
+from services.assignment import AssignmentEngine, ASSIGNMENT_TIME_BUDGET_SECONDS
+from services.cache_manager import CacheManager, MAX_CACHED_ASSETS, MAX_CACHED_TRACKS
 from services.entity_handler import EntityHandler
-from services.tasker import Tasker
+from services.ingest_queue import IngestQueue, INGEST_QUEUE_SIZE, INGEST_BATCH_SIZE
+from services.kinetic_scheduler import KineticScheduler, PREDICTION_HORIZON_SECONDS, MAX_PEER_SPEED_MPS
+from services.partition_manager import PartitionManager, PARTITION_COUNT, LEASE_TTL_SECONDS, default_instance_id
+from services.shard_pool import ShardPool
+from services.sweep_scheduler import (SweepScheduler, RECON_INTERVAL_SECONDS, RECON_MIN_INTERVAL_SECONDS,
+                                      RECON_MAX_INTERVAL_SECONDS)
+from services.task_monitor import TaskMonitor
+from services.tasker import Tasker, MAX_TASK_CREATIONS_IN_FLIGHT
+
+# tracks in range with any other disposition are overridden to suspicious
+THREAT_DISPOSITIONS = frozenset(("DISPOSITION_SUSPICIOUS", "DISPOSITION_HOSTILE"))
 
-DISTANCE_THRESHOLD_MILES = 5
+SWEEP_SECONDS = REGISTRY.histogram("ears_arbitration_sweep_seconds", "Duration of an arbitration pass.").labels()
+PAIRS_EVALUATED = REGISTRY.counter("ears_arbitration_pairs_evaluated_total",
+                                   "Asset-track candidate pairs range checked.").labels()
+PAIRS_IN_RANGE = REGISTRY.counter("ears_arbitration_pairs_in_range_total",
+                                  "Asset-track pairs found within the distance threshold.").labels()
+PAIRS_ASSIGNED = REGISTRY.counter("ears_arbitration_pairs_assigned_total",
+                                  "Asset-track pairs chosen for an investigation task.").labels()
+EVENT_LOOP_LAG = REGISTRY.histogram("ears_event_loop_lag_seconds",
+                                    "Delay of event loop wake ups behind their schedule.").labels()
 
 
 class Arbiter:
-    def __init__(self, logger: Logger, lattice_ip: str, bearer_token: str):
+    def __init__(self, logger: Logger, lattice_ip: str, bearer_token: str, io_workers: int = DEFAULT_MAX_WORKERS,
+                 io_timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS, max_assets: int = MAX_CACHED_ASSETS,
+                 max_tracks: int = MAX_CACHED_TRACKS, arbitration_workers: int = 0,
+                 assignment_time_budget_seconds: float = ASSIGNMENT_TIME_BUDGET_SECONDS,
+                 lattice_scheme: str = DEFAULT_LATTICE_SCHEME, metrics_port: int = None,
+                 flight_recorder: FlightRecorder = None, ingest_queue_size: int = INGEST_QUEUE_SIZE,
+                 ingest_batch_size: int = INGEST_BATCH_SIZE,
+                 task_creations_in_flight: int = MAX_TASK_CREATIONS_IN_FLIGHT, snapshot_path: str = None,
+                 snapshot_interval_seconds: float = SNAPSHOT_INTERVAL_SECONDS,
+                 snapshot_restore_ttl_seconds: float = SNAPSHOT_RESTORE_TTL_SECONDS,
+                 prediction_horizon_seconds: float = PREDICTION_HORIZON_SECONDS,
+                 max_peer_speed_mps: float = MAX_PEER_SPEED_MPS,
+                 recon_interval_seconds: float = RECON_INTERVAL_SECONDS,
+                 recon_min_interval_seconds: float = RECON_MIN_INTERVAL_SECONDS,
+                 recon_max_interval_seconds: float = RECON_MAX_INTERVAL_SECONDS,
+                 engagement_rules: EngagementRules = None, lease_store_path: str = None, instance_id: str = None,
+                 partitions: int = PARTITION_COUNT, lease_ttl_seconds: float = LEASE_TTL_SECONDS):
         self.logger = logger
-        self.entity_handler = EntityHandler(logger, lattice_ip, bearer_token)
-        self.cache_manager = CacheManager()
-        self.tasker = Tasker(logger, lattice_ip, bearer_token)
+        self.engagement_rules = engagement_rules or EngagementRules()
+        for rule in self.engagement_rules.describe():
+            logger.info(f"engagement rule {rule}")
+        self.entity_handler = EntityHandler(logger, lattice_ip, bearer_token, io_workers, io_timeout_seconds,
+                                            lattice_scheme)
+        self.cache_manager = CacheManager(max_assets, max_tracks, self.engagement_rules)
+        self.ingest_queue = IngestQueue(logger, self.cache_manager, ingest_queue_size, ingest_batch_size)
+        self.tasker = Tasker(logger, lattice_ip, bearer_token, io_workers, io_timeout_seconds, lattice_scheme,
+                             task_creations_in_flight)
+        self.task_monitor = TaskMonitor(logger, self.tasker, self.cache_manager)
+        # with arbitration workers the range checks of each pass are sharded across a process pool
+        self.shard_pool = ShardPool(arbitration_workers) if arbitration_workers > 0 else None
+        self.assignment_engine = AssignmentEngine(assignment_time_budget_seconds)
+        self.kinetic_scheduler = KineticScheduler(self.cache_manager, self.engagement_rules,
+                                                  prediction_horizon_seconds, max_peer_speed_mps)
+        self.sweep_scheduler = SweepScheduler(recon_interval_seconds, recon_min_interval_seconds,
+                                              recon_max_interval_seconds)
+        # the (asset, track) entity ids of the non-friendly pairs within range, kept across passes
+        self.threat_pairs = set()
+        self.metrics_server = MetricsServer(logger, metrics_port) if metrics_port else None
+        self.flight_recorder = flight_recorder
+        # with a snapshot path the cache and task mappings survive restarts
+        self.snapshot_store = SnapshotStore(snapshot_path) if snapshot_path else None
+        self.snapshot_interval_seconds = snapshot_interval_seconds
+        self.snapshot_restore_ttl_seconds = snapshot_restore_ttl_seconds
+        # with a lease store the assets are split between the instances sharing it, otherwise this one owns them all
+        self.partition_manager = None
+        if lease_store_path:
+            self.partition_manager = PartitionManager(logger, LeaseStore(lease_store_path),
+                                                      instance_id or default_instance_id(), self.cache_manager,
+                                                      self.task_monitor, self.tasker, self.task_created, partitions,
+                                                      lease_ttl_seconds)
 
     async def start(self):
+        if self.metrics_server is not None:
+            self.metrics_server.start()
+        if self.flight_recorder is not None:
+            self.flight_recorder.install_signal_handler(asyncio.get_running_loop())
+        if self.snapshot_store is not None:
+            # restore before the stream connects, so the first pass already knows the picture and the running tasks
+            self.restore_snapshot()
+        if self.partition_manager is not None:
+            # take the partitions before the first pass, so it does not arbitrate nothing
+            await self.partition_manager.sync()
         tasks = [
             asyncio.create_task(self.consume_entities()),
-            asyncio.create_task(self.recon_job())
+            asyncio.create_task(self.ingest_queue.run()),
+            asyncio.create_task(self.recon_job()),
+            asyncio.create_task(self.task_monitor.run()),
+            asyncio.create_task(self.entity_handler.override_manager.run()),
+            asyncio.create_task(measure_event_loop_lag(EVENT_LOOP_LAG))
         ]
+        if self.snapshot_store is not None:
+            tasks.append(asyncio.create_task(self.snapshot_job()))
+        if self.partition_manager is not None:
+            tasks.append(asyncio.create_task(self.partition_manager.run()))
         try:
             await asyncio.gather(*tasks, return_exceptions=True)
         except KeyboardInterrupt:
@@ -29,56 +120,247 @@ class Arbiter:
             for task in tasks:
                 task.cancel()
         finally:
+            self.entity_handler.executor.shutdown()
+            self.tasker.executor.shutdown()
+            if self.shard_pool is not None:
+                self.shard_pool.shutdown()
+            if self.metrics_server is not None:
+                self.metrics_server.stop()
+            if self.snapshot_store is not None:
+                self.save_snapshot()
+                self.snapshot_store.close()
+            if self.partition_manager is not None:
+                self.partition_manager.release()
             self.logger.info("Shutting down Entity Auto Recon System")
 
     async def consume_entities(self):
         while True:
-            async for entity in self.entity_handler.stream_entities():
-                self.cache_manager.handle_response(entity)
+            async for entity_event in self.entity_handler.stream_entities():
+                await self.ingest_queue.put(entity_event)
+                self.sweep_scheduler.wake()
+
+    def build_snapshot(self) -> Snapshot:
+        snapshot = self.cache_manager.snapshot()
+        snapshot.task_statuses = dict(self.task_monitor.statuses)
+        return snapshot
+
+    def save_snapshot(self):
+        try:
+            self.snapshot_store.save(self.build_snapshot())
+        except Exception as error:
+            self.logger.error(f"snapshot save error {error}")
+
+    def restore_snapshot(self):
+        try:
+            snapshot = self.snapshot_store.load()
+        except Exception as error:
+            self.logger.error(f"snapshot load error {error}")
+            return
+        self.cache_manager.restore(snapshot, self.snapshot_restore_ttl_seconds)
+        self.task_monitor.restore(snapshot.task_statuses)
+        self.logger.info(f"restored {len(snapshot.assets)} assets, {len(snapshot.tracks)} tracks and "
+                         f"{len(snapshot.task_statuses)} tasks from the snapshot")
+
+    async def snapshot_job(self):
+        while True:
+            await asyncio.sleep(self.snapshot_interval_seconds)
+            # the state is captured on the event loop and written on a worker thread
+            snapshot = self.build_snapshot()
+            try:
+                await asyncio.to_thread(self.snapshot_store.save, snapshot)
+            except Exception as error:
+                self.logger.error(f"snapshot save error {error}")
 
     async def recon_job(self):
         while True:
-            self.arbitrate_isr()
-            await asyncio.sleep(1)
+            # wake up early when a predicted pair comes within range before the next deadline
+            next_due = self.kinetic_scheduler.next_due()
+            started_at = await self.sweep_scheduler.wait(None if next_due is None else next_due - time.time())
+            sweep = await self.arbitrate_isr()
+            self.sweep_scheduler.finish(started_at, time.monotonic() - started_at, **sweep)
 
-    def within_range(self, asset, track) -> bool:
-        distance = DistanceCalculator.calculate(asset, track)
-        return distance <= DISTANCE_THRESHOLD_MILES
+    def owns_asset(self, asset_id: str) -> bool:
+        return self.partition_manager is None or self.partition_manager.owns(asset_id)
 
     def check_in_progress(self, asset, track) -> bool:
-        skip = False
-        asset_task_id = self.cache_manager.get_asset_tasks(asset.entity_id)
-        if asset_task_id:
-            asset_in_progress = self.tasker.check_executing(asset_task_id)
-            if asset_in_progress:
-                skip = True
-            else:
-                self.cache_manager.remove_asset_task(asset.entity_id)
-        track_task_id = self.cache_manager.get_track_tasks(track.entity_id)
-        if track_task_id:
-            track_in_progress = self.tasker.check_executing(track_task_id)
-            if track_in_progress:
-                skip = True
+        for task_id in (self.cache_manager.get_asset_tasks(asset.entity_id),
+                        self.cache_manager.get_track_tasks(track.entity_id)):
+            if task_id is not None and self.task_monitor.is_in_progress(task_id):
+                return True
+        return False
+
+    def collect_candidates(self, entity_ids: set) -> dict:
+        """
+        Gather the asset-track pairs that need to be evaluated on this pass: the pairs near an entity that changed
+        since the previous pass or whose task has finished. Pairs of entities that have not moved are skipped, so
+        the work per pass follows the update rate. The pairs of a changed entity that will come within range later
+        are handed to the kinetic scheduler. Only the assets of the partitions this instance owns are paired.
+
+        Args:
+            entity_ids (set): The ids of the entities that changed.
+
+        Returns:
+            dict: The asset entity ids mapped to the entity ids of their candidate tracks.
+        """
+        candidates = {}
+        self.kinetic_scheduler.predict(entity_ids)
+        for entity_id in entity_ids:
+            asset = self.cache_manager.get_asset(entity_id)
+            if asset is not None and self.owns_asset(entity_id):
+                candidates.setdefault(entity_id, set()).update(self.cache_manager.get_track_ids_within(
+                    asset.latitude, asset.longitude, self.engagement_rules.radius_of(asset)))
+            track = self.cache_manager.get_track(entity_id)
+            if track is not None:
+                for asset in self.cache_manager.get_assets_in_range(track.latitude, track.longitude):
+                    if self.owns_asset(asset.entity_id):
+                        candidates.setdefault(asset.entity_id, set()).add(entity_id)
+        return candidates
+
+    def evict_expired(self):
+        self.cache_manager.expire_entities()
+        removed = self.cache_manager.pop_removed_entities()
+        for entity_id in removed:
+            self.entity_handler.override_manager.forget(entity_id)
+        # an override is sent again if the disposition changes back to one that is not a threat after it went through
+        for entity_id in self.cache_manager.pop_disposition_changes():
+            self.entity_handler.override_manager.unconfirm(entity_id)
+        if removed and self.threat_pairs:
+            self.threat_pairs = {pair for pair in self.threat_pairs
+                                 if pair[0] not in removed and pair[1] not in removed}
+
+    def update_threats(self, entity_ids: set, pairs: list[tuple]):
+        """
+        Replace the threat pairs of the entities evaluated on a pass with the pairs found within range. Pairs of
+        entities that did not change are still in range, neither side has moved, and the entities of finished tasks
+        are marked dirty, so they are evaluated again. Pairs of assets in partitions this instance lost are dropped.
+
+        Args:
+            entity_ids (set): The ids of the entities evaluated on the pass.
+            pairs (list[tuple]): The (asset, track) record pairs found within range on the pass.
+        """
+        self.threat_pairs = {pair for pair in self.threat_pairs if pair[0] not in entity_ids and
+                             pair[1] not in entity_ids and self.owns_asset(pair[0])}
+        self.threat_pairs.update((asset.entity_id, track.entity_id) for asset, track in pairs)
+
+    def find_pairs_in_range(self, candidates: dict) -> list[tuple]:
+        """
+        Range check the candidate pairs of a pass in one vectorized pass. Every pair is checked against the rule of
+        its asset, the disposition and environment of the track through the rule tables and the distance against
+        the radius of the rule.
+
+        Args:
+            candidates (dict): The asset entity ids mapped to the entity ids of their candidate tracks.
+
+        Returns:
+            list[tuple]: The (asset, track) record pairs the rules engage that are within range.
+        """
+        track_store = self.cache_manager.track_store
+        assets = []
+        pair_assets = []
+        pair_rows = []
+        for asset_id, track_ids in candidates.items():
+            rows = track_store.rows_for(track_ids)
+            if len(rows):
+                pair_assets.append(np.full(len(rows), len(assets)))
+                pair_rows.append(rows)
+                assets.append(self.cache_manager.get_asset(asset_id))
+        if not pair_rows:
+            return []
+        pair_assets = np.concatenate(pair_assets)
+        pair_rows = np.concatenate(pair_rows)
+        pair_rules = self.engagement_rules.rules_of(assets)[pair_assets]
+        engaged = self.engagement_rules.engageable(pair_rules, track_store, pair_rows)
+        pair_assets, pair_rows, pair_rules = pair_assets[engaged], pair_rows[engaged], pair_rules[engaged]
+        in_range = DistanceCalculator.within_threshold(
+            np.fromiter((asset.latitude for asset in assets), dtype=np.float64, count=len(assets))[pair_assets],
+            np.fromiter((asset.longitude for asset in assets), dtype=np.float64, count=len(assets))[pair_assets],
+            track_store.latitudes[pair_rows], track_store.longitudes[pair_rows],
+            self.engagement_rules.radii_miles[pair_rules])
+        # resolve the rows right away, rows of removed tracks can be reused once the loop is suspended
+        return [(assets[asset_index], track_store.records[row])
+                for asset_index, row in zip(pair_assets[in_range].tolist(), pair_rows[in_range].tolist())]
+
+    async def arbitrate_isr(self) -> dict:
+        started_at = time.perf_counter()
+        try:
+            with TRACER.span("arbitrate_isr", "arbitration"):
+                return await self.arbitrate()
+        finally:
+            duration = time.perf_counter() - started_at
+            SWEEP_SECONDS.observe(duration)
+            if self.flight_recorder is not None:
+                self.flight_recorder.check_tick("arbitrate_isr", duration)
+
+    async def arbitrate(self) -> dict:
+        """
+        Run one arbitration pass over the entities that changed, split to the entity limit of the sweep scheduler.
+
+        Returns:
+            dict: The number of changed entities evaluated and deferred, and the number of non-friendly pairs
+            within range, including the pairs found on earlier passes whose entities have not changed since.
+        """
+        # apply what is still queued, so the pass decides on the newest state received
+        with TRACER.span("flush_ingest", "arbitration"):
+            self.ingest_queue.flush()
+        with TRACER.span("evict_expired", "arbitration"):
+            self.evict_expired()
+        with TRACER.span("collect_candidates", "arbitration"):
+            entity_ids = self.cache_manager.pop_dirty_entities(self.sweep_scheduler.entity_limit)
+            candidates = self.collect_candidates(entity_ids)
+        self.logger.info(f"# of assets being tracked: {self.cache_manager.get_asset_count()}, "
+                         f"# of tracks being tracked: {self.cache_manager.get_track_count()}, "
+                         f"# of assets to evaluate: {len(candidates)}")
+        PAIRS_EVALUATED.inc(sum(len(track_ids) for track_ids in candidates.values()))
+        with TRACER.span("find_pairs", "arbitration", args={"assets": len(candidates)}):
+            if self.shard_pool is not None:
+                assets = [self.cache_manager.get_asset(asset_id) for asset_id in candidates]
+                pairs = await self.shard_pool.find_pairs(assets, list(candidates.values()),
+                                                         self.cache_manager.track_store, self.engagement_rules)
             else:
-                self.cache_manager.remove_track_task(track.entity_id)
-        return skip
-
-    def arbitrate_isr(self):
-        assets = self.cache_manager.get_assets()
-        tracks = self.cache_manager.get_tracks()
-        self.logger.info(f"# of assets being tracked: {len(assets)}, # of tracks being tracked: {len(tracks)}")
-        for asset in assets:
-            for track in tracks:
-                if self.within_range(asset, track) and track.mil_view.disposition not in ["DISPOSITION_FRIENDLY",
-                                                                                          "DISPOSITION_ASSUMED_FRIENDLY"]:
-                    self.logger.info(f"ASSET WITHIN RANGE OF NON-FRIENDLY TRACK")
-                    if track.mil_view.disposition not in ["DISPOSITION_SUSPICIOUS", "DISPOSITION_HOSTILE"]:
-                        self.entity_handler.override_track_disposition(track)
-                    if self.check_in_progress(asset, track):
-                        self.logger.info(f"INVESTIGATION ALREADY IN PROGRESS - SKIPPING")
-                        continue
-                    if self.cache_manager.get_asset_tasks(
-                            asset.entity_id) is None and self.cache_manager.get_track_tasks(track.entity_id) is None:
-                        task_id = self.tasker.investigate(asset, track)
-                        self.cache_manager.add_asset_task(asset, task_id)
-                        self.cache_manager.add_track_task(track, task_id)
+                pairs = self.find_pairs_in_range(candidates)
+        with TRACER.span("predicted_pairs", "arbitration"):
+            # pairs predicted to have closed in since their entities last reported
+            found = {(asset.entity_id, track.entity_id) for asset, track in pairs}
+            pairs.extend(pair for pair in self.kinetic_scheduler.pop_due()
+                         if (pair[0].entity_id, pair[1].entity_id) not in found and self.owns_asset(pair[0].entity_id))
+        PAIRS_IN_RANGE.inc(len(pairs))
+        self.update_threats(entity_ids, pairs)
+        eligible = []
+        for asset, track in pairs:
+            self.logger.info(f"ASSET WITHIN RANGE OF NON-FRIENDLY TRACK")
+            if track.disposition not in THREAT_DISPOSITIONS:
+                self.entity_handler.override_track_disposition(track)
+            if self.check_in_progress(asset, track):
+                self.logger.info(f"INVESTIGATION ALREADY IN PROGRESS - SKIPPING")
+                continue
+            if self.tasker.is_reserved(asset.entity_id) or self.tasker.is_reserved(track.entity_id):
+                continue
+            if self.cache_manager.get_asset_tasks(
+                    asset.entity_id) is None and self.cache_manager.get_track_tasks(track.entity_id) is None:
+                eligible.append((asset, track))
+        # assign the pass as a whole, so an asset is not spent on the first track it happens to be paired with
+        with TRACER.span("assign", "arbitration", args={"candidates": len(eligible)}):
+            assignments = self.assignment_engine.assign(eligible)
+        # the task id is fixed before the claim, so an instance taking the claim over creates the task with the same id
+        assignments = [(asset, track, self.tasker.idempotency_key(asset.entity_id, track.entity_id))
+                       for asset, track in assignments]
+        if self.partition_manager is not None:
+            # another instance may have tasked an entity of a pair, the shared claims make sure only one does
+            with TRACER.span("claim", "arbitration", args={"pairs": len(assignments)}):
+                assignments = await self.partition_manager.claim(assignments)
+        PAIRS_ASSIGNED.inc(len(assignments))
+        # tasks are created in the background, the pairs stay reserved in the tasker until their creation completes
+        for asset, track, task_id in assignments:
+            self.tasker.submit(asset, track, self.task_created, task_id)
+        return {"evaluated": len(entity_ids), "deferred": self.cache_manager.get_deferred_count(),
+                "threats": len(self.threat_pairs)}
+
+    def task_created(self, asset, track, task_id: str):
+        if task_id is None:
+            # evaluate the pair again on the next pass
+            self.cache_manager.mark_dirty(asset.entity_id)
+            self.cache_manager.mark_dirty(track.entity_id)
+            return
+        self.task_monitor.track(task_id)
+        self.cache_manager.add_asset_task(asset, task_id)
+        self.cache_manager.add_track_task(track, task_id)
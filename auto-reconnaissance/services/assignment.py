@@ -0,0 +1,188 @@
+import heapq
+import time
+
+import numpy as np
+
+from utils.distance_calculator import DistanceCalculator
+from utils.entity_record import EntityRecord
+
+ASSIGNMENT_TIME_BUDGET_SECONDS = 0.05
+METERS_PER_MILE = 1609.344
+# assets reporting no or a very low speed are costed as if they moved at this speed
+MIN_ASSET_SPEED_MPS = 0.5
+# cost of an asset-track pair that is not a candidate, large enough that it is only chosen when unavoidable
+FORBIDDEN_COST = 1e12
+
+
+def solve_assignment(cost: np.ndarray, deadline: float = None):
+    """
+    Solve the rectangular linear assignment problem with the Hungarian algorithm in its shortest augmenting path
+    form, vectorized over the columns. Every row or every column, whichever is fewer, is assigned exactly once.
+
+    Args:
+        cost (np.ndarray): The cost matrix.
+        deadline (float): The time.perf_counter value at which the solver gives up, or None to run to completion.
+
+    Returns:
+        list[tuple]: The assigned (row, column) index pairs, or None if the deadline passed first.
+    """
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    rows, cols = cost.shape
+    u = np.zeros(rows + 1)
+    v = np.zeros(cols + 1)
+    # column_row[j] is the 1-based row assigned to the 1-based column j, 0 when the column is free
+    column_row = np.zeros(cols + 1, dtype=np.intp)
+    way = np.zeros(cols + 1, dtype=np.intp)
+    for row in range(1, rows + 1):
+        if deadline is not None and time.perf_counter() > deadline:
+            return None
+        column_row[0] = row
+        current_col = 0
+        min_reduced = np.full(cols + 1, np.inf)
+        used = np.zeros(cols + 1, dtype=bool)
+        while True:
+            used[current_col] = True
+            current_row = column_row[current_col]
+            reduced = cost[current_row - 1] - u[current_row] - v[1:]
+            free = ~used[1:]
+            better = free & (reduced < min_reduced[1:])
+            min_reduced[1:][better] = reduced[better]
+            way[1:][better] = current_col
+            masked = np.where(free, min_reduced[1:], np.inf)
+            next_col = int(np.argmin(masked)) + 1
+            delta = masked[next_col - 1]
+            used_cols = np.flatnonzero(used)
+            u[column_row[used_cols]] += delta
+            v[used_cols] -= delta
+            min_reduced[1:][free] -= delta
+            current_col = next_col
+            if column_row[current_col] == 0:
+                break
+        while current_col:
+            previous_col = way[current_col]
+            column_row[current_col] = column_row[previous_col]
+            current_col = previous_col
+    pairs = [(column_row[col] - 1, col - 1) for col in range(1, cols + 1) if column_row[col]]
+    if transposed:
+        pairs = [(col, row) for row, col in pairs]
+    return pairs
+
+
+class AssignmentEngine:
+    def __init__(self, time_budget_seconds: float = ASSIGNMENT_TIME_BUDGET_SECONDS):
+        """
+        Assigns assets to tracks from every eligible candidate pair of a sweep at once. The cost of a pair is the
+        time the asset needs to reach the track at its reported speed. The candidates are split into independent
+        groups of pairs sharing an asset or a track, each group is solved optimally with the Hungarian algorithm,
+        and once the time budget is spent the group being solved and the remaining ones fall back to a greedy
+        nearest-first assignment. Groups are processed in a fixed order and ties are broken by entity id, so the
+        result only depends on the candidates and on where the budget ran out.
+
+        Args:
+            time_budget_seconds (float): The time after which the remaining groups are assigned greedily.
+        """
+        self.time_budget_seconds = time_budget_seconds
+        self.stats = {"candidates": 0, "assigned": 0, "optimal_groups": 0, "greedy_groups": 0}
+
+    def costs(self, candidates: list[tuple]) -> np.ndarray:
+        assets = [asset for asset, _ in candidates]
+        tracks = [track for _, track in candidates]
+        distances = DistanceCalculator.haversine([asset.latitude for asset in assets],
+                                                 [asset.longitude for asset in assets],
+                                                 [track.latitude for track in tracks],
+                                                 [track.longitude for track in tracks])
+        speeds = np.fromiter((max(asset.speed_mps or 0.0, MIN_ASSET_SPEED_MPS) for asset in assets),
+                             dtype=np.float64, count=len(assets))
+        return distances * METERS_PER_MILE / speeds
+
+    def assign(self, candidates: list[tuple[EntityRecord, EntityRecord]]) -> list[tuple[EntityRecord, EntityRecord]]:
+        """
+        Choose at most one track per asset and one asset per track from the candidate pairs.
+
+        Args:
+            candidates (list[tuple]): The eligible (asset, track) pairs.
+
+        Returns:
+            list[tuple]: The assigned (asset, track) pairs ordered by asset and track entity id.
+        """
+        if not candidates:
+            return []
+        deadline = time.perf_counter() + self.time_budget_seconds
+        candidates = sorted(set(candidates), key=lambda pair: (pair[0].entity_id, pair[1].entity_id))
+        costs = self.costs(candidates)
+        assignments = []
+        for group in self.groups(candidates):
+            assigned = self.assign_optimal(candidates, costs, group, deadline)
+            if assigned is not None:
+                self.stats["optimal_groups"] += 1
+            else:
+                assigned = self.assign_greedy(candidates, costs, group)
+                self.stats["greedy_groups"] += 1
+            assignments.extend(assigned)
+        self.stats["candidates"] += len(candidates)
+        self.stats["assigned"] += len(assignments)
+        return sorted(assignments, key=lambda pair: (pair[0].entity_id, pair[1].entity_id))
+
+    @staticmethod
+    def groups(candidates: list[tuple]) -> list[list[int]]:
+        """
+        Split the candidate indices into connected groups, two candidates share a group when they share an asset or
+        a track. Groups are returned in the order of their first candidate.
+        """
+        parent = {}
+
+        def find(key):
+            while parent[key] != key:
+                parent[key] = parent[parent[key]]
+                key = parent[key]
+            return key
+
+        for asset, track in candidates:
+            asset_key, track_key = ("asset", asset.entity_id), ("track", track.entity_id)
+            parent.setdefault(asset_key, asset_key)
+            parent.setdefault(track_key, track_key)
+            asset_root, track_root = find(asset_key), find(track_key)
+            if asset_root != track_root:
+                parent[track_root] = asset_root
+        groups = {}
+        for index, (asset, _) in enumerate(candidates):
+            groups.setdefault(find(("asset", asset.entity_id)), []).append(index)
+        return list(groups.values())
+
+    @staticmethod
+    def assign_optimal(candidates: list[tuple], costs: np.ndarray, group: list[int], deadline: float):
+        if len(group) == 1:
+            return [candidates[group[0]]]
+        asset_ids = sorted({candidates[index][0].entity_id for index in group})
+        track_ids = sorted({candidates[index][1].entity_id for index in group})
+        asset_rows = {entity_id: row for row, entity_id in enumerate(asset_ids)}
+        track_cols = {entity_id: col for col, entity_id in enumerate(track_ids)}
+        matrix = np.full((len(asset_ids), len(track_ids)), FORBIDDEN_COST)
+        pair_at = {}
+        for index in group:
+            asset, track = candidates[index]
+            row, col = asset_rows[asset.entity_id], track_cols[track.entity_id]
+            matrix[row, col] = costs[index]
+            pair_at[(row, col)] = candidates[index]
+        cells = solve_assignment(matrix, deadline)
+        if cells is None:
+            return None
+        return [pair_at[cell] for cell in cells if cell in pair_at]
+
+    @staticmethod
+    def assign_greedy(candidates: list[tuple], costs: np.ndarray, group: list[int]) -> list[tuple]:
+        heap = [(costs[index], candidates[index][0].entity_id, candidates[index][1].entity_id, index)
+                for index in group]
+        heapq.heapify(heap)
+        taken_assets, taken_tracks = set(), set()
+        assignments = []
+        while heap:
+            _, asset_id, track_id, index = heapq.heappop(heap)
+            if asset_id in taken_assets or track_id in taken_tracks:
+                continue
+            taken_assets.add(asset_id)
+            taken_tracks.add(track_id)
+            assignments.append(candidates[index])
+        return assignments
@@ -1,41 +1,247 @@
+import time
+
 import entities_api as anduril_entities
-from utils.lru_cache import LRUCache
+from utils.engagement_rules import EngagementRules
+from utils.entity_record import EntityRecord, EntityRecordEvent
+from utils.expiring_cache import ExpiringCache
+from utils.metrics import REGISTRY
+from utils.snapshot_store import Snapshot
+from utils.tracing import TRACER
+from utils.spatial_index import RadiusBucketIndex, SpatialIndex
+from utils.track_store import TrackStore
+
+MAX_CACHED_ASSETS = 10000
+MAX_CACHED_TRACKS = 50000
 
 
 class CacheManager:
-    def __init__(self, capacity: int = 150):
-        self.assets = LRUCache(capacity)
-        self.tracks = LRUCache(capacity)
-        self.asset_task = LRUCache(capacity)
-        self.track_task = LRUCache(capacity)
+    def __init__(self, max_assets: int = MAX_CACHED_ASSETS, max_tracks: int = MAX_CACHED_TRACKS,
+                 engagement_rules: EngagementRules = None):
+        # entities are evicted at their expiry time, the size limits only apply when the picture outgrows them
+        self.assets = ExpiringCache(max_assets)
+        self.tracks = ExpiringCache(max_tracks)
+        # columnar copy of the cached tracks for vectorized filtering
+        self.track_store = TrackStore()
+        # task mappings are never evicted, they are cleared when the task reaches a terminal state
+        self.asset_task = {}
+        self.track_task = {}
+        self.task_entities = {}
+        self.engagement_rules = engagement_rules or EngagementRules()
+        # assets are indexed by the engagement radius of their platform type
+        self.asset_index = RadiusBucketIndex()
+        self.track_index = SpatialIndex()
+        # entity ids added or updated since the last arbitration pass
+        self.dirty_entities = set()
+        # changed entity ids a split arbitration pass left for the next one, oldest first
+        self.deferred_entities = []
+        # entity ids dropped from the cache since the last arbitration pass
+        self.removed_entities = set()
+        # entity ids of the tracks whose disposition changed since the last arbitration pass
+        self.disposition_changes = set()
+        self.register_metrics()
 
-    def add_asset(self, entity: anduril_entities.Entity):
-        entity_id = entity.entity_id
-        self.assets.put(entity_id, entity)
+    def register_metrics(self):
+        cached = REGISTRY.gauge("ears_cached_entities", "Entities held in the cache.", ("cache",))
+        evictions = REGISTRY.counter("ears_cache_evictions_total", "Entities dropped from the cache.",
+                                     ("cache", "reason"))
+        for name, cache in (("assets", self.assets), ("tracks", self.tracks)):
+            cached.labels(name).function = cache.__len__
+            for reason in cache.evictions:
+                evictions.labels(name, reason).function = lambda cache=cache, reason=reason: cache.evictions[reason]
+        REGISTRY.gauge("ears_task_mappings", "Tasks with cached asset and track mappings.",
+                       function=self.task_entities.__len__)
 
-    def add_track(self, entity: anduril_entities.Entity):
-        entity_id = entity.entity_id
-        self.tracks.put(entity_id, entity)
+    def add_asset(self, record: EntityRecord):
+        entity_id = record.entity_id
+        for evicted_id in self.assets.put(entity_id, record, record.expiry_timestamp):
+            self.asset_index.remove(evicted_id)
+            self.removed_entities.add(evicted_id)
+        self.asset_index.update(entity_id, record.latitude, record.longitude,
+                                self.engagement_rules.radius_of(record))
+        self.dirty_entities.add(entity_id)
+
+    def add_track(self, record: EntityRecord):
+        entity_id = record.entity_id
+        previous = self.tracks.get(entity_id)
+        if previous is not None and previous.disposition != record.disposition:
+            self.disposition_changes.add(entity_id)
+        for evicted_id in self.tracks.put(entity_id, record, record.expiry_timestamp):
+            self.track_index.remove(evicted_id)
+            self.track_store.remove(evicted_id)
+            self.removed_entities.add(evicted_id)
+        self.track_index.update(entity_id, record.latitude, record.longitude)
+        self.track_store.put(record)
+        self.dirty_entities.add(entity_id)
+
+    def remove_entity(self, entity_id: str):
+        if self.assets.remove(entity_id):
+            self.asset_index.remove(entity_id)
+            self.removed_entities.add(entity_id)
+        if self.tracks.remove(entity_id):
+            self.track_index.remove(entity_id)
+            self.track_store.remove(entity_id)
+            self.removed_entities.add(entity_id)
+
+    def expire_entities(self, now: float = None):
+        """
+        Evict every cached asset and track whose expiry time has passed.
+
+        Args:
+            now (float): The current unix timestamp, defaults to the current time.
+        """
+        for entity_id in self.assets.expire(now):
+            self.asset_index.remove(entity_id)
+            self.removed_entities.add(entity_id)
+        for entity_id in self.tracks.expire(now):
+            self.track_index.remove(entity_id)
+            self.track_store.remove(entity_id)
+            self.removed_entities.add(entity_id)
 
-    def add_asset_task(self, entity: anduril_entities.Entity, task_id: str):
+    def add_asset_task(self, entity: EntityRecord, task_id: str):
         entity_id = entity.entity_id
-        self.asset_task.put(entity_id, task_id)
+        self.asset_task[entity_id] = task_id
+        self.task_entities.setdefault(task_id, set()).add(entity_id)
 
-    def add_track_task(self, entity: anduril_entities.Entity, task_id: str):
+    def add_track_task(self, entity: EntityRecord, task_id: str):
         entity_id = entity.entity_id
-        self.track_task.put(entity_id, task_id)
+        self.track_task[entity_id] = task_id
+        self.task_entities.setdefault(task_id, set()).add(entity_id)
+
+    def remove_task(self, task_id: str):
+        """
+        Clear the asset and track mappings of a finished task. The entities it was assigned to are marked dirty,
+        so the next arbitration pass re-evaluates them and can task them again.
+
+        Args:
+            task_id (str): The id of the finished task.
+        """
+        for entity_id in self.task_entities.pop(task_id, ()):
+            if self.asset_task.get(entity_id) == task_id:
+                del self.asset_task[entity_id]
+            if self.track_task.get(entity_id) == task_id:
+                del self.track_task[entity_id]
+            self.dirty_entities.add(entity_id)
+
+    def get_assets(self) -> list[EntityRecord]:
+        return list(self.assets.values())
+
+    def get_asset(self, entity_id: str):
+        return self.assets.get(entity_id)
+
+    def get_track(self, entity_id: str):
+        return self.tracks.get(entity_id)
+
+    def get_asset_count(self) -> int:
+        return len(self.asset_index)
+
+    def get_track_count(self) -> int:
+        return len(self.track_index)
 
-    def remove_asset_task(self, entity_id: str):
-        self.asset_task.remove(entity_id)
+    def get_assets_in_range(self, latitude: float, longitude: float, margin_miles: float = 0.0) -> list[EntityRecord]:
+        """
+        Look up the assets whose engagement radius may reach a point. Like get_track_ids_within the result can
+        contain assets slightly out of range, so callers still need an exact distance check.
 
-    def remove_track_task(self, entity_id: str):
-        self.track_task.remove(entity_id)
+        Args:
+            latitude (float): The latitude of the point in degrees.
+            longitude (float): The longitude of the point in degrees.
+            margin_miles (float): The distance in miles added to the radius of every asset.
 
-    def get_assets(self) -> list[anduril_entities.Entity]:
-        return self.assets.get_all()
+        Returns:
+            list[EntityRecord]: The candidate assets.
+        """
+        candidate_ids = self.asset_index.query(latitude, longitude, margin_miles)
+        return [self.assets.get(entity_id) for entity_id in candidate_ids]
 
-    def get_tracks(self) -> list[anduril_entities.Entity]:
-        return self.tracks.get_all()
+    def get_track_ids_within(self, latitude: float, longitude: float, radius_miles: float) -> list[str]:
+        """
+        Look up the tracks that may lie within a radius of a point using the track spatial index. The result can
+        contain tracks slightly outside the radius, so callers still need an exact distance check.
+
+        Args:
+            latitude (float): The latitude of the point in degrees.
+            longitude (float): The longitude of the point in degrees.
+            radius_miles (float): The search radius in miles.
+
+        Returns:
+            list[str]: The entity ids of the candidate tracks.
+        """
+        return self.track_index.query(latitude, longitude, radius_miles)
+
+    def mark_dirty(self, entity_id: str):
+        self.dirty_entities.add(entity_id)
+
+    def pop_dirty_entities(self, limit: int = None) -> set:
+        """
+        Hand the ids of the entities that changed since the previous call to the caller and start a new dirty set.
+        Ids of entities evicted in the meantime are included, callers should skip ids they can no longer look up.
+        With a limit the ids beyond it are deferred, and deferred ids are handed out before newer ones.
+
+        Args:
+            limit (int): The maximum number of ids to hand out, None for all of them.
+
+        Returns:
+            set: The entity ids added or updated since the previous call.
+        """
+        dirty_entities = self.dirty_entities
+        self.dirty_entities = set()
+        if self.deferred_entities:
+            dirty_entities.difference_update(self.deferred_entities)
+            ordered = self.deferred_entities + list(dirty_entities)
+            self.deferred_entities = []
+        elif limit is None or len(dirty_entities) <= limit:
+            return dirty_entities
+        else:
+            ordered = list(dirty_entities)
+        if limit is not None and len(ordered) > limit:
+            self.deferred_entities = ordered[limit:]
+            ordered = ordered[:limit]
+        return set(ordered)
+
+    def get_deferred_count(self) -> int:
+        return len(self.deferred_entities)
+
+    def pop_removed_entities(self) -> set:
+        removed_entities = self.removed_entities
+        self.removed_entities = set()
+        return removed_entities
+
+    def pop_disposition_changes(self) -> set:
+        disposition_changes = self.disposition_changes
+        self.disposition_changes = set()
+        return disposition_changes
+
+    def snapshot(self) -> Snapshot:
+        """
+        Capture the cached records and task mappings. Records are replaced rather than modified on update, so the
+        snapshot can be serialized off the event loop while the cache keeps changing.
+        """
+        return Snapshot(assets=list(self.assets.values()), tracks=list(self.tracks.values()),
+                        asset_tasks=dict(self.asset_task), track_tasks=dict(self.track_task))
+
+    def restore(self, snapshot: Snapshot, ttl_seconds: float = None):
+        """
+        Load the records and task mappings of a snapshot. Records that have expired are skipped, the restored
+        entities are marked dirty so the first arbitration pass evaluates them.
+
+        Args:
+            snapshot (Snapshot): The snapshot to load.
+            ttl_seconds (float): How long the restored records are kept unless they are received again, None to keep
+                them until their own expiry.
+        """
+        now = time.time()
+        for records, add in ((snapshot.assets, self.add_asset), (snapshot.tracks, self.add_track)):
+            for record in records:
+                if record.expiry_timestamp is not None and record.expiry_timestamp <= now:
+                    continue
+                if ttl_seconds is not None:
+                    # the entity may have been deleted while the snapshot was on disk, a fresh record replaces this one
+                    record.expiry_timestamp = min(record.expiry_timestamp or float("inf"), now + ttl_seconds)
+                add(record)
+        for mappings, tasks in ((self.asset_task, snapshot.asset_tasks), (self.track_task, snapshot.track_tasks)):
+            for entity_id, task_id in tasks.items():
+                mappings[entity_id] = task_id
+                self.task_entities.setdefault(task_id, set()).add(entity_id)
 
     def get_asset_tasks(self, entity_id: str):
         return self.asset_task.get(entity_id)
@@ -43,11 +249,28 @@ class CacheManager:
     def get_track_tasks(self, entity_id: str):
         return self.track_task.get(entity_id)
 
+    def handle_event(self, entity_event: EntityRecordEvent):
+        with TRACER.span("handle_event", "ingest"):
+            if entity_event.record is None:
+                self.remove_entity(entity_event.entity_id)
+            else:
+                self.handle_record(entity_event.record)
+
     def handle_response(self, entity: anduril_entities.Entity):
-        ontology_template = entity.ontology.template
-        mil_view_disposition = entity.mil_view.disposition
-        if ontology_template == "TEMPLATE_ASSET":
-            self.add_asset(entity)
-        elif (ontology_template == "TEMPLATE_TRACK" and
-              mil_view_disposition != "DISPOSITION_FRIENDLY"):
-            self.add_track(entity)
+        if entity.is_live is False:
+            self.remove_entity(entity.entity_id)
+            return
+        self.handle_record(EntityRecord.from_entity(entity))
+
+    def handle_record(self, record: EntityRecord):
+        if record.expiry_timestamp is not None and record.expiry_timestamp <= time.time():
+            self.remove_entity(record.entity_id)
+            return
+        if record.template == "TEMPLATE_ASSET":
+            self.add_asset(record)
+        elif record.template == "TEMPLATE_TRACK":
+            if record.disposition == "DISPOSITION_FRIENDLY":
+                # a cached track that turned friendly must not stay engageable
+                self.remove_entity(record.entity_id)
+            else:
+                self.add_track(record)
@@ -3,70 +3,145 @@ from datetime import datetime, timezone
 from logging import Logger
 
 import entities_api as anduril_entities
+from utils.backoff import Backoff
+from utils.entity_decoder import decode_entity_events, read_payload
+from utils.entity_record import EntityRecord
+from utils.metrics import REGISTRY
+from utils.lattice_executor import LatticeExecutor, DEFAULT_LATTICE_SCHEME, DEFAULT_MAX_WORKERS, DEFAULT_TIMEOUT_SECONDS
+
+from services.override_manager import OverrideManager
+
+LONG_POLL_TIMEOUT_SECONDS = 60
+# delay before polling again after a poll that returned no events
+STREAM_IDLE_POLL_SECONDS = 0.1
+STREAM_BACKOFF_BASE_SECONDS = 0.1
+STREAM_BACKOFF_MAX_SECONDS = 30
+# consecutive failed polls after which the session token is dropped and a new session is started
+STREAM_MAX_RESUME_ATTEMPTS = 5
+# http statuses the server answers with when it no longer accepts a session token
+SESSION_REJECTED_STATUSES = frozenset([400, 404, 410])
+
+
+class StreamStats:
+    def __init__(self):
+        self.polls = 0
+        self.events = 0
+        self.errors = 0
+        self.gaps = 0
+        self.replays = 0
+        self.replayed_events = 0
+
+
+def session_rejected(error: Exception) -> bool:
+    return getattr(error, "status", None) in SESSION_REJECTED_STATUSES
+
+
+def retry_after_seconds(error: Exception):
+    headers = getattr(error, "headers", None)
+    if not headers:
+        return None
+    try:
+        return max(float(headers.get("Retry-After")), 0)
+    except (TypeError, ValueError):
+        return None
 
 
 class EntityHandler:
-    def __init__(self, logger: Logger, lattice_ip: str, bearer_token: str):
+    def __init__(self, logger: Logger, lattice_ip: str, bearer_token: str, max_workers: int = DEFAULT_MAX_WORKERS,
+                 timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS, lattice_scheme: str = DEFAULT_LATTICE_SCHEME):
         self.logger = logger
-        self.config = anduril_entities.Configuration(host=f"https://{lattice_ip}/api/v1")
+        self.executor = LatticeExecutor("entities-api", max_workers, timeout_seconds)
+        self.config = self.executor.configure(anduril_entities.Configuration(
+            host=f"{lattice_scheme}://{lattice_ip}/api/v1"))
         self.api_client = anduril_entities.ApiClient(configuration=self.config, header_name="Authorization",
                                                      header_value=f"Bearer {bearer_token}")
         self.entity_api = anduril_entities.EntityApi(api_client=self.api_client)
+        self.override_manager = OverrideManager(logger, self.put_disposition_override)
+        self.stream_stats = StreamStats()
+        stats = self.stream_stats
+        REGISTRY.counter("ears_stream_polls_total", "Entity event long polls completed.", function=lambda: stats.polls)
+        REGISTRY.counter("ears_stream_events_total", "Entity events received from the stream.",
+                         function=lambda: stats.events)
+        REGISTRY.counter("ears_stream_errors_total", "Entity event long polls that failed.",
+                         function=lambda: stats.errors)
+        REGISTRY.counter("ears_stream_gaps_total", "Stream sessions lost and restarted from a snapshot.",
+                         function=lambda: stats.gaps)
+        REGISTRY.counter("ears_stream_replays_total", "Stream sessions restarted with a full snapshot replay.",
+                         function=lambda: stats.replays)
+        REGISTRY.counter("ears_stream_replayed_events_total", "Entity events replayed by restarted sessions.",
+                         function=lambda: stats.replayed_events)
+
+    async def stream_entities(self):
+        """
+        Long poll the entity events of one stream session and yield the delete events and the events whose entity
+        satisfies the filter. The response body is decoded straight into records without building the SDK models.
+        The session token returned by each poll is sent with the next one, so after a transient error the stream
+        resumes where it left off instead of replaying a full snapshot. The session is only dropped when the server
+        rejects it or it cannot be resumed after several attempts, which is counted as a gap.
+        """
+        session_token = ""
+        had_session = False
+        backoff = Backoff(base_seconds=STREAM_BACKOFF_BASE_SECONDS, max_seconds=STREAM_BACKOFF_MAX_SECONDS)
+        while True:
+            entity_event_request = anduril_entities.EntityEventRequest(sessionToken=session_token)
+            try:
+                response = await self.executor.call(self.entity_api.long_poll_entity_events_without_preload_content,
+                                                    entity_event_request, timeout_seconds=LONG_POLL_TIMEOUT_SECONDS)
+                response_session_token, entity_events, event_count = decode_entity_events(read_payload(response))
+            except Exception as error:
+                self.stream_stats.errors += 1
+                if session_token and (session_rejected(error) or backoff.attempts >= STREAM_MAX_RESUME_ATTEMPTS):
+                    self.logger.warning("lattice entity stream session lost, starting a new session")
+                    session_token = ""
+                    self.stream_stats.gaps += 1
+                # every failed poll counts as an attempt, a server asking to retry later still ends a dead session
+                delay = max(retry_after_seconds(error) or 0.0, backoff.next_delay())
+                self.logger.error(f"lattice api stream entities error {error}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            backoff.reset()
+            if not session_token and had_session:
+                self.stream_stats.replays += 1
+                self.stream_stats.replayed_events += event_count
+            if response_session_token:
+                session_token = response_session_token
+                had_session = True
+            self.stream_stats.polls += 1
+            self.stream_stats.events += event_count
+            for entity_event in entity_events:
+                yield entity_event
+            if not event_count:
+                await asyncio.sleep(STREAM_IDLE_POLL_SECONDS)
 
-    def filter_entity(self, entity: anduril_entities.Entity) -> bool:
+    def override_track_disposition(self, track: EntityRecord) -> bool:
         """
-        The statement returned basically filters for 1) an entity with the ontology.template field set to ASSET, or 2) an entity with the ontology.template field set to TRACK and their mil_view.disposition field set to HOSTILE or SUSPICIOUS.
-        
+        Request a suspicious disposition override for a track. The override is queued and sent in the background,
+        and tracks that already have a pending or confirmed override are not sent again.
+
         Args:
-            entity: the entity to check if it satisfies the filter
+            track: the track to mark as suspicious
 
         Returns:
-            bool: True if the entity satisfies the filter, False otherwise.
-
-        Raises:
-            None
+            bool: True if a new override was queued, False otherwise.
         """
-        ontology_template = entity.ontology.template
-        mil_view_disposition = entity.mil_view.disposition
-        if ontology_template == "TEMPLATE_ASSET":
-            return True
-        elif (ontology_template == "TEMPLATE_TRACK" and
-              mil_view_disposition != "DISPOSITION_FRIENDLY"):
-            return True
-        else:
-            return False
+        return self.override_manager.request(track)
 
-    async def stream_entities(self):
-        entity_event_request = anduril_entities.EntityEventRequest(sessionToken="")
-        while True:
-            try:
-                response = self.entity_api.long_poll_entity_events(entity_event_request)
-                if response.entity_events:
-                    for entity_event in response.entity_events:
-                        entity = entity_event.entity
-                        if self.filter_entity(entity):
-                            yield entity
-                await asyncio.sleep(0.1)
-            except Exception as error:
-                self.logger.error(f"lattice api stream entities error {error}")
-                await asyncio.sleep(30)
-
-    def override_track_disposition(self, track: anduril_entities.Entity):
-        try:
-            self.logger.info(f"overriding disposition for track {track.entity_id}")
-            entity_id = track.entity_id
-            override_track_entity = track
-            override_track_entity.mil_view.disposition = "DISPOSITION_SUSPICIOUS"
-            override_provenance = anduril_entities.Provenance(integration_name=track.provenance.integration_name,
-                                                              data_type=track.provenance.data_type,
-                                                              source_id=track.provenance.source_id,
-                                                              source_update_time=datetime.now(timezone.utc),
-                                                              source_description=track.provenance.source_description, )
-            entity_override = anduril_entities.EntityOverride(entity=override_track_entity,
-                                                              provenance=override_provenance)
-            self.entity_api.put_entity_override_rest(entity_id=entity_id,
-                                                     field_path="mil_view.disposition",
-                                                     entity_override=entity_override)
-            return
-        except Exception as error:
-            self.logger.error(f"lattice api stream entities error {error}")
+    async def put_disposition_override(self, track: EntityRecord):
+        self.logger.info(f"overriding disposition for track {track.entity_id}")
+        # the service only reads the overridden field, so a fresh entity is sent instead of the cached one
+        override_track_entity = anduril_entities.Entity(
+            entity_id=track.entity_id,
+            mil_view=anduril_entities.MilView(disposition="DISPOSITION_SUSPICIOUS",
+                                              environment=track.environment))
+        override_provenance = anduril_entities.Provenance(integration_name=track.integration_name,
+                                                          data_type=track.data_type,
+                                                          source_id=track.source_id,
+                                                          source_update_time=datetime.now(timezone.utc),
+                                                          source_description=track.source_description, )
+        entity_override = anduril_entities.EntityOverride(entity=override_track_entity,
+                                                          provenance=override_provenance)
+        await self.executor.call(self.entity_api.put_entity_override_rest,
+                                 entity_id=track.entity_id,
+                                 field_path="mil_view.disposition",
+                                 entity_override=entity_override)
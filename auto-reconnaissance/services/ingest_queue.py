@@ -0,0 +1,113 @@
+import asyncio
+from itertools import islice
+from logging import Logger
+
+from utils.entity_record import EntityRecordEvent
+from utils.metrics import REGISTRY
+from utils.tracing import TRACER
+
+INGEST_QUEUE_SIZE = 10000
+INGEST_BATCH_SIZE = 500
+
+COALESCED_EVENTS = REGISTRY.counter("ears_ingest_coalesced_total",
+                                    "Entity events replaced by a newer event of the same entity before being applied.")
+APPLIED_EVENTS = REGISTRY.counter("ears_ingest_applied_total", "Entity events applied to the cache.")
+BACKPRESSURE_WAITS = REGISTRY.counter("ears_ingest_backpressure_waits_total",
+                                      "Times the stream waited for room in a full ingest queue.")
+
+
+class IngestQueue:
+    def __init__(self, logger: Logger, cache_manager, capacity: int = INGEST_QUEUE_SIZE,
+                 batch_size: int = INGEST_BATCH_SIZE):
+        """
+        Sits between the entity stream and the cache. Pending events are keyed by entity id, so an event replaces the
+        pending event of the same entity instead of queueing behind it and only the newest state is ever applied.
+        Events are applied in batches with a yield to the event loop between batches, and a full queue holds the
+        stream back until there is room, which keeps memory bounded during a burst.
+
+        Args:
+            logger (Logger): The logger.
+            cache_manager (CacheManager): The cache the events are applied to.
+            capacity (int): The maximum number of entities with a pending event.
+            batch_size (int): The maximum number of events applied before yielding to the event loop.
+        """
+        self.logger = logger
+        self.cache_manager = cache_manager
+        self.capacity = capacity
+        self.batch_size = batch_size
+        # dicts keep insertion order, so replacing a pending event keeps the entity in its place in line
+        self.pending = {}
+        self.not_empty = asyncio.Event()
+        self.not_full = asyncio.Event()
+        self.not_full.set()
+        REGISTRY.gauge("ears_ingest_queue_depth", "Entities with an event waiting to be applied to the cache.",
+                       function=self.pending.__len__)
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    async def put(self, entity_event: EntityRecordEvent):
+        """
+        Queue an entity event, replacing the pending event of the same entity. Waits while the queue is full and
+        the event is for an entity without a pending event.
+
+        Args:
+            entity_event (EntityRecordEvent): The event to queue.
+        """
+        entity_id = entity_event.entity_id
+        while entity_id not in self.pending and len(self.pending) >= self.capacity:
+            BACKPRESSURE_WAITS.inc()
+            self.not_full.clear()
+            await self.not_full.wait()
+        if entity_id in self.pending:
+            COALESCED_EVENTS.inc()
+        self.pending[entity_id] = entity_event
+        self.not_empty.set()
+
+    def apply_batch(self, batch_size: int = None) -> int:
+        """
+        Apply the oldest pending events to the cache.
+
+        Args:
+            batch_size (int): The maximum number of events to apply, defaults to the configured batch size.
+
+        Returns:
+            int: The number of events applied.
+        """
+        batch_size = batch_size or self.batch_size
+        if len(self.pending) <= batch_size:
+            # the depth gauge reads the length of the dict it was registered with, so it is emptied, not replaced
+            events = list(self.pending.values())
+            self.pending.clear()
+        else:
+            entity_ids = list(islice(self.pending, batch_size))
+            events = [self.pending.pop(entity_id) for entity_id in entity_ids]
+        with TRACER.span("apply_batch", "ingest", args={"events": len(events)}):
+            for entity_event in events:
+                try:
+                    self.cache_manager.handle_event(entity_event)
+                except Exception as error:
+                    self.logger.error(f"ingest error for entity {entity_event.entity_id}: {error}")
+        APPLIED_EVENTS.inc(len(events))
+        if not self.pending:
+            self.not_empty.clear()
+        self.not_full.set()
+        return len(events)
+
+    def flush(self) -> int:
+        """
+        Apply every pending event, so a caller about to read the cache sees the newest state received.
+
+        Returns:
+            int: The number of events applied.
+        """
+        if not self.pending:
+            return 0
+        return self.apply_batch(len(self.pending))
+
+    async def run(self):
+        while True:
+            await self.not_empty.wait()
+            self.apply_batch()
+            # let the stream and the other tasks run between batches
+            await asyncio.sleep(0)
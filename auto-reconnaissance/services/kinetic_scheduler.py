@@ -0,0 +1,237 @@
+import heapq
+import math
+import time
+from itertools import count
+
+import numpy as np
+
+from utils.distance_calculator import DistanceCalculator, EARTH_MEAN_RADIUS_MILES
+from utils.engagement_rules import EngagementRules
+from utils.entity_record import EntityRecord
+
+PREDICTION_HORIZON_SECONDS = 60
+# the fastest entity a prediction accounts for when it searches for pairs that may close in within the horizon
+MAX_PEER_SPEED_MPS = 50
+# entities slower than this are not predicted from, the predictions of the moving peers cover their pairs
+MIN_PREDICTED_SPEED_MPS = 0.5
+METERS_PER_MILE = 1609.344
+METERS_PER_DEGREE = math.radians(EARTH_MEAN_RADIUS_MILES) * METERS_PER_MILE
+
+
+def extrapolate(latitudes, longitudes, velocities_east, velocities_north, elapsed_seconds):
+    """
+    Move positions along their east and north velocities for the elapsed time on a locally flat Earth.
+
+    Returns:
+        tuple: The extrapolated latitudes and longitudes in degrees.
+    """
+    latitudes = np.asarray(latitudes, dtype=np.float64)
+    cos_latitudes = np.maximum(np.cos(np.radians(latitudes)), 1e-6)
+    return (latitudes + np.multiply(velocities_north, elapsed_seconds) / METERS_PER_DEGREE,
+            longitudes + np.multiply(velocities_east, elapsed_seconds) / (METERS_PER_DEGREE * cos_latitudes))
+
+
+def current_motion(velocities_east, velocities_north, observed_at, now: float, max_age_seconds: float) -> tuple:
+    """
+    Get the velocities and elapsed times positions are extrapolated with. Records older than max_age_seconds, of an
+    entity that stopped reporting or restored after a restart, are held at their last known position, their
+    velocity is too old to be extrapolated over the whole gap.
+
+    Returns:
+        tuple: The east and north velocities in m/s and the seconds elapsed since each record was observed.
+    """
+    elapsed_seconds = now - np.asarray(observed_at, dtype=np.float64)
+    current = elapsed_seconds <= max_age_seconds
+    return (np.where(current, velocities_east, 0.0), np.where(current, velocities_north, 0.0),
+            np.where(current, np.maximum(elapsed_seconds, 0.0), 0.0))
+
+
+def threshold_entry_times(east_meters, north_meters, velocities_east, velocities_north, radius_meters) -> np.ndarray:
+    """
+    Find when relative positions moving at constant relative velocities first come within a radius. The time of
+    closest approach is where the relative distance is smallest, the radius is entered before it by the time the
+    remaining chord takes to cover.
+
+    Args:
+        east_meters: The east offsets of the peers from the reference entity in meters.
+        north_meters: The north offsets of the peers from the reference entity in meters.
+        velocities_east: The east velocities of the peers relative to the reference entity in m/s.
+        velocities_north: The north velocities of the peers relative to the reference entity in m/s.
+        radius_meters: The radius in meters, a scalar or the radius of each peer.
+
+    Returns:
+        np.ndarray: The seconds until each peer enters the radius, 0 for peers already within it and NaN for peers
+        that never enter it.
+    """
+    distance_squared = east_meters ** 2 + north_meters ** 2
+    speed_squared = velocities_east ** 2 + velocities_north ** 2
+    closing = east_meters * velocities_east + north_meters * velocities_north
+    with np.errstate(divide="ignore", invalid="ignore"):
+        closest_approach_seconds = -closing / speed_squared
+        closest_distance_squared = distance_squared - closing ** 2 / speed_squared
+        entry_seconds = closest_approach_seconds - np.sqrt((radius_meters ** 2 - closest_distance_squared) /
+                                                           speed_squared)
+    enters = (speed_squared > 0) & (closest_approach_seconds > 0) & (closest_distance_squared <= radius_meters ** 2)
+    entry_seconds = np.where(enters, np.maximum(entry_seconds, 0.0), np.nan)
+    return np.where(distance_squared <= radius_meters ** 2, 0.0, entry_seconds)
+
+
+class KineticScheduler:
+    def __init__(self, cache_manager, engagement_rules: EngagementRules,
+                 horizon_seconds: float = PREDICTION_HORIZON_SECONDS, max_peer_speed_mps: float = MAX_PEER_SPEED_MPS):
+        """
+        Predicts from their velocities when asset-track pairs that are out of range will come within the radius of
+        the engagement rule of the asset, and keeps the predictions in a heap ordered by that time. A changed entity
+        that moves is predicted against the peers it can reach within the horizon, pairs that never close in are not
+        scheduled at all.
+        Predictions are invalidated lazily: an entry holds the records it was computed from and is dropped when it
+        comes due if either entity has been updated since, because the update scheduled a fresh prediction.
+        Records older than the horizon are not extrapolated.
+
+        Args:
+            cache_manager (CacheManager): The cache holding the records and the spatial indexes.
+            engagement_rules (EngagementRules): The rules deciding the radius and the tracks each asset engages.
+            horizon_seconds (float): How far ahead pairs are predicted.
+            max_peer_speed_mps (float): The peer speed assumed when searching for pairs that may close in.
+        """
+        self.cache_manager = cache_manager
+        self.engagement_rules = engagement_rules
+        self.horizon_seconds = horizon_seconds
+        self.max_peer_speed_mps = max_peer_speed_mps
+        self.heap = []
+        self.sequence = count()
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def next_due(self):
+        return self.heap[0][0] if self.heap else None
+
+    def search_margin_miles(self, speed_mps: float) -> float:
+        return (speed_mps + self.max_peer_speed_mps) * self.horizon_seconds / METERS_PER_MILE
+
+    @staticmethod
+    def speed(record: EntityRecord) -> float:
+        return math.hypot(record.velocity_east_mps, record.velocity_north_mps)
+
+    def is_moving(self, record: EntityRecord, now: float) -> bool:
+        return now - record.observed_at <= self.horizon_seconds and self.speed(record) >= MIN_PREDICTED_SPEED_MPS
+
+    def predict(self, entity_ids, now: float = None):
+        """
+        Schedule the pairs of the changed entities that are out of range now and will come within the threshold
+        inside the horizon. Stationary entities are skipped, a pair only closes in when one side moves and the moving
+        side predicts the pair on each of its own updates, records older than the horizon count as stationary. The
+        pairs of all the entities are gathered first and predicted in one vectorized pass.
+
+        Args:
+            entity_ids: The ids of the assets and tracks that changed.
+            now (float): The current unix timestamp, defaults to the current time.
+        """
+        if self.horizon_seconds <= 0:
+            return
+        now = time.time() if now is None else now
+        track_store = self.cache_manager.track_store
+        assets = []
+        asset_indices = {}
+        pair_assets = []
+        pair_rows = []
+        for entity_id in entity_ids:
+            asset = self.cache_manager.get_asset(entity_id)
+            if asset is not None and self.is_moving(asset, now):
+                rows = track_store.rows_for(self.cache_manager.get_track_ids_within(
+                    asset.latitude, asset.longitude,
+                    self.engagement_rules.radius_of(asset) + self.search_margin_miles(self.speed(asset))))
+                if len(rows):
+                    pair_assets.append(np.full(len(rows), self.asset_index(asset, assets, asset_indices)))
+                    pair_rows.append(rows)
+            track = self.cache_manager.get_track(entity_id)
+            if track is not None and self.is_moving(track, now):
+                peers = self.cache_manager.get_assets_in_range(track.latitude, track.longitude,
+                                                               self.search_margin_miles(self.speed(track)))
+                if peers:
+                    pair_assets.append(np.fromiter((self.asset_index(peer, assets, asset_indices) for peer in peers),
+                                                   dtype=np.intp, count=len(peers)))
+                    pair_rows.append(np.full(len(peers), track_store.rows[entity_id]))
+        if not pair_rows:
+            return
+        pair_assets = np.concatenate(pair_assets)
+        pair_rows = np.concatenate(pair_rows)
+        pair_rules = self.engagement_rules.rules_of(assets)[pair_assets]
+        engageable = self.engagement_rules.engageable(pair_rules, track_store, pair_rows)
+        pair_assets = pair_assets[engageable]
+        pair_rows = pair_rows[engageable]
+        pair_rules = pair_rules[engageable]
+        # both sides are moved to the current time first, they were observed at different times
+        asset_velocities_east, asset_velocities_north, asset_elapsed = current_motion(
+            np.array([asset.velocity_east_mps for asset in assets])[pair_assets],
+            np.array([asset.velocity_north_mps for asset in assets])[pair_assets],
+            np.array([asset.observed_at for asset in assets])[pair_assets], now, self.horizon_seconds)
+        asset_latitudes, asset_longitudes = extrapolate(
+            np.array([asset.latitude for asset in assets])[pair_assets],
+            np.array([asset.longitude for asset in assets])[pair_assets], asset_velocities_east,
+            asset_velocities_north, asset_elapsed)
+        track_velocities_east, track_velocities_north, track_elapsed = current_motion(
+            track_store.velocities_east[pair_rows], track_store.velocities_north[pair_rows],
+            track_store.updated_at[pair_rows], now, self.horizon_seconds)
+        track_latitudes, track_longitudes = extrapolate(
+            track_store.latitudes[pair_rows], track_store.longitudes[pair_rows], track_velocities_east,
+            track_velocities_north, track_elapsed)
+        # the longitude offset is wrapped into [-180, 180), pairs across the antimeridian are close, not a world apart
+        longitude_offsets = (track_longitudes - asset_longitudes + 180) % 360 - 180
+        entry_seconds = threshold_entry_times(
+            longitude_offsets * METERS_PER_DEGREE * np.cos(np.radians(asset_latitudes)),
+            (track_latitudes - asset_latitudes) * METERS_PER_DEGREE,
+            track_velocities_east - asset_velocities_east, track_velocities_north - asset_velocities_north,
+            self.engagement_rules.radii_miles[pair_rules] * METERS_PER_MILE)
+        # pairs in range now are found by the range check of the pass, only pairs closing in later are scheduled
+        for index in np.flatnonzero((entry_seconds > 0) & (entry_seconds <= self.horizon_seconds)):
+            heapq.heappush(self.heap, (now + float(entry_seconds[index]), next(self.sequence),
+                                       assets[pair_assets[index]], track_store.records[pair_rows[index]]))
+
+    @staticmethod
+    def asset_index(asset: EntityRecord, assets: list, asset_indices: dict) -> int:
+        index = asset_indices.get(asset.entity_id)
+        if index is None:
+            index = asset_indices[asset.entity_id] = len(assets)
+            assets.append(asset)
+        return index
+
+    def pop_due(self, now: float = None) -> list[tuple]:
+        """
+        Take the predictions that came due and are still current, and keep the pairs that are within the radius of
+        their asset at their extrapolated positions.
+
+        Args:
+            now (float): The current unix timestamp, defaults to the current time.
+
+        Returns:
+            list[tuple]: The asset and track records of the pairs that came within the threshold.
+        """
+        now = time.time() if now is None else now
+        due = []
+        seen = set()
+        while self.heap and self.heap[0][0] <= now:
+            _, _, asset, track = heapq.heappop(self.heap)
+            pair = (asset.entity_id, track.entity_id)
+            if (pair in seen or self.cache_manager.get_asset(asset.entity_id) is not asset or
+                    self.cache_manager.get_track(track.entity_id) is not track):
+                continue
+            seen.add(pair)
+            due.append((asset, track))
+        if not due:
+            return []
+        asset_latitudes, asset_longitudes = extrapolate(
+            [asset.latitude for asset, _ in due], [asset.longitude for asset, _ in due],
+            *current_motion([asset.velocity_east_mps for asset, _ in due],
+                            [asset.velocity_north_mps for asset, _ in due],
+                            [asset.observed_at for asset, _ in due], now, self.horizon_seconds))
+        track_latitudes, track_longitudes = extrapolate(
+            [track.latitude for _, track in due], [track.longitude for _, track in due],
+            *current_motion([track.velocity_east_mps for _, track in due],
+                            [track.velocity_north_mps for _, track in due],
+                            [track.observed_at for _, track in due], now, self.horizon_seconds))
+        radii_miles = self.engagement_rules.radii_miles[self.engagement_rules.rules_of([asset for asset, _ in due])]
+        within = DistanceCalculator.within_threshold(asset_latitudes, asset_longitudes, track_latitudes,
+                                                     track_longitudes, radii_miles)
+        return [pair for pair, in_range in zip(due, within) if in_range]
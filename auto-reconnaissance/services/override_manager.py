@@ -0,0 +1,110 @@
+import asyncio
+from logging import Logger
+
+from utils.backoff import Backoff
+
+OVERRIDE_WORKERS = 4
+OVERRIDE_QUEUE_SIZE = 1000
+OVERRIDE_MAX_ATTEMPTS = 5
+# pause after max_attempts failures in a row before the override is tried again
+OVERRIDE_RETRY_PAUSE_SECONDS = 60
+
+
+class OverrideManager:
+    def __init__(self, logger: Logger, send_override, workers: int = OVERRIDE_WORKERS,
+                 queue_size: int = OVERRIDE_QUEUE_SIZE, max_attempts: int = OVERRIDE_MAX_ATTEMPTS,
+                 retry_pause_seconds: float = OVERRIDE_RETRY_PAUSE_SECONDS):
+        """
+        Sends disposition overrides through a bounded queue drained by a fixed number of workers, so requesting an
+        override never blocks the caller. Each track is overridden at most once while its override is pending or
+        confirmed, and failed overrides are retried with jittered exponential backoff until they go through or the
+        track is forgotten. Overrides that find the queue full wait in an overflow and are queued as slots free up.
+
+        Args:
+            logger (Logger): The logger.
+            send_override: The coroutine function that sends the override for a track and raises on failure.
+            workers (int): The number of overrides sent concurrently.
+            queue_size (int): The maximum number of queued overrides.
+            max_attempts (int): The number of failed attempts in a row after which an override pauses.
+            retry_pause_seconds (float): How long an override pauses after max_attempts failed attempts.
+        """
+        self.logger = logger
+        self.send_override = send_override
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_pause_seconds = retry_pause_seconds
+        self.backoff = Backoff()
+        self.queue = asyncio.Queue(queue_size)
+        # overrides of pending tracks waiting for a queue slot, keyed by entity id in the order they overflowed
+        self.overflow = {}
+        self.pending = set()
+        self.confirmed = set()
+
+    def request(self, track) -> bool:
+        """
+        Queue a disposition override for a track unless one is already pending or confirmed.
+
+        Returns:
+            bool: True if a new override was requested, False otherwise.
+        """
+        entity_id = track.entity_id
+        if entity_id in self.pending or entity_id in self.confirmed:
+            return False
+        self.pending.add(entity_id)
+        self.enqueue(track, 0)
+        return True
+
+    def forget(self, entity_id: str):
+        self.pending.discard(entity_id)
+        self.confirmed.discard(entity_id)
+        self.overflow.pop(entity_id, None)
+
+    def unconfirm(self, entity_id: str):
+        """
+        Allow a confirmed override to be sent again, once the disposition of the track has changed since.
+        """
+        self.confirmed.discard(entity_id)
+
+    def enqueue(self, track, attempt: int):
+        try:
+            self.queue.put_nowait((track, attempt))
+        except asyncio.QueueFull:
+            if track.entity_id not in self.overflow:
+                self.logger.warning(f"override queue full, deferring override for track {track.entity_id}")
+            self.overflow[track.entity_id] = (track, attempt)
+
+    def refill(self):
+        while self.overflow and not self.queue.full():
+            self.queue.put_nowait(self.overflow.pop(next(iter(self.overflow))))
+
+    def retry(self, track, attempt: int):
+        # the track may have been forgotten while the retry was waiting
+        if track.entity_id in self.pending:
+            self.enqueue(track, attempt)
+
+    async def run(self):
+        await asyncio.gather(*(self.worker() for _ in range(self.workers)))
+
+    async def worker(self):
+        while True:
+            track, attempt = await self.queue.get()
+            entity_id = track.entity_id
+            try:
+                if entity_id not in self.pending:
+                    continue
+                await self.send_override(track)
+                self.pending.discard(entity_id)
+                self.confirmed.add(entity_id)
+            except Exception as error:
+                attempt += 1
+                if attempt >= self.max_attempts:
+                    self.logger.error(f"override for track {entity_id} failed {attempt} times, retrying in "
+                                      f"{self.retry_pause_seconds:.0f}s: {error}")
+                    asyncio.get_running_loop().call_later(self.retry_pause_seconds, self.retry, track, 0)
+                else:
+                    delay = self.backoff.delay(attempt)
+                    self.logger.warning(f"override for track {entity_id} failed, retrying in {delay:.1f}s: {error}")
+                    asyncio.get_running_loop().call_later(delay, self.retry, track, attempt)
+            finally:
+                self.queue.task_done()
+                self.refill()
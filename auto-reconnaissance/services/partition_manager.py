@@ -0,0 +1,202 @@
+import asyncio
+import os
+import socket
+import time
+import zlib
+from logging import Logger
+
+from utils.lease_store import LeaseStore
+from utils.metrics import REGISTRY
+from utils.snapshot_store import Snapshot
+
+from services.cache_manager import CacheManager
+from services.task_monitor import TaskMonitor
+from services.tasker import Tasker
+
+PARTITION_COUNT = 64
+LEASE_TTL_SECONDS = 5
+# leases and claims are renewed this many times per TTL, so one missed renewal does not lose them
+RENEWALS_PER_TTL = 3
+
+CLAIMS_REJECTED = REGISTRY.counter("ears_partition_claims_rejected_total",
+                                   "Assigned pairs not tasked because another instance claimed an entity.").labels()
+TASKS_ADOPTED = REGISTRY.counter("ears_partition_tasks_adopted_total",
+                                 "Investigations taken over from instances that died.").labels()
+LEASE_ERRORS = REGISTRY.counter("ears_partition_lease_errors_total", "Failed lease store syncs.").labels()
+
+
+def default_instance_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def partition_of(entity_id: str, partitions: int) -> int:
+    # crc32 rather than hash(), string hashes are salted per process and every instance has to agree
+    return zlib.crc32(entity_id.encode()) % partitions
+
+
+def preferred_owner(partition: int, owners: list[str]) -> str:
+    """
+    Pick the owner of a partition among the live instances by rendezvous hashing: the instance with the highest
+    hash of its id and the partition wins. An instance joining or leaving only moves the partitions it wins or
+    held, the other partitions keep their owner.
+    """
+    return max(owners, key=lambda owner: zlib.crc32(f"{owner}/{partition}".encode()))
+
+
+class PartitionManager:
+    def __init__(self, logger: Logger, lease_store: LeaseStore, instance_id: str, cache_manager: CacheManager,
+                 task_monitor: TaskMonitor, tasker: Tasker, task_created, partitions: int = PARTITION_COUNT,
+                 lease_ttl_seconds: float = LEASE_TTL_SECONDS):
+        """
+        Splits the assets between the EARS instances sharing a lease store. Assets are hashed into a fixed number
+        of partitions and every instance holds leases on the partitions rendezvous hashing gives it among the live
+        instances, it only arbitrates the assets of those partitions. Leases of a dead instance expire after the TTL
+        and its partitions move to the survivors, which also take over the investigations it had created.
+        Every pair is claimed in the store before its task is created, so two instances never task the same asset
+        or track, even while a partition changes hands.
+
+        Args:
+            logger (Logger): The logger.
+            lease_store (LeaseStore): The store shared by the instances.
+            instance_id (str): The id of this instance, unique among the instances sharing the store.
+            cache_manager (CacheManager): The cache holding the assets and the task mappings.
+            task_monitor (TaskMonitor): The monitor that follows the investigations taken over.
+            tasker (Tasker): The tasker holding the pairs whose task is being created.
+            task_created: The function the tasker calls when a creation taken over completes.
+            partitions (int): The number of partitions, the same for every instance.
+            lease_ttl_seconds (float): How long leases and claims last without being renewed.
+        """
+        self.logger = logger
+        self.lease_store = lease_store
+        self.instance_id = instance_id
+        self.cache_manager = cache_manager
+        self.task_monitor = task_monitor
+        self.tasker = tasker
+        self.task_created = task_created
+        self.partitions = partitions
+        self.lease_ttl_seconds = lease_ttl_seconds
+        self.owned = frozenset()
+        # the leases are only trusted until they would have expired since the last successful sync
+        self.owned_until = float("-inf")
+        # syncs and claims are serialized, a sync computed before a claim would otherwise drop the claim
+        self.lock = asyncio.Lock()
+        REGISTRY.gauge("ears_partitions_owned", "Asset partitions this instance holds a lease on.",
+                       function=lambda: len(self.owned) if time.monotonic() < self.owned_until else 0)
+
+    def owns(self, asset_id: str) -> bool:
+        return time.monotonic() < self.owned_until and partition_of(asset_id, self.partitions) in self.owned
+
+    def held_claims(self) -> dict:
+        held = {entity_id: ("asset", task_id) for entity_id, task_id in self.cache_manager.asset_task.items()}
+        held.update((entity_id, ("track", task_id)) for entity_id, task_id in self.cache_manager.track_task.items())
+        # the claims of creations in flight were made with their kind, it is only needed if they have to be recreated
+        for entity_id, task_id in self.tasker.reserved.items():
+            held.setdefault(entity_id, ("asset" if self.cache_manager.get_asset(entity_id) is not None else "track",
+                                        task_id))
+        return held
+
+    def sync_store(self, held: dict) -> tuple[set, list[tuple]]:
+        now = time.time()
+        owners = self.lease_store.heartbeat(self.instance_id, self.lease_ttl_seconds, now)
+        wanted = {partition for partition in range(self.partitions)
+                  if preferred_owner(partition, owners) == self.instance_id}
+        owned = self.lease_store.acquire(self.instance_id, wanted, self.lease_ttl_seconds, now)
+        self.lease_store.sync_claims(self.instance_id, held, self.lease_ttl_seconds, now)
+        adopted = self.lease_store.adopt_claims(
+            self.instance_id, lambda asset_id: partition_of(asset_id, self.partitions) in owned,
+            self.lease_ttl_seconds, now)
+        return owned, adopted
+
+    async def sync(self):
+        """
+        Renew the heartbeat, leases and claims of this instance, take the partitions it should own that are free
+        and take over the investigations of dead instances in them.
+        """
+        async with self.lock:
+            started_at = time.monotonic()
+            try:
+                owned, adopted = await asyncio.to_thread(self.sync_store, self.held_claims())
+            except Exception as error:
+                LEASE_ERRORS.inc()
+                self.logger.error(f"lease store sync error {error}")
+                return
+            gained = owned - self.owned
+            if gained or len(owned) != len(self.owned):
+                self.logger.info(f"instance {self.instance_id} owns {len(owned)} of {self.partitions} partitions")
+            self.owned = frozenset(owned)
+            self.owned_until = started_at + self.lease_ttl_seconds
+        if gained:
+            # the assets of new partitions have not been arbitrated by this instance yet
+            for asset in self.cache_manager.get_assets():
+                if partition_of(asset.entity_id, self.partitions) in gained:
+                    self.cache_manager.mark_dirty(asset.entity_id)
+        if adopted:
+            self.adopt(adopted)
+
+    def adopt(self, adopted: list[tuple]):
+        """
+        Take over investigations of instances that stopped. The dead instance may have stopped before or while
+        creating a task, so a task whose asset and track are known is created again with the id of its claim, which
+        the tasks api answers with a conflict if the task exists already. The other tasks are only monitored, a task
+        that was never created is not found and finishes.
+        """
+        pairs = {}
+        for kind, entity_id, task_id in adopted:
+            pairs.setdefault(task_id, {})[kind] = entity_id
+        snapshot = Snapshot()
+        for task_id, pair in pairs.items():
+            asset = self.cache_manager.get_asset(pair.get("asset"))
+            track = self.cache_manager.get_track(pair.get("track"))
+            if asset is not None and track is not None and self.tasker.submit(asset, track, self.task_created,
+                                                                              task_id):
+                continue
+            for kind, entity_id in pair.items():
+                (snapshot.asset_tasks if kind == "asset" else snapshot.track_tasks)[entity_id] = task_id
+            snapshot.task_statuses[task_id] = "STATUS_CREATED"
+        self.cache_manager.restore(snapshot)
+        self.task_monitor.restore(snapshot.task_statuses)
+        TASKS_ADOPTED.inc(len(pairs))
+        self.logger.info(f"took over {len(pairs)} investigations from instances that stopped")
+
+    async def claim(self, pairs: list[tuple]) -> list[tuple]:
+        """
+        Claim the pairs chosen for an investigation before their tasks are created.
+
+        Args:
+            pairs (list[tuple]): The asset record, track record and task id of the pairs.
+
+        Returns:
+            list[tuple]: The pairs granted. Pairs with an entity claimed by another instance are left out and
+            marked dirty, so the next pass tries them again.
+        """
+        if not pairs:
+            return []
+        records = {(asset.entity_id, track.entity_id): (asset, track, task_id) for asset, track, task_id in pairs}
+        granted = []
+        async with self.lock:
+            try:
+                granted = await asyncio.to_thread(self.lease_store.claim, self.instance_id,
+                                                  [(asset_id, track_id, task_id)
+                                                   for (asset_id, track_id), (_, _, task_id) in records.items()],
+                                                  self.lease_ttl_seconds, time.time())
+            except Exception as error:
+                LEASE_ERRORS.inc()
+                self.logger.error(f"lease store claim error {error}")
+        CLAIMS_REJECTED.inc(len(records) - len(granted))
+        granted = [(asset_id, track_id) for asset_id, track_id, _ in granted]
+        for asset_id, track_id in records.keys() - set(granted):
+            self.cache_manager.mark_dirty(asset_id)
+            self.cache_manager.mark_dirty(track_id)
+        return [records[pair] for pair in granted]
+
+    async def run(self):
+        while True:
+            await self.sync()
+            await asyncio.sleep(self.lease_ttl_seconds / RENEWALS_PER_TTL)
+
+    def release(self):
+        try:
+            self.lease_store.release(self.instance_id, time.time())
+        except Exception as error:
+            self.logger.error(f"lease store release error {error}")
+        self.lease_store.close()
@@ -0,0 +1,208 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from utils.distance_calculator import DistanceCalculator
+from utils.engagement_rules import EngagementRules
+from utils.entity_record import EntityRecord
+from utils.track_store import TrackStore
+
+SHARD_CELL_DEGREES = 2.0
+MIN_COLUMN_CAPACITY = 1024
+
+# shared memory blocks attached by this worker process, keyed by block name
+_attached_blocks = {}
+
+
+class SharedColumn:
+    def __init__(self, dtype):
+        """
+        A NumPy column backed by a shared memory block that worker processes attach to by name. The block is
+        reallocated under a new name when the column outgrows it.
+        """
+        self.dtype = np.dtype(dtype)
+        self.block = None
+        self.capacity = 0
+
+    def write(self, values: np.ndarray) -> tuple:
+        length = len(values)
+        if length > self.capacity:
+            self.close()
+            self.capacity = max(length, 2 * self.capacity, MIN_COLUMN_CAPACITY)
+            self.block = SharedMemory(create=True, size=self.capacity * self.dtype.itemsize)
+        column = np.ndarray((self.capacity,), dtype=self.dtype, buffer=self.block.buf)
+        column[:length] = values
+        return self.block.name, self.dtype.str, length
+
+    def close(self):
+        if self.block is not None:
+            self.block.close()
+            self.block.unlink()
+            self.block = None
+
+
+def attach_column(spec: tuple) -> np.ndarray:
+    name, dtype, length = spec
+    block = _attached_blocks.get(name)
+    if block is None:
+        try:
+            block = SharedMemory(name=name, track=False)
+        except TypeError:
+            # python < 3.13 has no track argument, the block is still unlinked by the parent only
+            block = SharedMemory(name=name)
+        _attached_blocks[name] = block
+    return np.ndarray((length,), dtype=np.dtype(dtype), buffer=block.buf)
+
+
+def release_columns(keep: set):
+    for name in list(_attached_blocks):
+        if name not in keep:
+            _attached_blocks.pop(name).close()
+
+
+def evaluate_shard(columns: dict, asset_indices: np.ndarray, track_rows: np.ndarray, radius_miles: float,
+                   excluded_dispositions: np.ndarray, excluded_environments: np.ndarray) -> tuple:
+    """
+    Range check the candidate pairs of the assets of one geographic cell in a worker process. The tracks of the
+    pairs are the candidates found within the radius of each asset, so they reach past the cell by up to the radius
+    and pairs that straddle a cell boundary are still checked by the cell owning the asset. All the assets of a shard
+    share one engagement rule.
+
+    Args:
+        columns (dict): The shared column specs of the asset and track coordinates and track dispositions and
+            environments.
+        asset_indices (np.ndarray): The index in the asset columns of the asset of each pair.
+        track_rows (np.ndarray): The track store row of the track of each pair.
+        radius_miles (float): The engagement radius of the rule in miles.
+        excluded_dispositions (np.ndarray): The disposition table of the tracks the rule does not engage.
+        excluded_environments (np.ndarray): The environment table of the tracks the rule does not engage.
+
+    Returns:
+        tuple: The asset indices and track rows of the engaged pairs within range.
+    """
+    release_columns({spec[0] for spec in columns.values()})
+    asset_latitudes = attach_column(columns["asset_latitudes"])
+    asset_longitudes = attach_column(columns["asset_longitudes"])
+    track_latitudes = attach_column(columns["track_latitudes"])
+    track_longitudes = attach_column(columns["track_longitudes"])
+    track_dispositions = attach_column(columns["track_dispositions"])
+    track_environments = attach_column(columns["track_environments"])
+
+    engaged = ~(excluded_dispositions[track_dispositions[track_rows]] |
+                excluded_environments[track_environments[track_rows]])
+    asset_indices, track_rows = asset_indices[engaged], track_rows[engaged]
+    within = DistanceCalculator.within_threshold(asset_latitudes[asset_indices], asset_longitudes[asset_indices],
+                                                 track_latitudes[track_rows], track_longitudes[track_rows],
+                                                 radius_miles)
+    return asset_indices[within], track_rows[within]
+
+
+class ShardPool:
+    def __init__(self, workers: int, cell_degrees: float = SHARD_CELL_DEGREES):
+        """
+        Spreads the range checks of an arbitration pass across worker processes. The candidate pairs of the pass
+        are bucketed by the engagement rule and geographic cell of their asset with one sort, and every cell range
+        checks only its slice of the pairs. Coordinates reach the workers through shared memory columns, only the
+        pairs of each cell and the resulting pairs are pickled.
+
+        Args:
+            workers (int): The number of worker processes.
+            cell_degrees (float): The edge length of a partition cell in degrees.
+        """
+        self.workers = workers
+        self.cell_degrees = cell_degrees
+        self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        self.columns = {
+            "asset_latitudes": SharedColumn(np.float64),
+            "asset_longitudes": SharedColumn(np.float64),
+            "track_latitudes": SharedColumn(np.float64),
+            "track_longitudes": SharedColumn(np.float64),
+            "track_dispositions": SharedColumn(np.int8),
+            "track_environments": SharedColumn(np.int8),
+        }
+
+    def cell_keys(self, assets: list[EntityRecord], rules: np.ndarray) -> np.ndarray:
+        """
+        Number the engagement rule and geographic cell of every asset, assets of the same rule and cell share a key.
+        """
+        rows = np.floor(np.fromiter((asset.latitude for asset in assets), dtype=np.float64, count=len(assets)) /
+                        self.cell_degrees).astype(np.int64)
+        cols = np.floor(np.fromiter((asset.longitude for asset in assets), dtype=np.float64, count=len(assets)) /
+                        self.cell_degrees).astype(np.int64)
+        rows -= rows.min()
+        cols -= cols.min()
+        return (rules * (rows.max() + 1) + rows) * (cols.max() + 1) + cols
+
+    async def find_pairs(self, assets: list[EntityRecord], candidate_track_ids: list, track_store: TrackStore,
+                         engagement_rules: EngagementRules) -> list[tuple]:
+        """
+        Range check the candidate tracks of the given assets against the rules of the assets using the worker
+        processes.
+
+        Args:
+            assets (list[EntityRecord]): The assets to evaluate.
+            candidate_track_ids (list): The entity ids of the candidate tracks of each asset.
+            track_store (TrackStore): The store holding the tracks.
+            engagement_rules (EngagementRules): The rules deciding the radius and the tracks each asset engages.
+
+        Returns:
+            list[tuple]: The in-range (asset, track) record pairs, ordered by asset and then by track row.
+        """
+        pair_assets = []
+        pair_rows = []
+        for asset_index, track_ids in enumerate(candidate_track_ids):
+            rows = track_store.rows_for(track_ids)
+            if len(rows):
+                pair_assets.append(np.full(len(rows), asset_index, dtype=np.intp))
+                pair_rows.append(rows)
+        if not pair_rows:
+            return []
+        pair_assets = np.concatenate(pair_assets)
+        pair_rows = np.concatenate(pair_rows)
+        high_water = track_store.high_water
+        # snapshot the records, rows of removed tracks can be reused while the workers run
+        track_records = track_store.records[:high_water]
+        specs = {
+            "asset_latitudes": self.columns["asset_latitudes"].write(
+                np.fromiter((asset.latitude for asset in assets), dtype=np.float64, count=len(assets))),
+            "asset_longitudes": self.columns["asset_longitudes"].write(
+                np.fromiter((asset.longitude for asset in assets), dtype=np.float64, count=len(assets))),
+            "track_latitudes": self.columns["track_latitudes"].write(track_store.latitudes[:high_water]),
+            "track_longitudes": self.columns["track_longitudes"].write(track_store.longitudes[:high_water]),
+            "track_dispositions": self.columns["track_dispositions"].write(track_store.dispositions[:high_water]),
+            "track_environments": self.columns["track_environments"].write(track_store.environments[:high_water]),
+        }
+
+        # the pairs are sorted by the cell of their asset once, every cell gets the slice between its boundaries
+        rules = engagement_rules.rules_of(assets)
+        pair_keys = self.cell_keys(assets, rules)[pair_assets]
+        order = np.argsort(pair_keys, kind="stable")
+        pair_keys, pair_assets, pair_rows = pair_keys[order], pair_assets[order], pair_rows[order]
+        cell_keys = np.unique(pair_keys)
+        starts = np.searchsorted(pair_keys, cell_keys, side="left")
+        ends = np.searchsorted(pair_keys, cell_keys, side="right")
+
+        loop = asyncio.get_running_loop()
+        futures = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            rule = rules[pair_assets[start]]
+            futures.append(loop.run_in_executor(self.executor, evaluate_shard, specs, pair_assets[start:end],
+                                                pair_rows[start:end], float(engagement_rules.radii_miles[rule]),
+                                                engagement_rules.excluded_dispositions[rule],
+                                                engagement_rules.excluded_environments[rule]))
+        results = await asyncio.gather(*futures)
+
+        asset_indices = np.concatenate([result[0] for result in results])
+        track_rows = np.concatenate([result[1] for result in results])
+        order = np.lexsort((track_rows, asset_indices))
+        return [(assets[asset_index], track_records[track_row])
+                for asset_index, track_row in zip(asset_indices[order], track_rows[order])
+                if track_records[track_row] is not None]
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for column in self.columns.values():
+            column.close()
@@ -0,0 +1,140 @@
+import asyncio
+import math
+import time
+
+from utils.metrics import REGISTRY
+
+RECON_INTERVAL_SECONDS = 1.0
+# the interval while non-friendly tracks are within range of assets
+RECON_MIN_INTERVAL_SECONDS = 0.25
+# the longest interval an idle system backs off to
+RECON_MAX_INTERVAL_SECONDS = 5.0
+IDLE_BACKOFF_FACTOR = 2
+# the share of the interval a sweep may take before the following sweeps are split
+SWEEP_BUDGET_FRACTION = 0.8
+MIN_SWEEP_ENTITIES = 100
+
+SWEEP_DRIFT = REGISTRY.histogram("ears_arbitration_sweep_drift_seconds",
+                                 "Delay of arbitration sweeps behind their deadline.").labels()
+SWEEP_OVERRUNS = REGISTRY.counter("ears_arbitration_sweep_overruns_total",
+                                  "Arbitration sweeps that ran past the next deadline.").labels()
+SWEEPS_SKIPPED = REGISTRY.counter("ears_arbitration_sweeps_skipped_total",
+                                  "Arbitration sweep deadlines skipped because an earlier sweep overran them.").labels()
+SWEEP_INTERVAL = REGISTRY.gauge("ears_arbitration_sweep_interval_seconds",
+                                "Current interval between arbitration sweep deadlines.").labels()
+SWEEP_ENTITY_LIMIT = REGISTRY.gauge("ears_arbitration_sweep_entity_limit",
+                                    "Changed entities a sweep evaluates at most, 0 when unlimited.").labels()
+SWEEP_DEFERRED = REGISTRY.gauge("ears_arbitration_sweep_deferred_entities",
+                                "Changed entities left for the next sweep by a split sweep.").labels()
+
+
+class SweepScheduler:
+    def __init__(self, interval_seconds: float = RECON_INTERVAL_SECONDS,
+                 min_interval_seconds: float = RECON_MIN_INTERVAL_SECONDS,
+                 max_interval_seconds: float = RECON_MAX_INTERVAL_SECONDS):
+        """
+        Runs arbitration sweeps on fixed deadlines instead of sleeping a fixed time after each sweep, so the cadence
+        does not stretch with the sweep duration. A sweep that runs past the next deadline skips the deadlines it
+        missed, and when sweeps take more than their budget the changed entities are split across several sweeps.
+        The interval tightens while non-friendly tracks are within range of assets and backs off while nothing
+        changes, a change arriving during the back-off brings the next sweep forward.
+
+        Args:
+            interval_seconds (float): The interval between deadlines.
+            min_interval_seconds (float): The interval while non-friendly tracks are within range of assets.
+            max_interval_seconds (float): The longest interval an idle system backs off to.
+        """
+        self.base_interval_seconds = interval_seconds
+        self.min_interval_seconds = min(min_interval_seconds, interval_seconds)
+        self.max_interval_seconds = max(max_interval_seconds, interval_seconds)
+        self.interval_seconds = interval_seconds
+        self.deadline = None
+        self.last_started_at = None
+        self.entity_limit = None
+        self.wake_event = asyncio.Event()
+        SWEEP_INTERVAL.set(interval_seconds)
+
+    def wake(self):
+        """
+        Note that the cache changed. A backed-off scheduler returns to the base interval and its next deadline is
+        brought forward to match.
+        """
+        if self.interval_seconds <= self.base_interval_seconds:
+            return
+        self.set_interval(self.base_interval_seconds)
+        if self.last_started_at is not None:
+            self.deadline = min(self.deadline, self.last_started_at + self.base_interval_seconds)
+        self.wake_event.set()
+
+    def set_interval(self, interval_seconds: float):
+        self.interval_seconds = interval_seconds
+        SWEEP_INTERVAL.set(interval_seconds)
+
+    async def wait(self, wake_in_seconds: float = None) -> float:
+        """
+        Wait for the next deadline.
+
+        Args:
+            wake_in_seconds (float): Wake up after this many seconds if it comes before the deadline.
+
+        Returns:
+            float: The monotonic time the sweep starts at.
+        """
+        now = time.monotonic()
+        if self.deadline is None:
+            self.deadline = now
+        wake_at = self.deadline if wake_in_seconds is None else min(self.deadline, now + max(wake_in_seconds, 0))
+        while True:
+            # the deadline moves forward when a change ends a back-off
+            target = min(wake_at, self.deadline)
+            delay = target - time.monotonic()
+            if delay <= 0:
+                break
+            self.wake_event.clear()
+            try:
+                await asyncio.wait_for(self.wake_event.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+        started_at = time.monotonic()
+        SWEEP_DRIFT.observe(started_at - target)
+        self.last_started_at = started_at
+        return started_at
+
+    def finish(self, started_at: float, duration_seconds: float, evaluated: int, deferred: int, threats: int):
+        """
+        Account for a completed sweep and plan the next one.
+
+        Args:
+            started_at (float): The monotonic time the sweep started at.
+            duration_seconds (float): How long the sweep took.
+            evaluated (int): The number of changed entities the sweep evaluated.
+            deferred (int): The number of changed entities left for the next sweep.
+            threats (int): The number of non-friendly pairs within range, whether or not they changed.
+        """
+        if threats:
+            self.set_interval(self.min_interval_seconds)
+        elif evaluated or deferred:
+            self.set_interval(self.base_interval_seconds)
+        else:
+            self.set_interval(min(max(self.interval_seconds, self.base_interval_seconds) * IDLE_BACKOFF_FACTOR,
+                                  self.max_interval_seconds))
+        # a sweep woken before its deadline keeps the deadline, the cadence stays on the deadline grid
+        if started_at >= self.deadline:
+            self.deadline += self.interval_seconds
+        now = time.monotonic()
+        if now > self.deadline:
+            missed = math.ceil((now - self.deadline) / self.interval_seconds)
+            SWEEP_OVERRUNS.inc()
+            SWEEPS_SKIPPED.inc(missed)
+            self.deadline += missed * self.interval_seconds
+        self.plan_split(duration_seconds, evaluated, deferred)
+
+    def plan_split(self, duration_seconds: float, evaluated: int, deferred: int):
+        budget_seconds = self.interval_seconds * SWEEP_BUDGET_FRACTION
+        if duration_seconds > budget_seconds and evaluated:
+            # evaluate only as many entities as fit the budget, the rest stay changed for the next sweeps
+            self.entity_limit = max(int(evaluated * budget_seconds / duration_seconds), MIN_SWEEP_ENTITIES)
+        elif self.entity_limit is not None and (not deferred or duration_seconds < budget_seconds / 2):
+            self.entity_limit = None if not deferred else self.entity_limit * 2
+        SWEEP_ENTITY_LIMIT.set(self.entity_limit or 0)
+        SWEEP_DEFERRED.set(deferred)
@@ -0,0 +1,129 @@
+import asyncio
+import time
+from logging import Logger
+
+from utils.metrics import REGISTRY
+
+from services.cache_manager import CacheManager
+from services.tasker import Tasker
+
+TERMINAL_TASK_STATUSES = frozenset(["STATUS_DONE_OK", "STATUS_DONE_NOT_OK", "STATUS_REPLACED"])
+STATUS_TTL_SECONDS = 2
+REFRESH_INTERVAL_SECONDS = 0.5
+REFRESH_BATCH_SIZE = 16
+# a task no asset has picked up after this long is given up on, so its pair can be tasked again
+CREATED_TIMEOUT_SECONDS = 300
+# consecutive failed status lookups after which a task is given up on, failed lookups are retried after the TTL
+MAX_REFRESH_ERRORS = 30
+
+
+class TaskMonitor:
+    def __init__(self, logger: Logger, tasker: Tasker, cache_manager: CacheManager,
+                 status_ttl_seconds: float = STATUS_TTL_SECONDS, batch_size: int = REFRESH_BATCH_SIZE,
+                 created_timeout_seconds: float = CREATED_TIMEOUT_SECONDS,
+                 max_refresh_errors: int = MAX_REFRESH_ERRORS):
+        """
+        Keeps the status of every task created by the arbiter in memory, so the arbitration loop never waits on
+        the task manager. Statuses older than the TTL are refreshed in the background in concurrent batches, and
+        tasks that reach a terminal state are cleared from the cache manager task mappings. Tasks that stay created
+        for too long or whose status cannot be looked up are cleared as well, so they do not block their pair forever.
+
+        Args:
+            logger (Logger): The logger.
+            tasker (Tasker): The tasker used to look up task statuses.
+            cache_manager (CacheManager): The cache manager holding the asset and track task mappings.
+            status_ttl_seconds (float): How long a fetched status is trusted before it is refreshed.
+            batch_size (int): The number of status lookups issued concurrently.
+            created_timeout_seconds (float): How long a task may stay created before it is given up on.
+            max_refresh_errors (int): The number of failed status lookups in a row before a task is given up on.
+        """
+        self.logger = logger
+        self.tasker = tasker
+        self.cache_manager = cache_manager
+        self.status_ttl_seconds = status_ttl_seconds
+        self.batch_size = batch_size
+        self.created_timeout_seconds = created_timeout_seconds
+        self.max_refresh_errors = max_refresh_errors
+        self.statuses = {}
+        self.refreshed_at = {}
+        # when monitoring started for each task, and the failed status lookups in a row of the tasks that have some
+        self.tracked_at = {}
+        self.refresh_errors = {}
+        REGISTRY.gauge("ears_tasks_in_progress", "Tasks created by the arbiter that have not finished.",
+                       function=self.statuses.__len__)
+
+    def track(self, task_id: str, status: str = "STATUS_CREATED"):
+        self.statuses[task_id] = status
+        self.refreshed_at[task_id] = self.tracked_at[task_id] = time.monotonic()
+
+    def restore(self, statuses: dict):
+        """
+        Resume monitoring tasks saved before a restart. Their statuses are refreshed on the next run, tasks that
+        finished in the meantime are cleared then.
+        """
+        now = time.monotonic()
+        for task_id, status in statuses.items():
+            self.statuses[task_id] = status
+            self.refreshed_at[task_id] = float("-inf")
+            self.tracked_at[task_id] = now
+
+    def get_status(self, task_id: str):
+        return self.statuses.get(task_id)
+
+    def is_in_progress(self, task_id: str) -> bool:
+        return task_id in self.statuses and self.statuses[task_id] not in TERMINAL_TASK_STATUSES
+
+    def finish(self, task_id: str, status: str):
+        self.logger.info(f"task {task_id} finished with status {status}")
+        self.statuses.pop(task_id, None)
+        self.refreshed_at.pop(task_id, None)
+        self.tracked_at.pop(task_id, None)
+        self.refresh_errors.pop(task_id, None)
+        self.cache_manager.remove_task(task_id)
+
+    async def refresh_status(self, task_id: str):
+        try:
+            status = await self.tasker.get_task_status(task_id)
+        except Exception as error:
+            if task_id not in self.statuses:
+                return
+            if getattr(error, "status", None) == 404:
+                self.finish(task_id, "STATUS_NOT_FOUND")
+                return
+            errors = self.refresh_errors[task_id] = self.refresh_errors.get(task_id, 0) + 1
+            if errors >= self.max_refresh_errors:
+                self.logger.warning(f"task {task_id} status failed to refresh {errors} times, giving up on it")
+                self.finish(task_id, "STATUS_UNREACHABLE")
+                return
+            self.refreshed_at[task_id] = time.monotonic()
+            return
+        if task_id not in self.statuses:
+            return
+        self.refresh_errors.pop(task_id, None)
+        if status in TERMINAL_TASK_STATUSES:
+            self.finish(task_id, status)
+            return
+        now = time.monotonic()
+        if status == "STATUS_CREATED" and now - self.tracked_at[task_id] >= self.created_timeout_seconds:
+            self.logger.warning(f"task {task_id} was not picked up after {self.created_timeout_seconds:.0f}s, "
+                                f"giving up on it")
+            self.finish(task_id, "STATUS_TIMED_OUT")
+            return
+        self.statuses[task_id] = status
+        self.refreshed_at[task_id] = now
+
+    async def refresh(self):
+        now = time.monotonic()
+        stale_task_ids = [task_id for task_id, refreshed_at in self.refreshed_at.items()
+                          if now - refreshed_at >= self.status_ttl_seconds]
+        for start in range(0, len(stale_task_ids), self.batch_size):
+            batch = stale_task_ids[start:start + self.batch_size]
+            await asyncio.gather(*(self.refresh_status(task_id) for task_id in batch))
+
+    async def run(self):
+        while True:
+            try:
+                await self.refresh()
+            except Exception as error:
+                self.logger.error(f"task status refresh error {error}")
+            await asyncio.sleep(REFRESH_INTERVAL_SECONDS)
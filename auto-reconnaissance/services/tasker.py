@@ -1,63 +1,198 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime, timezone
 from logging import Logger
 
-import entities_api as anduril_entities
 import tasks_api as anduril_tasks
+from utils.entity_record import EntityRecord
+from utils.metrics import REGISTRY
+from utils.lattice_executor import LatticeExecutor, DEFAULT_LATTICE_SCHEME, DEFAULT_MAX_WORKERS, DEFAULT_TIMEOUT_SECONDS
+
+INVESTIGATE_SPECIFICATION_TYPE = "type.googleapis.com/anduril.tasks.v2.Investigate"
+MAX_TASK_CREATIONS_IN_FLIGHT = 8
+# how long the idempotency key of a pair whose creation failed is kept for a retry of the same pair
+IDEMPOTENCY_KEY_TTL_SECONDS = 300
+# http status of a creation whose task id already exists, a retry of a creation that went through
+TASK_EXISTS_STATUS = 409
+# how many assets keep the entity their investigations are sent with
+MAX_ASSET_ENTITIES = 10000
+
+TASKS_CREATED = REGISTRY.counter("ears_tasks_created_total", "Investigation tasks created.").labels()
+TASK_ERRORS = REGISTRY.counter("ears_task_creation_errors_total",
+                               "Investigation tasks that failed to be created.").labels()
 
 
 class Tasker:
-    def __init__(self, logger: Logger, lattice_ip: str, bearer_token: str):
+    def __init__(self, logger: Logger, lattice_ip: str, bearer_token: str, max_workers: int = DEFAULT_MAX_WORKERS,
+                 timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS, lattice_scheme: str = DEFAULT_LATTICE_SCHEME,
+                 max_in_flight: int = MAX_TASK_CREATIONS_IN_FLIGHT):
+        """
+        Creates investigation tasks in the background. Submitted creations run concurrently up to max_in_flight,
+        and the asset and track of a submitted pair stay reserved until the creation completes, so the next
+        arbitration pass does not assign them again while a slow creation is still in flight.
+
+        Args:
+            logger (Logger): The logger.
+            lattice_ip (str): The lattice dns name or ip.
+            bearer_token (str): The bearer token of the lattice api.
+            max_workers (int): The maximum number of concurrent tasks api calls.
+            timeout_seconds (float): The timeout of a tasks api call.
+            lattice_scheme (str): The url scheme of the lattice api.
+            max_in_flight (int): The maximum number of task creations in flight.
+        """
         self.logger = logger
-        self.config = anduril_tasks.Configuration(host=f"https://{lattice_ip}/api/v1")
+        self.executor = LatticeExecutor("tasks-api", max_workers, timeout_seconds)
+        self.config = self.executor.configure(anduril_tasks.Configuration(
+            host=f"{lattice_scheme}://{lattice_ip}/api/v1"))
         self.api_client = anduril_tasks.ApiClient(configuration=self.config, header_name="Authorization",
                                                   header_value=f"Bearer {bearer_token}")
         self.task_api = anduril_tasks.TaskApi(api_client=self.api_client)
+        self.semaphore = asyncio.Semaphore(max_in_flight)
+        # the parts of a task creation shared by every investigation are built once
+        self.author = anduril_tasks.Principal(system=anduril_tasks.System(service_name="auto-reconnaissance"))
+        # entity ids of the tasked assets mapped to the record and the entity built from it, oldest first
+        self.asset_entities = {}
+        # entity ids of the assets and tracks of the creations in flight mapped to the task id they are created with
+        self.reserved = {}
+        self.in_flight = set()
+        # the idempotency keys of pairs whose creation failed, mapped to their expiry, reused when the pair is retried
+        self.idempotency_keys = {}
+
+    def is_reserved(self, entity_id: str) -> bool:
+        return entity_id in self.reserved
+
+    def submit(self, asset: EntityRecord, track: EntityRecord, on_done, task_id: str = None) -> bool:
+        """
+        Start creating an investigation task for a pair without waiting for it.
+
+        Args:
+            asset (EntityRecord): The asset to task.
+            track (EntityRecord): The track to investigate.
+            on_done: The function called with the asset, the track and the task id once the creation completes, the
+                task id is None if the creation failed.
+            task_id (str): The task id to create the task with, by default the idempotency key of the pair.
+
+        Returns:
+            bool: True if the creation was started, False if the asset or track already has a creation in flight.
+        """
+        if asset.entity_id in self.reserved or track.entity_id in self.reserved:
+            return False
+        task_id = task_id or self.idempotency_key(asset.entity_id, track.entity_id)
+        self.reserved[asset.entity_id] = task_id
+        self.reserved[track.entity_id] = task_id
+        task = asyncio.create_task(self.create(asset, track, on_done, task_id))
+        self.in_flight.add(task)
+        task.add_done_callback(self.in_flight.discard)
+        return True
 
-    def investigate(self, asset: anduril_entities.Entity, track: anduril_entities.Entity) -> str:
+    async def create(self, asset: EntityRecord, track: EntityRecord, on_done, task_id: str):
+        created = None
         try:
-            # we have to convert anduril_entities.Entity to anduril_tasks.Entity to be able to use these instances for task creation
-            tm_asset = anduril_tasks.Entity(**asset.to_dict())
-            tm_track = anduril_tasks.Entity(**track.to_dict())
-
-            display_name = f"Asset {tm_asset.entity_id} -> Track {tm_track.entity_id}"
-            description = f"Asset {tm_asset.entity_id} tasked to perform ISR on Track {tm_track.entity_id}"
-            specification_type = "type.googleapis.com/anduril.tasks.v2.Investigate"
-            specification_properties = {
-                "objective": {
-                    "entity_id": tm_track.entity_id
-                },
-                "parameters": {
-                    "speed_m_s": tm_asset.location.speed_mps
-                }
-            }
-            specification = anduril_tasks.GoogleProtobufAny(type=specification_type,
-                                                            additional_properties=specification_properties)
-            author_user = anduril_tasks.User(user_id="user/some_user")
-            author = anduril_tasks.Principal(system=anduril_tasks.System(service_name="auto-reconnaissance"))
-            relations_assignee_system = anduril_tasks.System(entity_id=tm_asset.entity_id)
-            relations_assignee = anduril_tasks.Principal(system=relations_assignee_system)
-            relations = anduril_tasks.Relations(assignee=relations_assignee)
-            task_entity = anduril_tasks.TaskEntity(entity=tm_asset, snapshot=False)
-
-            task_creation = anduril_tasks.TaskCreation(display_name=display_name,
-                                                       description=description,
-                                                       specification=specification,
-                                                       author=author,
-                                                       relations=relations,
-                                                       is_executed_elsewhere=False,
-                                                       initial_entities=[task_entity])
-            returned_task = self.task_api.create_task(task_creation=task_creation,
-                                                      _content_type="application/json")
-            self.logger.info(f"Task created - view Lattice UI, task id is {returned_task.version.task_id}")
-            return returned_task.version.task_id
+            async with self.semaphore:
+                created = await self.investigate(asset, track, task_id)
         except Exception as e:
-            self.logger.error(f"task creation error {e}")
-            raise e
+            TASK_ERRORS.inc()
+            self.logger.error(f"task creation error for asset {asset.entity_id} and track {track.entity_id}: {e}")
+        finally:
+            self.reserved.pop(asset.entity_id, None)
+            self.reserved.pop(track.entity_id, None)
+        on_done(asset, track, created)
+
+    def idempotency_key(self, asset_id: str, track_id: str) -> str:
+        """
+        Get the task id a creation for the pair is sent with. A pair retried after a failed creation gets the key
+        of that creation, so a creation that timed out on the client but went through on the server is not
+        created twice. Keys of pairs that are not retried expire.
+        """
+        now = time.monotonic()
+        # keys are stored in the order they expire in
+        for pair, (expires_at, _) in list(self.idempotency_keys.items()):
+            if expires_at > now:
+                break
+            del self.idempotency_keys[pair]
+        retried = self.idempotency_keys.get((asset_id, track_id))
+        if retried is not None:
+            return retried[1]
+        return str(uuid.uuid4())
+
+    def asset_entity(self, asset: EntityRecord):
+        """
+        Get the entity an investigation of the asset is sent with. It is built from the cached record once and
+        reused until the record is replaced by an update of the asset.
+        """
+        cached = self.asset_entities.pop(asset.entity_id, None)
+        if cached is not None and cached[0] is asset:
+            entity = cached[1]
+        else:
+            entity = anduril_tasks.Entity(
+                entity_id=asset.entity_id,
+                is_live=True,
+                expiry_time=(datetime.fromtimestamp(asset.expiry_timestamp, timezone.utc)
+                             if asset.expiry_timestamp is not None else None),
+                ontology=anduril_tasks.Ontology(template=asset.template, platform_type=asset.platform_type),
+                location=anduril_tasks.Location(
+                    position=anduril_tasks.Position(latitude_degrees=asset.latitude,
+                                                    longitude_degrees=asset.longitude),
+                    velocity_enu=anduril_tasks.ENU(e=asset.velocity_east_mps, n=asset.velocity_north_mps),
+                    speed_mps=asset.speed_mps),
+                mil_view=anduril_tasks.MilView(disposition=asset.disposition, environment=asset.environment),
+                provenance=anduril_tasks.Provenance(integration_name=asset.integration_name,
+                                                    data_type=asset.data_type,
+                                                    source_id=asset.source_id,
+                                                    source_update_time=datetime.fromtimestamp(asset.observed_at,
+                                                                                              timezone.utc),
+                                                    source_description=asset.source_description))
+        self.asset_entities[asset.entity_id] = (asset, entity)
+        if len(self.asset_entities) > MAX_ASSET_ENTITIES:
+            del self.asset_entities[next(iter(self.asset_entities))]
+        return entity
+
+    def build_task_creation(self, asset: EntityRecord, track: EntityRecord, task_id: str):
+        """
+        Build the creation request of an investigation. Only the fields that differ between investigations are
+        built per task, the asset entity is reused across the investigations of the same record and the track is
+        referenced by its id.
+        """
+        return anduril_tasks.TaskCreation(
+            task_id=task_id,
+            display_name=f"Asset {asset.entity_id} -> Track {track.entity_id}",
+            description=f"Asset {asset.entity_id} tasked to perform ISR on Track {track.entity_id}",
+            specification=anduril_tasks.GoogleProtobufAny(type=INVESTIGATE_SPECIFICATION_TYPE,
+                                                          additional_properties={
+                                                              "objective": {"entity_id": track.entity_id},
+                                                              "parameters": {"speed_m_s": asset.speed_mps},
+                                                          }),
+            author=self.author,
+            relations=anduril_tasks.Relations(
+                assignee=anduril_tasks.Principal(system=anduril_tasks.System(entity_id=asset.entity_id))),
+            is_executed_elsewhere=False,
+            initial_entities=[anduril_tasks.TaskEntity(entity=self.asset_entity(asset), snapshot=False)])
+
+    async def investigate(self, asset: EntityRecord, track: EntityRecord, task_id: str) -> str:
+        pair = (asset.entity_id, track.entity_id)
+        try:
+            returned_task = await self.executor.call(self.task_api.create_task,
+                                                     task_creation=self.build_task_creation(asset, track, task_id),
+                                                     _content_type="application/json")
+            task_id = returned_task.version.task_id
+        except Exception as e:
+            if getattr(e, "status", None) != TASK_EXISTS_STATUS:
+                # keep the key for a retry of the pair, the creation may have gone through on the server
+                self.idempotency_keys.pop(pair, None)
+                self.idempotency_keys[pair] = (time.monotonic() + IDEMPOTENCY_KEY_TTL_SECONDS, task_id)
+                raise e
+            self.logger.info(f"task {task_id} was already created by an earlier attempt")
+        self.idempotency_keys.pop(pair, None)
+        TASKS_CREATED.inc()
+        self.logger.info(f"Task created - view Lattice UI, task id is {task_id}")
+        return task_id
 
-    def check_executing(self, task_id: str) -> bool:
+    async def get_task_status(self, task_id: str) -> str:
         try:
-            returned_task = self.task_api.get_task_by_id(task_id=task_id)
-            self.logger.info(f"Current task status for this task_id is {returned_task.status.status}")
-            return returned_task.status.status == "STATUS_EXECUTING"
+            returned_task = await self.executor.call(self.task_api.get_task_by_id, task_id=task_id)
+            self.logger.debug(f"Current task status for task id {task_id} is {returned_task.status.status}")
+            return returned_task.status.status
         except Exception as e:
-            self.logger.error(f"task creation error {e}")
+            self.logger.error(f"task status error {e}")
             raise e
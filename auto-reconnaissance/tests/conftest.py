@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the services and utils packages are imported relative to the auto-reconnaissance directory, like main.py does
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
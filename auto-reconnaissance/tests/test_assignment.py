@@ -0,0 +1,93 @@
+import itertools
+import random
+
+import numpy as np
+import pytest
+
+from services.assignment import AssignmentEngine, FORBIDDEN_COST, solve_assignment
+from utils.entity_record import EntityRecord
+
+
+def brute_force_cost(cost: np.ndarray) -> float:
+    if cost.shape[0] > cost.shape[1]:
+        cost = cost.T
+    rows, cols = cost.shape
+    return min(sum(cost[row, col] for row, col in zip(range(rows), columns))
+               for columns in itertools.permutations(range(cols), rows))
+
+
+def assert_valid(pairs: list[tuple], shape: tuple):
+    rows = [row for row, _ in pairs]
+    cols = [col for _, col in pairs]
+    assert len(pairs) == min(shape)
+    assert len(set(rows)) == len(rows) and len(set(cols)) == len(cols)
+    assert all(0 <= row < shape[0] and 0 <= col < shape[1] for row, col in pairs)
+
+
+@pytest.mark.parametrize("seed", range(400))
+def test_solve_assignment_matches_brute_force(seed):
+    rng = np.random.default_rng(seed)
+    shape = tuple(rng.integers(1, 7, size=2))
+    cost = rng.integers(0, 20, size=shape).astype(np.float64) if seed % 2 else rng.random(shape) * 100
+    if seed % 5 == 0:
+        cost[rng.random(shape) < 0.4] = FORBIDDEN_COST
+    pairs = solve_assignment(cost)
+    assert_valid(pairs, shape)
+    assert sum(cost[row, col] for row, col in pairs) == pytest.approx(brute_force_cost(cost))
+
+
+def test_solve_assignment_gives_up_after_deadline():
+    assert solve_assignment(np.ones((3, 3)), deadline=0.0) is None
+
+
+def make_pairs(seed: int, assets: int, tracks: int, density: float) -> list[tuple]:
+    rng = random.Random(seed)
+    asset_records = [EntityRecord(f"asset{index}", "TEMPLATE_ASSET", rng.uniform(0, 0.1), rng.uniform(0, 0.1),
+                                  speed_mps=rng.uniform(1, 30)) for index in range(assets)]
+    track_records = [EntityRecord(f"track{index}", "TEMPLATE_TRACK", rng.uniform(0, 0.1), rng.uniform(0, 0.1),
+                                  "DISPOSITION_HOSTILE") for index in range(tracks)]
+    return [(asset, track) for asset in asset_records for track in track_records if rng.random() < density]
+
+
+def brute_force_assignment(engine: AssignmentEngine, candidates: list[tuple]) -> tuple[int, float]:
+    """
+    The largest number of pairs that can be assigned and the lowest total cost among assignments of that size.
+    """
+    costs = dict(zip(candidates, engine.costs(candidates)))
+    best = (0, 0.0)
+    for size in range(1, len(candidates) + 1):
+        found = False
+        for subset in itertools.combinations(candidates, size):
+            if (len({asset.entity_id for asset, _ in subset}) == size and
+                    len({track.entity_id for _, track in subset}) == size):
+                total = sum(costs[pair] for pair in subset)
+                if not found or total < best[1]:
+                    best = (size, total)
+                found = True
+        if not found:
+            break
+    return best
+
+
+@pytest.mark.parametrize("seed", range(60))
+def test_assign_is_optimal_over_candidates(seed):
+    engine = AssignmentEngine(time_budget_seconds=10)
+    candidates = make_pairs(seed, 1 + seed % 4, 1 + seed % 5, 0.6)
+    assigned = engine.assign(candidates)
+    assert len({asset.entity_id for asset, _ in assigned}) == len(assigned)
+    assert len({track.entity_id for _, track in assigned}) == len(assigned)
+    assert set(assigned) <= set(candidates)
+    size, total = brute_force_assignment(engine, candidates)
+    costs = dict(zip(candidates, engine.costs(candidates)))
+    assert len(assigned) == size
+    assert sum(costs[pair] for pair in assigned) == pytest.approx(total)
+
+
+def test_assign_falls_back_to_greedy_when_out_of_budget():
+    engine = AssignmentEngine(time_budget_seconds=-1)
+    candidates = make_pairs(7, 6, 6, 0.8)
+    assigned = engine.assign(candidates)
+    assert engine.stats["greedy_groups"] > 0
+    assert len({asset.entity_id for asset, _ in assigned}) == len(assigned)
+    assert len({track.entity_id for _, track in assigned}) == len(assigned)
+    assert engine.assign(list(reversed(candidates))) == assigned
@@ -0,0 +1,50 @@
+import random
+
+import numpy as np
+import pytest
+from geopy.distance import geodesic
+
+from utils.distance_calculator import DistanceCalculator, HAVERSINE_ERROR_BAND
+
+
+def boundary_pairs(seed: int, count: int) -> tuple:
+    """
+    Place points at a geodesic distance within a few percent of a threshold from random origins, the band where
+    the spherical distance alone gives the wrong answer.
+    """
+    rng = random.Random(seed)
+    origins, destinations, thresholds = [], [], []
+    for _ in range(count):
+        origin = (rng.uniform(-89.9, 89.9), rng.uniform(-180, 180))
+        threshold = rng.choice((0.5, 5.0, 20.0, 150.0))
+        distance = threshold * (1 + rng.uniform(-2, 2) * HAVERSINE_ERROR_BAND)
+        destination = geodesic(miles=distance).destination(origin, rng.uniform(0, 360))
+        origins.append(origin)
+        destinations.append((destination.latitude, destination.longitude))
+        thresholds.append(threshold)
+    return np.array(origins), np.array(destinations), np.array(thresholds)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_within_threshold_matches_geodesic_near_the_boundary(seed):
+    origins, destinations, thresholds = boundary_pairs(seed, 1000)
+    within = DistanceCalculator.within_threshold(origins[:, 0], origins[:, 1], destinations[:, 0],
+                                                 destinations[:, 1], thresholds)
+    expected = [geodesic(tuple(origin), tuple(destination)).miles <= threshold
+                for origin, destination, threshold in zip(origins, destinations, thresholds)]
+    assert within.tolist() == expected
+
+
+def test_within_threshold_broadcasts_one_point_against_many():
+    latitudes = np.array([0.0, 0.0, 0.0, 89.99])
+    longitudes = np.array([0.07, 0.08, -179.99, 0.0])
+    within = DistanceCalculator.within_threshold(0.0, 0.0, latitudes, longitudes, 5)
+    expected = [geodesic((0.0, 0.0), point).miles <= 5 for point in zip(latitudes, longitudes)]
+    assert within.shape == (4,)
+    assert within.tolist() == expected
+
+
+def test_within_threshold_across_the_antimeridian_and_pole():
+    assert DistanceCalculator.within_threshold(10.0, 179.99, 10.0, -179.99, 5.0)
+    assert DistanceCalculator.within_threshold(89.99, 0.0, 89.99, 180.0, 5.0)
+    assert not DistanceCalculator.within_threshold(89.9, 0.0, 89.9, 180.0, 5.0)
@@ -0,0 +1,79 @@
+import random
+
+import pytest
+
+from utils.expiring_cache import ExpiringCache
+
+
+def check_against_model(seed: int, operations: int, capacity: int, tick_seconds: float, wheel_size: int):
+    """
+    Run random puts, removals and clock advances on a cache and on a plain dict of expiries, and compare them after
+    every operation.
+    """
+    rng = random.Random(seed)
+    now = 1000.0 + rng.random()
+    cache = ExpiringCache(capacity, tick_seconds, wheel_size, clock=lambda: now)
+    # keys mapped to their expiry in insertion order, like the cache entries
+    model = {}
+    for _ in range(operations):
+        operation = rng.random()
+        key = f"key{rng.randrange(capacity * 2)}"
+        if operation < 0.55:
+            if rng.random() < 0.1:
+                expires_at = None
+            else:
+                # some entries are already overdue, some expire rotations of the wheel ahead
+                expires_at = now + rng.uniform(-2, wheel_size * tick_seconds * 3)
+            if key not in model and len(model) >= capacity:
+                expiring = {other: expiry for other, expiry in model.items() if expiry is not None}
+                evicted = cache.put(key, expires_at, expires_at)
+                assert len(evicted) == 1
+                if expiring:
+                    assert model[evicted[0]] == min(expiring.values())
+                else:
+                    assert evicted[0] == next(iter(model))
+                del model[evicted[0]]
+            else:
+                assert cache.put(key, expires_at, expires_at) == []
+            model[key] = expires_at
+        elif operation < 0.7:
+            assert cache.remove(key) == (key in model)
+            model.pop(key, None)
+        else:
+            now += rng.uniform(0, wheel_size * tick_seconds * 2) if rng.random() < 0.05 else rng.uniform(0, 3)
+            expired = cache.expire(now)
+            assert len(expired) == len(set(expired))
+            assert set(expired) == {key for key, expiry in model.items() if expiry is not None and expiry <= now}
+            for key in expired:
+                del model[key]
+        assert len(cache) == len(model)
+        assert all(cache.get(key) == expiry for key, expiry in model.items())
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_timing_wheel_matches_model(seed):
+    check_against_model(seed, operations=2000, capacity=50, tick_seconds=1.0, wheel_size=8)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_timing_wheel_with_fractional_ticks(seed):
+    check_against_model(seed, operations=2000, capacity=20, tick_seconds=0.25, wheel_size=16)
+
+
+def test_entries_without_expiry_are_never_expired():
+    cache = ExpiringCache(10, clock=lambda: 0.0)
+    cache.put("forever", 1)
+    cache.put("soon", 2, 5.0)
+    assert cache.expire(1e9) == ["soon"]
+    assert "forever" in cache
+    assert cache.evictions == {"expired": 1, "capacity": 0, "removed": 0}
+
+
+def test_updates_do_not_grow_the_expiry_heap():
+    cache = ExpiringCache(3, clock=lambda: 0.0)
+    for update in range(1000):
+        cache.put("updated", update, 1000.0 + update)
+    cache.put("soon", 0, 10.0)
+    cache.put("later", 0, 5000.0)
+    assert len(cache.heap) <= 2 * 3 + 1
+    assert cache.put("new", 0, 20.0) == ["soon"]
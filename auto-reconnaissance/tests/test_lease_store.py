@@ -0,0 +1,101 @@
+import pytest
+
+from utils.lease_store import LeaseStore
+
+TTL_SECONDS = 5
+NOW = 1_000_000.0
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = LeaseStore(str(tmp_path / "leases.db"))
+    yield store
+    store.close()
+
+
+def claims(store: LeaseStore) -> dict:
+    rows = store.connection.execute("SELECT entity_id, kind, owner, task_id, expires_at FROM claims")
+    return {entity_id: (kind, owner, task_id, expires_at) for entity_id, kind, owner, task_id, expires_at in rows}
+
+
+def test_heartbeat_lists_live_instances(store):
+    assert store.heartbeat("a", TTL_SECONDS, NOW) == ["a"]
+    assert store.heartbeat("b", TTL_SECONDS, NOW + 1) == ["a", "b"]
+    assert store.heartbeat("b", TTL_SECONDS, NOW + TTL_SECONDS) == ["b"]
+
+
+def test_leases_are_exclusive_until_they_expire(store):
+    assert store.acquire("a", {0, 1, 2}, TTL_SECONDS, NOW) == {0, 1, 2}
+    assert store.acquire("b", {2, 3}, TTL_SECONDS, NOW + 1) == {3}
+    # leases outside the wanted partitions are released
+    assert store.acquire("a", {0, 1}, TTL_SECONDS, NOW + 1) == {0, 1}
+    assert store.acquire("b", {2, 3}, TTL_SECONDS, NOW + 2) == {2, 3}
+    # a dead instance stops renewing, its leases go to whoever asks once they expired
+    assert store.acquire("b", {0, 1, 2, 3}, TTL_SECONDS, NOW + 1 + TTL_SECONDS) == {0, 1, 2, 3}
+
+
+def test_claim_records_the_task_id_of_each_entity(store):
+    granted = store.claim("a", [("asset1", "track1", "task1")], TTL_SECONDS, NOW)
+    assert granted == [("asset1", "track1", "task1")]
+    assert claims(store) == {"asset1": ("asset", "a", "task1", NOW + TTL_SECONDS),
+                             "track1": ("track", "a", "task1", NOW + TTL_SECONDS)}
+
+
+def test_claim_is_blocked_by_another_instance(store):
+    store.claim("a", [("asset1", "track1", "task1")], TTL_SECONDS, NOW)
+    assert store.claim("b", [("asset1", "track2", "task2")], TTL_SECONDS, NOW) == []
+    assert store.claim("b", [("asset2", "track1", "task2")], TTL_SECONDS, NOW) == []
+    assert store.claim("b", [("asset2", "track2", "task2")], TTL_SECONDS, NOW) == [("asset2", "track2", "task2")]
+    # an expired claim that was not adopted still blocks, only adoption frees it
+    assert store.claim("b", [("asset1", "track3", "task3")], TTL_SECONDS, NOW + TTL_SECONDS * 10) == []
+
+
+def test_own_claims_do_not_block_a_new_claim(store):
+    store.claim("a", [("asset1", "track1", "task1")], TTL_SECONDS, NOW)
+    store.sync_claims("a", {"asset1": ("asset", "task1"), "track1": ("track", "task1")}, TTL_SECONDS, NOW + 1)
+    # the investigation finished but the claims are only dropped on the next sync
+    assert store.claim("a", [("asset1", "track1", "task2")], TTL_SECONDS, NOW + 2) == [("asset1", "track1", "task2")]
+    assert claims(store)["asset1"][2] == "task2"
+    assert store.claim("b", [("asset1", "track1", "task3")], TTL_SECONDS, NOW + 2) == []
+
+
+def test_sync_claims_drops_finished_and_extends_held_claims(store):
+    store.claim("a", [("asset1", "track1", "task1"), ("asset2", "track2", "task2")], TTL_SECONDS, NOW)
+    store.claim("b", [("asset3", "track3", "task3")], TTL_SECONDS, NOW)
+    held = {"asset1": ("asset", "task1"), "track1": ("track", "task1"),
+            # restored from a snapshot, claimed when free
+            "asset4": ("asset", "task4"), "track4": ("track", "task4"),
+            # claimed by another instance, left alone
+            "asset3": ("asset", "task5")}
+    store.sync_claims("a", held, TTL_SECONDS, NOW + 1)
+    assert claims(store) == {"asset1": ("asset", "a", "task1", NOW + 1 + TTL_SECONDS),
+                             "track1": ("track", "a", "task1", NOW + 1 + TTL_SECONDS),
+                             "asset3": ("asset", "b", "task3", NOW + TTL_SECONDS),
+                             "track3": ("track", "b", "task3", NOW + TTL_SECONDS),
+                             "asset4": ("asset", "a", "task4", NOW + 1 + TTL_SECONDS),
+                             "track4": ("track", "a", "task4", NOW + 1 + TTL_SECONDS)}
+
+
+def test_claims_of_a_dead_instance_are_adoptable_before_its_task_exists(store):
+    # the instance claimed the pair and died before creating the task or syncing its claims
+    store.claim("a", [("asset1", "track1", "task1"), ("asset2", "track2", "task2")], TTL_SECONDS, NOW)
+    assert store.adopt_claims("b", lambda asset_id: True, TTL_SECONDS, NOW + 1) == []
+    adopted = store.adopt_claims("b", lambda asset_id: asset_id == "asset1", TTL_SECONDS, NOW + TTL_SECONDS)
+    assert sorted(adopted) == [("asset", "asset1", "task1"), ("track", "track1", "task1")]
+    rows = claims(store)
+    assert rows["asset1"] == ("asset", "b", "task1", NOW + 2 * TTL_SECONDS)
+    assert rows["track1"] == ("track", "b", "task1", NOW + 2 * TTL_SECONDS)
+    # the asset in a partition the instance does not hold stays with the dead instance
+    assert rows["asset2"][1] == "a" and rows["track2"][1] == "a"
+    assert store.claim("a", [("asset1", "track5", "task5")], TTL_SECONDS, NOW + TTL_SECONDS) == []
+
+
+def test_release_expires_claims_right_away(store):
+    store.heartbeat("a", TTL_SECONDS, NOW)
+    store.acquire("a", {0}, TTL_SECONDS, NOW)
+    store.claim("a", [("asset1", "track1", "task1")], TTL_SECONDS, NOW)
+    store.release("a", NOW + 1)
+    assert store.heartbeat("b", TTL_SECONDS, NOW + 1) == ["b"]
+    assert store.acquire("b", {0}, TTL_SECONDS, NOW + 1) == {0}
+    assert sorted(store.adopt_claims("b", lambda asset_id: True, TTL_SECONDS, NOW + 1)) == [
+        ("asset", "asset1", "task1"), ("track", "track1", "task1")]
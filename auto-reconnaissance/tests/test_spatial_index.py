@@ -0,0 +1,103 @@
+import random
+
+import numpy as np
+import pytest
+from geopy.distance import geodesic
+
+from utils.distance_calculator import DistanceCalculator
+from utils.spatial_index import RadiusBucketIndex, SpatialIndex
+
+# regions where the grid wraps or its cells shrink to slivers
+REGIONS = {
+    "anywhere": ((-90.0, 90.0), (-180.0, 180.0)),
+    "north_pole": ((88.5, 90.0), (-180.0, 180.0)),
+    "south_pole": ((-90.0, -88.5), (-180.0, 180.0)),
+    "antimeridian": ((-60.0, 60.0), (178.5, 181.5)),
+}
+
+
+def random_point(rng: random.Random, region: str) -> tuple:
+    (min_lat, max_lat), (min_lon, max_lon) = REGIONS[region]
+    longitude = rng.uniform(min_lon, max_lon)
+    # wrap into [-180, 180), points straddle the antimeridian from both sides
+    return rng.uniform(min_lat, max_lat), (longitude + 180) % 360 - 180
+
+
+def keys_within(center: tuple, points: dict, radii_miles: dict) -> set:
+    """
+    Find the keys whose WGS84 geodesic distance from a point is within their radius. Only the keys the spherical
+    distance puts near their radius are measured on the ellipsoid, the two differ by less than 1%.
+    """
+    keys = list(points)
+    latitudes, longitudes = np.array([points[key] for key in keys]).T
+    radii = np.array([radii_miles[key] for key in keys])
+    approximate = DistanceCalculator.haversine(np.full(len(keys), center[0]), np.full(len(keys), center[1]),
+                                               latitudes, longitudes)
+    return {keys[index] for index in np.flatnonzero(approximate <= radii * 1.01)
+            if geodesic(center, points[keys[index]]).miles <= radii[index]}
+
+
+@pytest.mark.parametrize("region", REGIONS)
+@pytest.mark.parametrize("seed", range(3))
+def test_query_returns_every_point_within_radius(region, seed):
+    rng = random.Random(seed)
+    index = SpatialIndex(cell_size_degrees=rng.choice((0.05, 0.1, 0.5)))
+    points = {f"key{number}": random_point(rng, region) for number in range(300)}
+    for key, (latitude, longitude) in points.items():
+        index.update(key, latitude, longitude)
+    # move and remove some keys, the index has to follow
+    for key in rng.sample(sorted(points), 60):
+        points[key] = random_point(rng, region)
+        index.update(key, *points[key])
+    for key in rng.sample(sorted(points), 30):
+        index.remove(key)
+        del points[key]
+    assert len(index) == len(points)
+    for _ in range(40):
+        center = random_point(rng, region)
+        radius_miles = rng.choice((0.5, 5.0, 25.0, 120.0))
+        candidates = index.query(*center, radius_miles)
+        assert len(candidates) == len(set(candidates))
+        expected = keys_within(center, points, dict.fromkeys(points, radius_miles))
+        assert expected <= set(candidates)
+
+
+def test_query_at_the_pole_covers_every_longitude():
+    index = SpatialIndex()
+    index.update("far_side", 89.99, 179.9)
+    index.update("near_side", 89.99, 0.1)
+    assert set(index.query(90.0, 0.0, 5)) == {"far_side", "near_side"}
+
+
+def test_query_wraps_across_the_antimeridian():
+    index = SpatialIndex()
+    index.update("east", 10.0, 179.99)
+    index.update("west", 10.0, -179.99)
+    assert set(index.query(10.0, 179.99, 5)) == {"east", "west"}
+    assert set(index.query(10.0, -179.99, 5)) == {"east", "west"}
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_radius_buckets_return_every_key_reaching_a_point(seed):
+    rng = random.Random(seed)
+    index = RadiusBucketIndex()
+    points = {}
+    for number in range(200):
+        region = rng.choice(sorted(REGIONS))
+        points[f"key{number}"] = (random_point(rng, region), rng.choice((1.0, 5.0, 30.0)))
+    for key, (point, radius_miles) in points.items():
+        index.update(key, *point, radius_miles)
+    # a key whose radius changes moves to another bucket
+    for key in rng.sample(sorted(points), 40):
+        point, _ = points[key]
+        points[key] = (point, rng.choice((1.0, 5.0, 30.0)))
+        index.update(key, *point, points[key][1])
+    assert len(index) == len(points)
+    for _ in range(60):
+        center = random_point(rng, rng.choice(sorted(REGIONS)))
+        margin_miles = rng.choice((0.0, 2.0))
+        candidates = index.query(*center, margin_miles)
+        assert len(candidates) == len(set(candidates))
+        expected = keys_within(center, {key: point for key, (point, _) in points.items()},
+                               {key: radius_miles + margin_miles for key, (_, radius_miles) in points.items()})
+        assert expected <= set(candidates)
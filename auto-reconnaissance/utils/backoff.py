@@ -0,0 +1,30 @@
+import random
+
+
+class Backoff:
+    def __init__(self, base_seconds: float = 0.5, max_seconds: float = 30, multiplier: float = 2):
+        """
+        Exponential backoff with full jitter: the n-th delay is drawn uniformly between zero and
+        min(max_seconds, base_seconds * multiplier ** n), which spreads out retries of many concurrent callers.
+
+        Args:
+            base_seconds (float): The upper bound of the first delay.
+            max_seconds (float): The cap on the upper bound of any delay.
+            multiplier (float): The growth factor of the upper bound per attempt.
+        """
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.multiplier = multiplier
+        self.attempts = 0
+
+    def delay(self, attempt: int) -> float:
+        ceiling = min(self.max_seconds, self.base_seconds * self.multiplier ** attempt)
+        return random.uniform(0, ceiling)
+
+    def next_delay(self) -> float:
+        delay = self.delay(self.attempts)
+        self.attempts += 1
+        return delay
+
+    def reset(self):
+        self.attempts = 0
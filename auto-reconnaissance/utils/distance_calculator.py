@@ -1,6 +1,12 @@
 import entities_api as anduril_entities
+import numpy as np
 from geopy.distance import geodesic
 
+EARTH_MEAN_RADIUS_MILES = 3958.7613
+# the spherical haversine distance differs from the WGS84 geodesic by at most ~0.56%, pairs closer than this
+# relative band to the threshold are refined with the exact geodesic
+HAVERSINE_ERROR_BAND = 0.01
+
 
 class DistanceCalculator:
     @staticmethod
@@ -20,3 +26,58 @@ class DistanceCalculator:
         point2 = (track.location.position.latitude_degrees, track.location.position.longitude_degrees)
         distance = geodesic(point1, point2).miles
         return distance
+
+    @staticmethod
+    def haversine(latitudes1, longitudes1, latitudes2, longitudes2) -> np.ndarray:
+        """
+        Calculate the great-circle distance in miles between coordinates on a spherical Earth in one NumPy pass.
+        Scalars and arrays broadcast against each other, so one point can be compared against many.
+
+        Args:
+            latitudes1: The latitudes of the first points in degrees.
+            longitudes1: The longitudes of the first points in degrees.
+            latitudes2: The latitudes of the second points in degrees.
+            longitudes2: The longitudes of the second points in degrees.
+
+        Returns:
+            np.ndarray: The approximate distances in miles.
+        """
+        lat1 = np.radians(latitudes1)
+        lat2 = np.radians(latitudes2)
+        half_dlat = (lat2 - lat1) / 2
+        half_dlon = np.radians(np.subtract(longitudes2, longitudes1)) / 2
+        h = np.sin(half_dlat) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(half_dlon) ** 2
+        return 2 * EARTH_MEAN_RADIUS_MILES * np.arcsin(np.sqrt(np.clip(h, 0.0, 1.0)))
+
+    @staticmethod
+    def within_threshold(latitudes1, longitudes1, latitudes2, longitudes2, threshold_miles) -> np.ndarray:
+        """
+        Determine which coordinate pairs lie within a distance threshold. The haversine distance accepts or rejects
+        every pair that is clearly inside or outside the threshold, and only the pairs within the error band around
+        the threshold are refined with the exact geodesic, so the answer matches DistanceCalculator.calculate.
+
+        Args:
+            latitudes1: The latitudes of the first points in degrees, a scalar or an array.
+            longitudes1: The longitudes of the first points in degrees, a scalar or an array.
+            latitudes2: The latitudes of the second points in degrees, a scalar or an array.
+            longitudes2: The longitudes of the second points in degrees, a scalar or an array.
+            threshold_miles: The distance threshold in miles, a scalar or an array of per-pair thresholds.
+
+        Returns:
+            np.ndarray: A boolean mask, True where the pair is within the threshold.
+        """
+        lat1, lon1, lat2, lon2, threshold = np.broadcast_arrays(np.asarray(latitudes1, dtype=np.float64),
+                                                                np.asarray(longitudes1, dtype=np.float64),
+                                                                np.asarray(latitudes2, dtype=np.float64),
+                                                                np.asarray(longitudes2, dtype=np.float64),
+                                                                np.asarray(threshold_miles, dtype=np.float64))
+        shape = lat1.shape
+        lat1, lon1, lat2, lon2, threshold = lat1.ravel(), lon1.ravel(), lat2.ravel(), lon2.ravel(), threshold.ravel()
+        approximate = DistanceCalculator.haversine(lat1, lon1, lat2, lon2)
+        within = approximate <= threshold * (1 - HAVERSINE_ERROR_BAND)
+        uncertain = np.flatnonzero((approximate <= threshold * (1 + HAVERSINE_ERROR_BAND)) & ~within)
+        for i in uncertain:
+            point1 = (float(lat1[i]), float(lon1[i]))
+            point2 = (float(lat2[i]), float(lon2[i]))
+            within[i] = geodesic(point1, point2).miles <= threshold[i]
+        return within.reshape(shape)
@@ -0,0 +1,118 @@
+import numpy as np
+
+from utils.entity_record import EntityRecord
+from utils.track_store import DISPOSITIONS, DISPOSITION_CODES, ENVIRONMENTS, ENVIRONMENT_CODES, TrackStore
+
+DISTANCE_THRESHOLD_MILES = 5
+NON_ENGAGEABLE_DISPOSITIONS = ("DISPOSITION_FRIENDLY", "DISPOSITION_ASSUMED_FRIENDLY")
+DEFAULT_RULE = 0
+
+
+def code_table(names, codes: dict, kind: str) -> np.ndarray:
+    """
+    Build a lookup table indexed by enum code that is True for the given names. Unlike the track store, which codes
+    an unknown name as unknown, an unknown name is an error here, a typo in the rules would otherwise silently
+    exclude nothing.
+
+    Raises:
+        ValueError: If a name is not a known value of the enum.
+    """
+    table = np.zeros(len(codes), dtype=bool)
+    for name in names or ():
+        if name not in codes:
+            raise ValueError(f"unknown {kind} {name} in engagement rules")
+        table[codes[name]] = True
+    return table
+
+
+class EngagementRules:
+    def __init__(self, radius_miles: float = DISTANCE_THRESHOLD_MILES,
+                 excluded_dispositions=NON_ENGAGEABLE_DISPOSITIONS, excluded_environments=(),
+                 platforms: dict = None):
+        """
+        The rules deciding which asset-track pairs are engaged, compiled into lookup tables so the arbitration loop
+        applies any number of rules with a few NumPy indexing operations. Every rule gets a row in a radius column
+        and in a disposition table and an environment table indexed by rule and enum code. Assets select their rule
+        by platform type, platform types without a rule of their own use the default rule.
+
+        Args:
+            radius_miles (float): The engagement radius of the default rule in miles.
+            excluded_dispositions: The track dispositions the default rule never engages.
+            excluded_environments: The track environments the default rule never engages.
+            platforms (dict): Platform types mapped to their rule, a dict with any of the radius-miles,
+                excluded-dispositions and excluded-environments keys, missing keys fall back to the default rule.
+        """
+        rules = [(radius_miles, excluded_dispositions, excluded_environments)]
+        self.platform_rules = {}
+        for platform_type, rule in (platforms or {}).items():
+            rule = rule or {}
+            self.platform_rules[platform_type] = len(rules)
+            rules.append((rule.get("radius-miles", radius_miles),
+                          rule.get("excluded-dispositions", excluded_dispositions),
+                          rule.get("excluded-environments", excluded_environments)))
+        self.radii_miles = np.array([float(radius) for radius, _, _ in rules])
+        if (self.radii_miles <= 0).any():
+            raise ValueError("engagement radius must be positive")
+        self.excluded_dispositions = np.stack([code_table(dispositions, DISPOSITION_CODES, "disposition")
+                                               for _, dispositions, _ in rules])
+        self.excluded_environments = np.stack([code_table(environments, ENVIRONMENT_CODES, "environment")
+                                               for _, _, environments in rules])
+        # assets are indexed per distinct radius, so a track only looks for the assets whose radius reaches it
+        self.radius_buckets = tuple(sorted(set(self.radii_miles.tolist())))
+        self.max_radius_miles = self.radius_buckets[-1]
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> "EngagementRules":
+        """
+        Compile the engagement-rules section of the configuration.
+
+        Args:
+            cfg (dict): The section, None for the default rules.
+
+        Returns:
+            EngagementRules: The compiled rules.
+
+        Raises:
+            ValueError: If a rule names an unknown disposition or environment or has a radius that is not positive.
+        """
+        cfg = cfg or {}
+        return cls(radius_miles=cfg.get("radius-miles", DISTANCE_THRESHOLD_MILES),
+                   excluded_dispositions=cfg.get("excluded-dispositions", NON_ENGAGEABLE_DISPOSITIONS),
+                   excluded_environments=cfg.get("excluded-environments", ()),
+                   platforms=cfg.get("platforms"))
+
+    def __len__(self) -> int:
+        return len(self.radii_miles)
+
+    def rule_of(self, asset: EntityRecord) -> int:
+        return self.platform_rules.get(asset.platform_type, DEFAULT_RULE)
+
+    def radius_of(self, asset: EntityRecord) -> float:
+        return float(self.radii_miles[self.rule_of(asset)])
+
+    def rules_of(self, assets: list[EntityRecord]) -> np.ndarray:
+        platform_rules = self.platform_rules
+        return np.fromiter((platform_rules.get(asset.platform_type, DEFAULT_RULE) for asset in assets),
+                           dtype=np.intp, count=len(assets))
+
+    def engageable(self, rules: np.ndarray, track_store: TrackStore, rows: np.ndarray) -> np.ndarray:
+        """
+        Test the tracks of asset-track pairs against the rules of their assets.
+
+        Args:
+            rules (np.ndarray): The rule of the asset of each pair, or one rule for every pair.
+            track_store (TrackStore): The store holding the tracks.
+            rows (np.ndarray): The track store row of the track of each pair.
+
+        Returns:
+            np.ndarray: A boolean mask, True where the rule of the asset engages the track.
+        """
+        return ~(self.excluded_dispositions[rules, track_store.dispositions[rows]] |
+                 self.excluded_environments[rules, track_store.environments[rows]])
+
+    def describe(self) -> list[str]:
+        names = {index: platform_type for platform_type, index in self.platform_rules.items()}
+        return [f"{names.get(index, 'default')}: {self.radii_miles[index]:g} miles, excluding "
+                f"{[DISPOSITIONS[code] for code in np.flatnonzero(self.excluded_dispositions[index])]} and "
+                f"{[ENVIRONMENTS[code] for code in np.flatnonzero(self.excluded_environments[index])]}"
+                for index in range(len(self))]
@@ -0,0 +1,75 @@
+try:
+    # orjson decodes several times faster than the standard library, it is optional
+    from orjson import loads
+except ImportError:
+    from json import loads
+
+import entities_api as anduril_entities
+from utils.entity_record import EntityRecord, EntityRecordEvent
+
+DELETED_EVENT_TYPE = "EVENT_TYPE_DELETED"
+
+
+def accepts_entity(template: str, disposition: str) -> bool:
+    """
+    Whether EARS keeps an entity: every asset, and every track that is not friendly.
+    """
+    if template == "TEMPLATE_ASSET":
+        return True
+    return template == "TEMPLATE_TRACK" and disposition != "DISPOSITION_FRIENDLY"
+
+
+def read_payload(response) -> bytes:
+    """
+    Read the body of a response requested without preloaded content and release its connection to the pool.
+    The SDK only checks the status when it deserializes the body itself, so error statuses are raised here.
+
+    Raises:
+        ApiException: If the response has an error status.
+    """
+    try:
+        payload = response.data
+    finally:
+        response.release_conn()
+    if not 200 <= response.status <= 299:
+        error = anduril_entities.ApiException(status=response.status, reason=response.reason,
+                                              body=payload.decode(errors="replace"))
+        error.headers = response.headers
+        raise error
+    return payload
+
+
+def decode_entity_events(payload: bytes) -> tuple[str, list[EntityRecordEvent], int]:
+    """
+    Decode a long poll response body into records. The template and disposition of each entity are checked before
+    anything else is read, and only the fields of the record are extracted from the entities that pass, so the
+    entities EARS ignores cost little more than the JSON parse.
+
+    Args:
+        payload (bytes): The JSON body of the long poll response.
+
+    Returns:
+        tuple[str, list[EntityRecordEvent], int]: The session token, the delete events, the events of the
+        entities that pass the filter and removals of the friendly tracks, and the number of events in the response
+        before filtering.
+    """
+    response = loads(payload) or {}
+    raw_events = response.get("entityEvents") or ()
+    events = []
+    for raw_event in raw_events:
+        entity = raw_event.get("entity") or {}
+        event_type = raw_event.get("eventType")
+        if event_type == DELETED_EVENT_TYPE:
+            events.append(EntityRecordEvent(event_type, entity.get("entityId"), False))
+            continue
+        template = (entity.get("ontology") or {}).get("template")
+        if not accepts_entity(template, (entity.get("milView") or {}).get("disposition")):
+            if template == "TEMPLATE_TRACK":
+                # a cached track that turned friendly is removed, it must not stay engageable
+                events.append(EntityRecordEvent(event_type, entity.get("entityId"), entity.get("isLive") is not False))
+            continue
+        if entity.get("isLive") is False:
+            events.append(EntityRecordEvent(event_type, entity.get("entityId"), False))
+            continue
+        events.append(EntityRecordEvent(event_type, entity.get("entityId"), True, EntityRecord.from_json(entity)))
+    return response.get("sessionToken") or "", events, len(raw_events)
@@ -0,0 +1,134 @@
+import re
+import time
+from datetime import datetime
+
+import entities_api as anduril_entities
+
+# the fraction of seconds of an RFC 3339 time, which has any number of digits
+FRACTION_PATTERN = re.compile(r"\.(\d+)")
+
+
+def parse_timestamp(value: str):
+    """
+    Convert an RFC 3339 time of the Lattice JSON API to a unix timestamp. Before Python 3.11 fromisoformat takes
+    neither a Z offset nor fractions of other than 3 or 6 digits, so the offset is spelled out and the fraction is
+    padded or truncated to microseconds first.
+    """
+    if not value:
+        return None
+    if value[-1] in "Zz":
+        value = value[:-1] + "+00:00"
+    value = FRACTION_PATTERN.sub(lambda match: "." + match.group(1)[:6].ljust(6, "0"), value, count=1)
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+class EntityRecord:
+    """
+    The compact form of an entity kept in the cache. It holds only the fields read by arbitration, disposition
+    overrides and task creation. The velocity and the time the record was observed let its position be
+    extrapolated, the platform type selects the engagement rule of an asset.
+    """
+    __slots__ = ("entity_id", "template", "latitude", "longitude", "disposition", "environment", "speed_mps",
+                 "expiry_timestamp", "integration_name", "data_type", "source_id", "source_description",
+                 "velocity_east_mps", "velocity_north_mps", "observed_at", "platform_type")
+
+    def __init__(self, entity_id: str, template: str, latitude: float, longitude: float, disposition: str = None,
+                 environment: str = None, speed_mps: float = None, expiry_timestamp: float = None,
+                 integration_name: str = None, data_type: str = None, source_id: str = None,
+                 source_description: str = None, velocity_east_mps: float = 0.0, velocity_north_mps: float = 0.0,
+                 observed_at: float = None, platform_type: str = None):
+        self.entity_id = entity_id
+        self.template = template
+        self.latitude = latitude
+        self.longitude = longitude
+        self.disposition = disposition
+        self.environment = environment
+        self.speed_mps = speed_mps
+        self.expiry_timestamp = expiry_timestamp
+        self.integration_name = integration_name
+        self.data_type = data_type
+        self.source_id = source_id
+        self.source_description = source_description
+        self.velocity_east_mps = velocity_east_mps
+        self.velocity_north_mps = velocity_north_mps
+        self.observed_at = time.time() if observed_at is None else observed_at
+        self.platform_type = platform_type
+
+    def __repr__(self):
+        return f"EntityRecord({self.entity_id!r}, {self.template!r}, {self.latitude}, {self.longitude})"
+
+    @classmethod
+    def from_entity(cls, entity: anduril_entities.Entity) -> "EntityRecord":
+        location = entity.location
+        mil_view = entity.mil_view
+        provenance = entity.provenance
+        velocity = location.velocity_enu
+        return cls(entity_id=entity.entity_id,
+                   template=entity.ontology.template,
+                   latitude=location.position.latitude_degrees,
+                   longitude=location.position.longitude_degrees,
+                   disposition=mil_view.disposition if mil_view else None,
+                   environment=mil_view.environment if mil_view else None,
+                   speed_mps=location.speed_mps,
+                   expiry_timestamp=entity.expiry_time.timestamp() if entity.expiry_time else None,
+                   integration_name=provenance.integration_name if provenance else None,
+                   data_type=provenance.data_type if provenance else None,
+                   source_id=provenance.source_id if provenance else None,
+                   source_description=provenance.source_description if provenance else None,
+                   velocity_east_mps=(velocity.e or 0.0) if velocity else 0.0,
+                   velocity_north_mps=(velocity.n or 0.0) if velocity else 0.0,
+                   platform_type=entity.ontology.platform_type)
+
+    @classmethod
+    def from_json(cls, entity: dict) -> "EntityRecord":
+        """
+        Build a record straight from the decoded JSON of an entity, reading only the fields the record holds
+        instead of materializing the whole SDK model first. Field names are the camelCase names of the JSON API.
+
+        Args:
+            entity (dict): The decoded JSON of the entity.
+
+        Returns:
+            EntityRecord: The record of the entity.
+        """
+        location = entity.get("location") or {}
+        position = location.get("position") or {}
+        velocity = location.get("velocityEnu") or {}
+        mil_view = entity.get("milView") or {}
+        provenance = entity.get("provenance") or {}
+        ontology = entity.get("ontology") or {}
+        return cls(entity_id=entity.get("entityId"),
+                   template=ontology.get("template"),
+                   latitude=position.get("latitudeDegrees"),
+                   longitude=position.get("longitudeDegrees"),
+                   disposition=mil_view.get("disposition"),
+                   environment=mil_view.get("environment"),
+                   speed_mps=location.get("speedMps"),
+                   expiry_timestamp=parse_timestamp(entity.get("expiryTime")),
+                   integration_name=provenance.get("integrationName"),
+                   data_type=provenance.get("dataType"),
+                   source_id=provenance.get("sourceId"),
+                   source_description=provenance.get("sourceDescription"),
+                   velocity_east_mps=velocity.get("e") or 0.0,
+                   velocity_north_mps=velocity.get("n") or 0.0,
+                   platform_type=ontology.get("platformType"))
+
+
+class EntityRecordEvent:
+    """
+    A decoded entity event. Delete events, entities that are no longer live and friendly tracks carry no record, the
+    entity is removed from the cache.
+    """
+    __slots__ = ("event_type", "entity_id", "is_live", "record")
+
+    def __init__(self, event_type: str, entity_id: str, is_live: bool = True, record: EntityRecord = None):
+        self.event_type = event_type
+        self.entity_id = entity_id
+        self.is_live = is_live
+        self.record = record
+
+    def __repr__(self):
+        return f"EntityRecordEvent({self.event_type!r}, {self.entity_id!r})"
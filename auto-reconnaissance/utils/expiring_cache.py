@@ -0,0 +1,142 @@
+import heapq
+import time
+from itertools import count
+
+DEFAULT_TICK_SECONDS = 1.0
+DEFAULT_WHEEL_SIZE = 512
+
+
+class ExpiringCache:
+    def __init__(self, capacity: int, tick_seconds: float = DEFAULT_TICK_SECONDS, wheel_size: int = DEFAULT_WHEEL_SIZE,
+                 clock=time.time):
+        """
+        A cache whose entries are evicted at their expiry time through a hashed timing wheel. Every entry sits in the
+        wheel slot of its expiry tick, so advancing the wheel only visits the slots that elapsed. Entries expiring more
+        than one rotation ahead stay in their slot and are skipped until their rotation comes around. When the cache is
+        full, the entry closest to its expiry makes room. It is found through a min-heap of the expiries whose entries
+        are dropped lazily once their key is updated or evicted, so inserts and updates are O(log n), removals are O(1)
+        and making room is O(log n).
+
+        Args:
+            capacity (int): The maximum number of entries.
+            tick_seconds (float): The time covered by one wheel slot in seconds.
+            wheel_size (int): The number of wheel slots.
+            clock: The function returning the current time as a unix timestamp.
+        """
+        self.capacity = capacity
+        self.tick_seconds = tick_seconds
+        self.wheel_size = wheel_size
+        self.clock = clock
+        self.entries = {}
+        self.expiries = {}
+        self.key_slots = {}
+        self.slots = [set() for _ in range(wheel_size)]
+        # expiry, sequence and key of every scheduled entry, entries whose sequence is no longer current are stale
+        self.heap = []
+        self.sequences = {}
+        self.sequence = count()
+        self.current_tick = int(clock() // tick_seconds)
+        self.evictions = {"expired": 0, "capacity": 0, "removed": 0}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def values(self):
+        return self.entries.values()
+
+    def put(self, key, value, expires_at: float = None) -> list:
+        """
+        Insert or update an entry.
+
+        Args:
+            key: The key of the entry.
+            value: The value of the entry.
+            expires_at (float): The unix timestamp the entry expires at, or None if it never expires.
+
+        Returns:
+            list: The keys evicted to make room for the entry.
+        """
+        evicted = []
+        if key in self.entries:
+            self._unschedule(key)
+        else:
+            while len(self.entries) >= self.capacity:
+                victim = self._soonest_expiring()
+                self._evict(victim)
+                self.evictions["capacity"] += 1
+                evicted.append(victim)
+        self.entries[key] = value
+        if expires_at is not None:
+            self.expiries[key] = expires_at
+            tick = max(int(expires_at // self.tick_seconds), self.current_tick)
+            slot_index = tick % self.wheel_size
+            self.slots[slot_index].add(key)
+            self.key_slots[key] = slot_index
+            sequence = next(self.sequence)
+            self.sequences[key] = sequence
+            heapq.heappush(self.heap, (expires_at, sequence, key))
+            # stale heap entries are dropped in bulk once they outnumber the current ones
+            if len(self.heap) > 2 * len(self.sequences) + 1:
+                self.heap = [entry for entry in self.heap if self.sequences.get(entry[2]) == entry[1]]
+                heapq.heapify(self.heap)
+        return evicted
+
+    def remove(self, key) -> bool:
+        if key not in self.entries:
+            return False
+        self._evict(key)
+        self.evictions["removed"] += 1
+        return True
+
+    def expire(self, now: float = None) -> list:
+        """
+        Advance the wheel to the current time and evict every entry whose expiry has passed.
+
+        Args:
+            now (float): The current unix timestamp, defaults to the cache clock.
+
+        Returns:
+            list: The keys of the expired entries.
+        """
+        if now is None:
+            now = self.clock()
+        now_tick = int(now // self.tick_seconds)
+        if now_tick - self.current_tick >= self.wheel_size:
+            slot_indices = range(self.wheel_size)
+        else:
+            slot_indices = (tick % self.wheel_size for tick in range(self.current_tick, now_tick + 1))
+        expired = []
+        for slot_index in slot_indices:
+            slot = self.slots[slot_index]
+            expired.extend(key for key in slot if self.expiries[key] <= now)
+        for key in expired:
+            self._evict(key)
+        self.evictions["expired"] += len(expired)
+        self.current_tick = max(self.current_tick, now_tick)
+        return expired
+
+    def _unschedule(self, key):
+        slot_index = self.key_slots.pop(key, None)
+        if slot_index is not None:
+            del self.expiries[key]
+            del self.sequences[key]
+            self.slots[slot_index].discard(key)
+
+    def _evict(self, key):
+        self._unschedule(key)
+        del self.entries[key]
+
+    def _soonest_expiring(self):
+        while self.heap:
+            _, sequence, key = self.heap[0]
+            if self.sequences.get(key) == sequence:
+                return key
+            heapq.heappop(self.heap)
+        # no entry expires, fall back to the least recently inserted one
+        return next(iter(self.entries))
@@ -0,0 +1,78 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from utils.metrics import REGISTRY
+from utils.tracing import TRACER
+
+DEFAULT_LATTICE_SCHEME = "https"
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_TIMEOUT_SECONDS = 10
+# extra time given to a call on top of its socket timeout before the awaiting coroutine gives up on it
+TIMEOUT_GRACE_SECONDS = 1
+
+API_CALL_SECONDS = REGISTRY.histogram("ears_lattice_api_call_seconds", "Latency of Lattice API calls.", ("endpoint",))
+API_CALL_ERRORS = REGISTRY.counter("ears_lattice_api_call_errors_total", "Lattice API calls that failed or timed out.",
+                                   ("endpoint",))
+
+
+class LatticeExecutor:
+    def __init__(self, name: str, max_workers: int = DEFAULT_MAX_WORKERS,
+                 timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS):
+        """
+        A bounded thread pool that runs the blocking calls of a generated Lattice SDK off the event loop.
+        At most max_workers calls are in flight at once, and each worker reuses a pooled keep-alive connection.
+
+        Args:
+            name (str): The prefix of the worker thread names.
+            max_workers (int): The maximum number of concurrent calls.
+            timeout_seconds (float): The default per-call timeout in seconds.
+        """
+        self.max_workers = max_workers
+        self.timeout_seconds = timeout_seconds
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+
+    def configure(self, configuration):
+        """
+        Size the urllib3 connection pool of an SDK configuration to the number of workers, so every concurrent
+        call keeps its connection alive instead of opening and discarding one per request.
+        """
+        configuration.connection_pool_maxsize = self.max_workers
+        return configuration
+
+    async def call(self, method, *args, timeout_seconds: float = None, **kwargs):
+        """
+        Run an SDK method on the pool and wait for its result without blocking the event loop.
+
+        Args:
+            method: The SDK method to call.
+            *args: The positional arguments of the method.
+            timeout_seconds (float): The timeout of this call, defaults to the executor timeout.
+            **kwargs: The keyword arguments of the method.
+
+        Returns:
+            The return value of the method.
+
+        Raises:
+            asyncio.TimeoutError: If the call does not complete within its timeout.
+        """
+        if timeout_seconds is None:
+            timeout_seconds = self.timeout_seconds
+        kwargs.setdefault("_request_timeout", timeout_seconds)
+        endpoint = getattr(method, "__name__", "unknown")
+        started_at = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, partial(method, *args, **kwargs))
+        try:
+            # every endpoint gets its own trace lane, calls to different endpoints overlap in time
+            with TRACER.span(endpoint, "sdk", lane=f"sdk {endpoint}"):
+                return await asyncio.wait_for(future, timeout_seconds + TIMEOUT_GRACE_SECONDS)
+        except Exception:
+            API_CALL_ERRORS.labels(endpoint).inc()
+            raise
+        finally:
+            API_CALL_SECONDS.labels(endpoint).observe(time.perf_counter() - started_at)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,168 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+LOCK_TIMEOUT_SECONDS = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS instances (owner TEXT PRIMARY KEY, expires_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS leases (partition INTEGER PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS claims (entity_id TEXT PRIMARY KEY, kind TEXT NOT NULL, owner TEXT NOT NULL,
+                                   task_id TEXT NOT NULL, expires_at REAL NOT NULL);
+"""
+
+
+class LeaseStore:
+    def __init__(self, path: str, timeout_seconds: float = LOCK_TIMEOUT_SECONDS):
+        """
+        Coordinates EARS instances through a SQLite database shared on one host, with no other service involved.
+        It holds a heartbeat per instance, a lease per partition of the assets and a claim per entity under
+        investigation. Every operation runs in an immediate transaction, so the database write lock serializes the
+        instances and a lease or claim is only ever granted to one of them. A claim records the id its task is
+        created with from the start, so an instance taking over the claim of a dead one creates the task again
+        under the same id rather than a second task.
+
+        Args:
+            path (str): The path of the database file, the same for every instance.
+            timeout_seconds (float): How long an operation waits for another instance to release the write lock.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        # operations run on worker threads, the lock serializes them on the connection
+        self.connection = sqlite3.connect(path, timeout=timeout_seconds, isolation_level=None,
+                                          check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    @contextmanager
+    def transaction(self):
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except BaseException:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def heartbeat(self, owner: str, ttl_seconds: float, now: float) -> list[str]:
+        """
+        Extend the heartbeat of an instance and list the live instances.
+
+        Returns:
+            list[str]: The ids of the instances whose heartbeat has not expired, sorted.
+        """
+        with self.transaction() as connection:
+            connection.execute("INSERT OR REPLACE INTO instances VALUES (?, ?)", (owner, now + ttl_seconds))
+            connection.execute("DELETE FROM instances WHERE expires_at <= ?", (now,))
+            return [row[0] for row in connection.execute("SELECT owner FROM instances ORDER BY owner")]
+
+    def acquire(self, owner: str, partitions: set, ttl_seconds: float, now: float) -> set:
+        """
+        Release the leases of an instance outside the given partitions, renew the ones it holds and take the ones
+        that are free or expired.
+
+        Returns:
+            set: The partitions the instance holds a lease on afterwards.
+        """
+        with self.transaction() as connection:
+            held = {row[0] for row in connection.execute("SELECT partition FROM leases WHERE owner = ?", (owner,))}
+            connection.executemany("DELETE FROM leases WHERE partition = ? AND owner = ?",
+                                   [(partition, owner) for partition in held - partitions])
+            connection.executemany(
+                "INSERT INTO leases VALUES (?, ?, ?) ON CONFLICT (partition) DO UPDATE SET owner = excluded.owner, "
+                "expires_at = excluded.expires_at WHERE leases.owner = excluded.owner OR leases.expires_at <= ?",
+                [(partition, owner, now + ttl_seconds, now) for partition in partitions])
+            return {row[0] for row in connection.execute("SELECT partition FROM leases WHERE owner = ?", (owner,))}
+
+    def claim(self, owner: str, pairs: list[tuple], ttl_seconds: float, now: float) -> list[tuple]:
+        """
+        Claim the asset and track of each pair for an investigation. A pair is only granted when neither entity is
+        claimed by another instance, so no two instances task the same entity. Claims of the instance itself do not
+        block it, it keeps claims of finished investigations until its next sync and knows its own investigations
+        in progress.
+
+        Args:
+            owner (str): The id of the instance.
+            pairs (list[tuple]): The asset entity id, track entity id and task id of the pairs.
+            ttl_seconds (float): How long the claims last without being synced.
+            now (float): The current unix timestamp.
+
+        Returns:
+            list[tuple]: The pairs granted.
+        """
+        granted = []
+        with self.transaction() as connection:
+            for asset_id, track_id, task_id in pairs:
+                blocking = connection.execute("SELECT COUNT(*) FROM claims WHERE entity_id IN (?, ?) AND owner != ?",
+                                              (asset_id, track_id, owner)).fetchone()[0]
+                if blocking:
+                    continue
+                connection.executemany("INSERT OR REPLACE INTO claims VALUES (?, ?, ?, ?, ?)",
+                                       [(asset_id, "asset", owner, task_id, now + ttl_seconds),
+                                        (track_id, "track", owner, task_id, now + ttl_seconds)])
+                granted.append((asset_id, track_id, task_id))
+        return granted
+
+    def sync_claims(self, owner: str, held: dict, ttl_seconds: float, now: float):
+        """
+        Make the claims of an instance match the entities it still has an investigation for: claims of finished
+        investigations are dropped, the others are extended.
+
+        Args:
+            owner (str): The id of the instance.
+            held (dict): The entity ids under investigation or with a creation in flight mapped to their kind and
+                their task id.
+            ttl_seconds (float): How long the claims last without being synced.
+            now (float): The current unix timestamp.
+        """
+        with self.transaction() as connection:
+            claimed = [row[0] for row in connection.execute("SELECT entity_id FROM claims WHERE owner = ?", (owner,))]
+            connection.executemany("DELETE FROM claims WHERE entity_id = ? AND owner = ?",
+                                   [(entity_id, owner) for entity_id in claimed if entity_id not in held])
+            # investigations that predate the claims, restored from a snapshot for example, are claimed when free
+            connection.executemany("INSERT OR IGNORE INTO claims VALUES (?, ?, ?, ?, ?)",
+                                   [(entity_id, kind, owner, task_id, now + ttl_seconds)
+                                    for entity_id, (kind, task_id) in held.items()])
+            connection.executemany("UPDATE claims SET task_id = ?, expires_at = ? WHERE entity_id = ? AND owner = ?",
+                                   [(task_id, now + ttl_seconds, entity_id, owner)
+                                    for entity_id, (_, task_id) in held.items()])
+
+    def adopt_claims(self, owner: str, adopts, ttl_seconds: float, now: float) -> list[tuple]:
+        """
+        Take over the investigations of dead instances whose asset passes a filter, the asset being in a partition
+        the instance now holds. The track claim of each task moves with the asset claim. The tasks may not have been
+        created yet, the dead instance may have stopped while creating them.
+
+        Args:
+            owner (str): The id of the instance.
+            adopts: A function of an asset entity id that is True for the assets the instance takes over.
+            ttl_seconds (float): How long the claims last without being synced.
+            now (float): The current unix timestamp.
+
+        Returns:
+            list[tuple]: The kind, entity id and task id of every claim taken over.
+        """
+        with self.transaction() as connection:
+            expired = connection.execute("SELECT kind, entity_id, task_id FROM claims WHERE expires_at <= ?",
+                                         (now,)).fetchall()
+            task_ids = {task_id for kind, entity_id, task_id in expired if kind == "asset" and adopts(entity_id)}
+            adopted = [claim for claim in expired if claim[2] in task_ids]
+            connection.executemany("UPDATE claims SET owner = ?, expires_at = ? WHERE entity_id = ?",
+                                   [(owner, now + ttl_seconds, entity_id) for _, entity_id, _ in adopted])
+        return adopted
+
+    def release(self, owner: str, now: float):
+        """
+        Give up the leases and heartbeat of an instance that shuts down. Its claims expire right away, so the new
+        owners of its partitions take over its investigations without waiting for the claims to run out.
+        """
+        with self.transaction() as connection:
+            connection.execute("DELETE FROM instances WHERE owner = ?", (owner,))
+            connection.execute("DELETE FROM leases WHERE owner = ?", (owner,))
+            connection.execute("UPDATE claims SET expires_at = ? WHERE owner = ?", (now, owner))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
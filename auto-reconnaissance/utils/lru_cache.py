@@ -1,26 +0,0 @@
-from collections import OrderedDict
-
-class LRUCache:
-    def __init__(self, capacity: int):
-        self.cache = OrderedDict()
-        self.capacity = capacity
-
-    def get(self, key):
-        if key not in self.cache:
-            return None
-        self.cache.move_to_end(key)
-        return self.cache[key]
-
-    def get_all(self):
-        return list(self.cache.values())
-
-    def put(self, key, value):
-        if key in self.cache:
-            self.cache.move_to_end(key)
-        elif len(self.cache) >= self.capacity:
-            self.cache.popitem(last=False)
-        self.cache[key] = value
-
-    def remove(self, key):
-        if key in self.cache:
-            del self.cache[key]
\ No newline at end of file
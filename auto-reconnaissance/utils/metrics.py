@@ -0,0 +1,248 @@
+import asyncio
+import math
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import Logger
+
+# upper bounds in seconds of the default latency histogram buckets
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+EVENT_LOOP_LAG_INTERVAL_SECONDS = 0.1
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def format_value(value) -> str:
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if math.isnan(value):
+            return "NaN"
+    return repr(value)
+
+
+def format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    """
+    A monotonically increasing value. Recording is a single attribute update, a counter can instead read its value
+    from a function at scrape time when the component already counts it.
+    """
+    __slots__ = ("value", "function")
+
+    def __init__(self, function=None):
+        self.value = 0
+        self.function = function
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def get(self):
+        return self.function() if self.function is not None else self.value
+
+    def samples(self, name: str, label_names: tuple, label_values: tuple):
+        yield name, format_labels(label_names, label_values), self.get()
+
+
+class Gauge(Counter):
+    """
+    A value that can go up and down, or that is read from a function at scrape time.
+    """
+    __slots__ = ()
+
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+
+class Histogram:
+    """
+    Counts observations into fixed buckets. Recording is one binary search over the bucket bounds and two attribute
+    updates, the cumulative bucket counts are only computed at scrape time.
+    """
+    __slots__ = ("upper_bounds", "counts", "sum")
+
+    def __init__(self, upper_bounds: tuple = DEFAULT_BUCKETS):
+        self.upper_bounds = upper_bounds
+        # one count per bucket plus the +Inf bucket
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+
+    def samples(self, name: str, label_names: tuple, label_values: tuple):
+        counts = list(self.counts)
+        cumulative = 0
+        for upper_bound, count in zip(self.upper_bounds + (math.inf,), counts):
+            cumulative += count
+            yield (f"{name}_bucket",
+                   format_labels(label_names, label_values, f'le="{format_value(float(upper_bound))}"'), cumulative)
+        yield f"{name}_sum", format_labels(label_names, label_values), self.sum
+        yield f"{name}_count", format_labels(label_names, label_values), cumulative
+
+
+class Metric:
+    def __init__(self, name: str, documentation: str, metric_type: str, factory, label_names: tuple = ()):
+        """
+        A named metric with its help text and its children, one per combination of label values. A metric without
+        labels has a single child that the recording methods are forwarded to.
+
+        Args:
+            name (str): The metric name.
+            documentation (str): The help text.
+            metric_type (str): The Prometheus metric type.
+            factory: The function creating a child.
+            label_names (tuple): The label names.
+        """
+        self.name = name
+        self.documentation = documentation
+        self.metric_type = metric_type
+        self.factory = factory
+        self.label_names = tuple(label_names)
+        self.children = {}
+        self.lock = threading.Lock()
+        if not self.label_names:
+            self.children[()] = factory()
+
+    def labels(self, *label_values):
+        """
+        Get the child of the given label values. Callers on a hot path should look children up once and keep them.
+        """
+        child = self.children.get(label_values)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(label_values, self.factory())
+        return child
+
+    def __getattr__(self, name):
+        # forward inc, set, observe and friends to the single child of a metric without labels
+        if name == "children":
+            raise AttributeError(name)
+        return getattr(self.children[()], name)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        for label_values, child in list(self.children.items()):
+            for sample_name, labels, value in child.samples(self.name, self.label_names, label_values):
+                lines.append(f"{sample_name}{labels} {format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        """
+        The metrics of the process, rendered together in the Prometheus text format. Registering a name that
+        already exists returns the existing metric, so components created more than once share their metrics.
+        """
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def register(self, name: str, documentation: str, metric_type: str, factory, label_names: tuple) -> Metric:
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = Metric(name, documentation, metric_type, factory, label_names)
+                self.metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, label_names: tuple = (), function=None) -> Metric:
+        """
+        Register a counter. With a function the counter reads its value from it at scrape time, a later
+        registration of the same name replaces the function.
+        """
+        metric = self.register(name, documentation, "counter", Counter, label_names)
+        if function is not None:
+            metric.labels().function = function
+        return metric
+
+    def gauge(self, name: str, documentation: str, label_names: tuple = (), function=None) -> Metric:
+        """
+        Register a gauge. With a function the gauge reads its value from it at scrape time, a later registration
+        of the same name replaces the function.
+        """
+        metric = self.register(name, documentation, "gauge", Gauge, label_names)
+        if function is not None:
+            metric.labels().function = function
+        return metric
+
+    def histogram(self, name: str, documentation: str, label_names: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Metric:
+        return self.register(name, documentation, "histogram", lambda: Histogram(tuple(buckets)), label_names)
+
+    def render(self) -> str:
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class MetricsServer:
+    def __init__(self, logger: Logger, port: int, host: str = "127.0.0.1", registry: MetricsRegistry = REGISTRY):
+        """
+        Serves the registry in the Prometheus text format on /metrics from a background thread, so scrapes never
+        run on the event loop.
+
+        Args:
+            logger (Logger): The logger.
+            port (int): The port to listen on.
+            host (str): The address to listen on.
+            registry (MetricsRegistry): The metrics to serve.
+        """
+        self.logger = logger
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.registry = registry
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="metrics-server", daemon=True).start()
+        host, port = self.server.server_address[:2]
+        self.logger.info(f"serving metrics on http://{host}:{port}/metrics")
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+async def measure_event_loop_lag(histogram, interval_seconds: float = EVENT_LOOP_LAG_INTERVAL_SECONDS):
+    """
+    Sleep for a fixed interval in a loop and record how much later than requested the loop woke up, which is the
+    time callbacks spent waiting behind other work on the event loop.
+    """
+    while True:
+        started_at = time.perf_counter()
+        await asyncio.sleep(interval_seconds)
+        histogram.observe(max(0.0, time.perf_counter() - started_at - interval_seconds))
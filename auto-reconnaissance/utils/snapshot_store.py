@@ -0,0 +1,113 @@
+import sqlite3
+import threading
+import time
+from operator import attrgetter
+
+from utils.entity_record import EntityRecord
+
+SNAPSHOT_INTERVAL_SECONDS = 10
+# restored records expire after this long unless the entity stream sends them again, entities deleted while the
+# process was down are never sent again
+SNAPSHOT_RESTORE_TTL_SECONDS = 60
+# the records table has one column per record field, so rows are written and read without per-row serialization
+RECORD_FIELDS = EntityRecord.__slots__
+RECORD_COLUMNS = ("kind",) + RECORD_FIELDS
+read_record_fields = attrgetter(*RECORD_FIELDS)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS task_mappings (task_id TEXT NOT NULL, kind TEXT NOT NULL, entity_id TEXT NOT NULL,
+                                          PRIMARY KEY (kind, entity_id));
+CREATE TABLE IF NOT EXISTS task_statuses (task_id TEXT PRIMARY KEY, status TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS metadata (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+class Snapshot:
+    def __init__(self, assets: list = None, tracks: list = None, asset_tasks: dict = None, track_tasks: dict = None,
+                 task_statuses: dict = None, saved_at: float = None):
+        """
+        The state that survives a restart: the cached records, the asset and track task mappings and the last
+        known status of every task in progress.
+        """
+        self.assets = assets or []
+        self.tracks = tracks or []
+        self.asset_tasks = asset_tasks or {}
+        self.track_tasks = track_tasks or {}
+        self.task_statuses = task_statuses or {}
+        self.saved_at = saved_at
+
+
+class SnapshotStore:
+    def __init__(self, path: str):
+        """
+        Persists snapshots to a SQLite database in WAL mode. Every save replaces the previous snapshot in one
+        transaction, so a crash in the middle of a save leaves the previous snapshot intact and readable.
+
+        Args:
+            path (str): The path of the database file.
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        # saves run on a worker thread, the lock serializes them with loads
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.create_records_table()
+
+    def create_records_table(self):
+        columns = tuple(row[1] for row in self.connection.execute("PRAGMA table_info(records)"))
+        if columns == RECORD_COLUMNS:
+            return
+        # the record fields changed since the snapshot was saved, it is dropped rather than migrated
+        with self.connection:
+            self.connection.execute("DROP TABLE IF EXISTS records")
+            self.connection.execute(f"CREATE TABLE records ({', '.join(RECORD_COLUMNS)})")
+
+    def save(self, snapshot: Snapshot):
+        records = [(kind, *read_record_fields(record))
+                   for kind, records in (("asset", snapshot.assets), ("track", snapshot.tracks))
+                   for record in records]
+        mappings = [(task_id, kind, entity_id)
+                    for kind, tasks in (("asset", snapshot.asset_tasks), ("track", snapshot.track_tasks))
+                    for entity_id, task_id in tasks.items()]
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM records")
+            self.connection.execute("DELETE FROM task_mappings")
+            self.connection.execute("DELETE FROM task_statuses")
+            self.connection.executemany(f"INSERT INTO records VALUES ({', '.join('?' * len(RECORD_COLUMNS))})",
+                                        records)
+            self.connection.executemany("INSERT INTO task_mappings VALUES (?, ?, ?)", mappings)
+            self.connection.executemany("INSERT INTO task_statuses VALUES (?, ?)", snapshot.task_statuses.items())
+            self.connection.execute("INSERT OR REPLACE INTO metadata VALUES ('saved_at', ?)",
+                                    (repr(snapshot.saved_at or time.time()),))
+
+    def load(self, now: float = None) -> Snapshot:
+        """
+        Read the last saved snapshot. Records that expired in the meantime are left out.
+
+        Args:
+            now (float): The current unix timestamp, defaults to the current time.
+
+        Returns:
+            Snapshot: The saved state.
+        """
+        now = time.time() if now is None else now
+        snapshot = Snapshot()
+        with self.lock:
+            rows = self.connection.execute("SELECT * FROM records WHERE expiry_timestamp IS NULL OR "
+                                           "expiry_timestamp > ?", (now,)).fetchall()
+            mappings = self.connection.execute("SELECT task_id, kind, entity_id FROM task_mappings").fetchall()
+            snapshot.task_statuses = dict(self.connection.execute("SELECT task_id, status FROM task_statuses"))
+            saved_at = self.connection.execute("SELECT value FROM metadata WHERE key = 'saved_at'").fetchone()
+        for kind, *values in rows:
+            record = EntityRecord(**dict(zip(RECORD_FIELDS, values)))
+            (snapshot.assets if kind == "asset" else snapshot.tracks).append(record)
+        for task_id, kind, entity_id in mappings:
+            (snapshot.asset_tasks if kind == "asset" else snapshot.track_tasks)[entity_id] = task_id
+        snapshot.saved_at = float(saved_at[0]) if saved_at else None
+        return snapshot
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
@@ -0,0 +1,159 @@
+import math
+
+# Lower bounds on the WGS84 ground distance covered by one degree. Using lower bounds keeps
+# the bounding box of a query conservative, so no point within the radius is ever missed.
+MILES_PER_DEGREE_LATITUDE = 68.0
+MILES_PER_DEGREE_LONGITUDE_AT_EQUATOR = 69.0
+
+
+class SpatialIndex:
+    def __init__(self, cell_size_degrees: float = 0.1):
+        """
+        A uniform latitude/longitude cell grid over entity positions. Each key lives in exactly one cell, so
+        updates are O(1) and a radius query only visits the cells overlapping the bounding box of the radius.
+
+        Args:
+            cell_size_degrees (float): The edge length of a grid cell in degrees.
+        """
+        self.cell_size = cell_size_degrees
+        self.lat_cells = math.ceil(180 / cell_size_degrees)
+        self.lon_cells = math.ceil(360 / cell_size_degrees)
+        self.cells = {}
+        self.key_cells = {}
+
+    def __len__(self):
+        return len(self.key_cells)
+
+    def __contains__(self, key):
+        return key in self.key_cells
+
+    def cell_of(self, latitude: float, longitude: float) -> tuple:
+        row = min(int((latitude + 90) // self.cell_size), self.lat_cells - 1)
+        col = int((longitude + 180) // self.cell_size) % self.lon_cells
+        return row, col
+
+    def update(self, key, latitude: float, longitude: float):
+        cell = self.cell_of(latitude, longitude)
+        previous = self.key_cells.get(key)
+        if previous == cell:
+            return
+        if previous is not None:
+            self._discard(key, previous)
+        self.cells.setdefault(cell, set()).add(key)
+        self.key_cells[key] = cell
+
+    def remove(self, key):
+        cell = self.key_cells.pop(key, None)
+        if cell is not None:
+            self._discard(key, cell)
+
+    def _discard(self, key, cell: tuple):
+        members = self.cells[cell]
+        members.discard(key)
+        if not members:
+            del self.cells[cell]
+
+    def query(self, latitude: float, longitude: float, radius_miles: float) -> list:
+        """
+        Return every key whose cell overlaps the bounding box of a circle around a point. The result is a
+        superset of the keys within the radius, callers are expected to refine it with an exact distance.
+
+        Args:
+            latitude (float): The latitude of the query point in degrees.
+            longitude (float): The longitude of the query point in degrees.
+            radius_miles (float): The query radius in miles.
+
+        Returns:
+            list: The candidate keys.
+        """
+        lat_span = radius_miles / MILES_PER_DEGREE_LATITUDE
+        min_lat = max(latitude - lat_span, -90.0)
+        max_lat = min(latitude + lat_span, 90.0)
+        min_row = self.cell_of(min_lat, longitude)[0]
+        max_row = self.cell_of(max_lat, longitude)[0]
+
+        widest_lat = max(abs(min_lat), abs(max_lat))
+        cos_lat = math.cos(math.radians(widest_lat))
+        if cos_lat <= 0:
+            cols = range(self.lon_cells)
+        else:
+            lon_span = radius_miles / (MILES_PER_DEGREE_LONGITUDE_AT_EQUATOR * cos_lat)
+            if lon_span >= 180:
+                cols = range(self.lon_cells)
+            else:
+                first_col = int((longitude - lon_span + 180) // self.cell_size)
+                last_col = int((longitude + lon_span + 180) // self.cell_size)
+                cols = [col % self.lon_cells for col in range(first_col, last_col + 1)]
+                if len(cols) > self.lon_cells:
+                    cols = range(self.lon_cells)
+
+        rows = range(min_row, max_row + 1)
+        candidates = []
+        if len(rows) * len(cols) > len(self.cells):
+            # the box covers more cells than are occupied, so walking the occupied cells is cheaper
+            col_set = set(cols)
+            for (row, col), members in self.cells.items():
+                if min_row <= row <= max_row and col in col_set:
+                    candidates.extend(members)
+            return candidates
+        for row in rows:
+            for col in cols:
+                members = self.cells.get((row, col))
+                if members:
+                    candidates.extend(members)
+        return candidates
+
+
+class RadiusBucketIndex:
+    def __init__(self, cell_size_degrees: float = 0.1):
+        """
+        Spatial indexes of points that each carry their own search radius, with one grid per distinct radius. A
+        query from a point finds the keys whose own radius may reach it by querying every grid at its radius, so
+        keys with a small radius are not returned just because other keys have a large one.
+
+        Args:
+            cell_size_degrees (float): The edge length of a grid cell in degrees.
+        """
+        self.cell_size = cell_size_degrees
+        self.buckets = {}
+        self.key_radii = {}
+
+    def __len__(self):
+        return len(self.key_radii)
+
+    def __contains__(self, key):
+        return key in self.key_radii
+
+    def update(self, key, latitude: float, longitude: float, radius_miles: float):
+        previous = self.key_radii.get(key)
+        if previous is not None and previous != radius_miles:
+            self.remove(key)
+        bucket = self.buckets.get(radius_miles)
+        if bucket is None:
+            bucket = self.buckets[radius_miles] = SpatialIndex(self.cell_size)
+        bucket.update(key, latitude, longitude)
+        self.key_radii[key] = radius_miles
+
+    def remove(self, key):
+        radius_miles = self.key_radii.pop(key, None)
+        if radius_miles is not None:
+            self.buckets[radius_miles].remove(key)
+
+    def query(self, latitude: float, longitude: float, margin_miles: float = 0.0) -> list:
+        """
+        Return every key whose radius, grown by a margin, may reach a point. Like SpatialIndex.query the result is a
+        superset, callers are expected to refine it with an exact distance.
+
+        Args:
+            latitude (float): The latitude of the query point in degrees.
+            longitude (float): The longitude of the query point in degrees.
+            margin_miles (float): The distance in miles added to the radius of every key.
+
+        Returns:
+            list: The candidate keys.
+        """
+        candidates = []
+        for radius_miles, bucket in self.buckets.items():
+            if len(bucket):
+                candidates.extend(bucket.query(latitude, longitude, radius_miles + margin_miles))
+        return candidates
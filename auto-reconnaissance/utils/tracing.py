@@ -0,0 +1,240 @@
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from logging import Logger
+
+TRACE_BUFFER_SIZE = 65536
+SLOW_TICK_SECONDS = 2.0
+# minimum time between two automatic dumps, so a run of slow ticks does not flood the disk
+TRIGGER_COOLDOWN_SECONDS = 60
+PROFILE_SECONDS = 0
+PROFILE_INTERVAL_SECONDS = 0.005
+TRACE_DUMP_DIR = "traces"
+
+
+class Span:
+    """
+    Times one stage and records it into the tracer as a complete event when the block exits.
+    """
+    __slots__ = ("tracer", "name", "category", "lane", "args", "started_at")
+
+    def __init__(self, tracer, name: str, category: str, lane, args):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.lane = lane
+        self.args = args
+
+    def __enter__(self):
+        self.started_at = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.tracer.record(self.name, self.category, self.started_at, time.perf_counter_ns() - self.started_at,
+                           self.lane, self.args)
+        return False
+
+
+class NullSpan:
+    __slots__ = ("args",)
+
+    def __init__(self):
+        self.args = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+class Tracer:
+    def __init__(self, capacity: int = TRACE_BUFFER_SIZE, enabled: bool = False):
+        """
+        Records spans into a fixed-size ring buffer that always holds the most recent ones, so the lead-up to a slow
+        tick can be dumped after the fact. A disabled tracer hands out a shared no-op span and records nothing.
+
+        Args:
+            capacity (int): The number of spans kept.
+            enabled (bool): Whether spans are recorded.
+        """
+        self.configure(capacity, enabled)
+
+    def configure(self, capacity: int = TRACE_BUFFER_SIZE, enabled: bool = False):
+        self.capacity = capacity
+        self.enabled = enabled
+        self.buffer = [None] * capacity
+        self.position = 0
+        self.origin_ns = time.perf_counter_ns()
+
+    def span(self, name: str, category: str = "ears", lane: str = None, args: dict = None):
+        """
+        Time a block as a span. Spans are laid out on the lane of the current thread unless another lane is given,
+        concurrent coroutines should use their own lane so their spans do not overlap.
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, category, lane, args)
+
+    def record(self, name: str, category: str, started_at_ns: int, duration_ns: int, lane=None, args: dict = None):
+        if lane is None:
+            lane = threading.current_thread().name
+        self.buffer[self.position % self.capacity] = (name, category, started_at_ns, duration_ns, lane, args)
+        self.position += 1
+
+    def snapshot(self) -> list:
+        if self.position <= self.capacity:
+            return self.buffer[:self.position]
+        start = self.position % self.capacity
+        return self.buffer[start:] + self.buffer[:start]
+
+    def chrome_trace(self, spans: list) -> dict:
+        """
+        Convert spans to the Chrome trace event format, which Perfetto and chrome://tracing open directly. Every
+        lane becomes a named thread of the process.
+        """
+        pid = os.getpid()
+        lanes = {}
+        events = []
+        for name, category, started_at_ns, duration_ns, lane, args in spans:
+            tid = lanes.setdefault(lane, len(lanes) + 1)
+            event = {"name": name, "cat": category, "ph": "X", "pid": pid, "tid": tid,
+                     "ts": (started_at_ns - self.origin_ns) / 1000, "dur": duration_ns / 1000}
+            if args:
+                event["args"] = args
+            events.append(event)
+        for lane, tid in lanes.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": str(lane)}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+
+TRACER = Tracer()
+
+
+class SamplingProfiler:
+    def __init__(self, interval_seconds: float = PROFILE_INTERVAL_SECONDS):
+        """
+        Samples the stacks of every thread at a fixed interval from a background thread and counts identical
+        stacks. The result is written in the folded stack format read by flamegraph.pl and speedscope.
+
+        Args:
+            interval_seconds (float): The time between two samples.
+        """
+        self.interval_seconds = interval_seconds
+        self.thread = None
+
+    @property
+    def running(self) -> bool:
+        return self.thread is not None and self.thread.is_alive()
+
+    def start(self, duration_seconds: float, path: str, on_done=None) -> bool:
+        if self.running:
+            return False
+        self.thread = threading.Thread(target=self.run, args=(duration_seconds, path, on_done),
+                                       name="sampling-profiler", daemon=True)
+        self.thread.start()
+        return True
+
+    def run(self, duration_seconds: float, path: str, on_done):
+        own_id = threading.get_ident()
+        names = {}
+        stacks = Counter()
+        deadline = time.monotonic() + duration_seconds
+        while time.monotonic() < deadline:
+            for thread in threading.enumerate():
+                names[thread.ident] = thread.name
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                stacks[";".join(reversed(stack))] += 1
+            time.sleep(self.interval_seconds)
+        with open(path, 'w') as output:
+            for stack, count in stacks.most_common():
+                output.write(f"{stack} {count}\n")
+        if on_done is not None:
+            on_done(path)
+
+
+class FlightRecorder:
+    def __init__(self, logger: Logger, tracer: Tracer = TRACER, dump_dir: str = TRACE_DUMP_DIR,
+                 slow_tick_seconds: float = SLOW_TICK_SECONDS, profile_seconds: float = PROFILE_SECONDS,
+                 cooldown_seconds: float = TRIGGER_COOLDOWN_SECONDS):
+        """
+        Dumps the tracer ring buffer as a Chrome trace file when triggered by SIGUSR1 or by a tick slower than the
+        threshold, and optionally profiles the process for a few seconds after the trigger to catch what follows.
+        Files are written from a background thread so a dump does not stall the event loop.
+
+        Args:
+            logger (Logger): The logger.
+            tracer (Tracer): The tracer to dump.
+            dump_dir (str): The directory trace and profile files are written to.
+            slow_tick_seconds (float): The tick duration that triggers a dump, 0 disables the slow tick trigger.
+            profile_seconds (float): How long to profile after a trigger, 0 disables profiling.
+            cooldown_seconds (float): The minimum time between two slow tick triggers.
+        """
+        self.logger = logger
+        self.tracer = tracer
+        self.dump_dir = dump_dir
+        self.slow_tick_seconds = slow_tick_seconds
+        self.profile_seconds = profile_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self.profiler = SamplingProfiler()
+        self.last_triggered_at = None
+
+    def install_signal_handler(self, loop, signal_number: int = getattr(signal, "SIGUSR1", None)):
+        if signal_number is None:
+            return
+        try:
+            loop.add_signal_handler(signal_number, self.trigger, "signal")
+        except (NotImplementedError, RuntimeError) as error:
+            self.logger.warning(f"cannot install the trace dump signal handler: {error}")
+
+    def check_tick(self, name: str, duration_seconds: float):
+        if not self.slow_tick_seconds or duration_seconds < self.slow_tick_seconds:
+            return
+        now = time.monotonic()
+        if self.last_triggered_at is not None and now - self.last_triggered_at < self.cooldown_seconds:
+            return
+        self.logger.warning(f"{name} took {duration_seconds:.2f}s")
+        self.trigger(f"slow-{name}")
+
+    def trigger(self, reason: str):
+        self.last_triggered_at = time.monotonic()
+        profiles = self.profile_seconds > 0 and not self.profiler.running
+        if not self.tracer.enabled and not profiles:
+            self.logger.info("tracing is disabled and the profiler is busy or disabled, nothing to write")
+            return
+        os.makedirs(self.dump_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        base = os.path.join(self.dump_dir, f"ears-{stamp}-{reason}")
+        if self.tracer.enabled:
+            self.logger.info("dumping the trace buffer")
+            spans = self.tracer.snapshot()
+            threading.Thread(target=self.write_trace, args=(spans, f"{base}.trace.json"), name="trace-dump",
+                             daemon=True).start()
+        if profiles and self.profiler.start(self.profile_seconds, f"{base}.folded", self.profile_written):
+            self.logger.info(f"profiling for {self.profile_seconds}s")
+
+    def write_trace(self, spans: list, path: str):
+        try:
+            with open(path, 'w') as output:
+                json.dump(self.tracer.chrome_trace(spans), output)
+            self.logger.info(f"wrote {len(spans)} spans to {path}")
+        except OSError as error:
+            self.logger.error(f"trace dump error {error}")
+
+    def profile_written(self, path: str):
+        self.logger.info(f"wrote profile to {path}")
@@ -0,0 +1,106 @@
+import numpy as np
+
+from utils.entity_record import EntityRecord
+
+DISPOSITIONS = ("DISPOSITION_UNKNOWN", "DISPOSITION_FRIENDLY", "DISPOSITION_HOSTILE", "DISPOSITION_SUSPICIOUS",
+                "DISPOSITION_ASSUMED_FRIENDLY", "DISPOSITION_NEUTRAL", "DISPOSITION_PENDING")
+DISPOSITION_CODES = {disposition: code for code, disposition in enumerate(DISPOSITIONS)}
+ENVIRONMENTS = ("ENVIRONMENT_UNKNOWN", "ENVIRONMENT_AIR", "ENVIRONMENT_SURFACE", "ENVIRONMENT_SUB_SURFACE",
+                "ENVIRONMENT_LAND", "ENVIRONMENT_SPACE")
+ENVIRONMENT_CODES = {environment: code for code, environment in enumerate(ENVIRONMENTS)}
+INITIAL_CAPACITY = 1024
+
+
+def disposition_code(disposition: str) -> int:
+    return DISPOSITION_CODES.get(disposition, DISPOSITION_CODES["DISPOSITION_UNKNOWN"])
+
+
+def environment_code(environment: str) -> int:
+    return ENVIRONMENT_CODES.get(environment, ENVIRONMENT_CODES["ENVIRONMENT_UNKNOWN"])
+
+
+class TrackStore:
+    def __init__(self, initial_capacity: int = INITIAL_CAPACITY):
+        """
+        A struct-of-arrays store of track positions, velocities, dispositions, environments and update times. Every
+        track owns one row of the columns, looked up through an entity id index, and the rows of removed tracks are
+        reused through a free list, so filters over any set of rows run as NumPy operations without copying track
+        objects.
+
+        Args:
+            initial_capacity (int): The number of rows allocated up front, the columns double when they fill up.
+        """
+        self.latitudes = np.zeros(initial_capacity, dtype=np.float64)
+        self.longitudes = np.zeros(initial_capacity, dtype=np.float64)
+        self.velocities_east = np.zeros(initial_capacity, dtype=np.float64)
+        self.velocities_north = np.zeros(initial_capacity, dtype=np.float64)
+        self.dispositions = np.zeros(initial_capacity, dtype=np.int8)
+        self.environments = np.zeros(initial_capacity, dtype=np.int8)
+        self.updated_at = np.zeros(initial_capacity, dtype=np.float64)
+        self.records = [None] * initial_capacity
+        self.rows = {}
+        self.free_rows = []
+        self.high_water = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, entity_id):
+        return entity_id in self.rows
+
+    @property
+    def capacity(self) -> int:
+        return len(self.latitudes)
+
+    def put(self, record: EntityRecord, updated_at: float = None) -> int:
+        row = self.rows.get(record.entity_id)
+        if row is None:
+            row = self._allocate_row()
+            self.rows[record.entity_id] = row
+        self.latitudes[row] = record.latitude
+        self.longitudes[row] = record.longitude
+        self.velocities_east[row] = record.velocity_east_mps
+        self.velocities_north[row] = record.velocity_north_mps
+        self.dispositions[row] = disposition_code(record.disposition)
+        self.environments[row] = environment_code(record.environment)
+        self.updated_at[row] = record.observed_at if updated_at is None else updated_at
+        self.records[row] = record
+        return row
+
+    def remove(self, entity_id: str) -> bool:
+        row = self.rows.pop(entity_id, None)
+        if row is None:
+            return False
+        self.records[row] = None
+        # a NaN latitude fails every comparison, so a free row can never pass a range check
+        self.latitudes[row] = np.nan
+        self.free_rows.append(row)
+        return True
+
+    def get(self, entity_id: str):
+        row = self.rows.get(entity_id)
+        return None if row is None else self.records[row]
+
+    def rows_for(self, entity_ids) -> np.ndarray:
+        rows = self.rows
+        return np.fromiter((rows[entity_id] for entity_id in entity_ids if entity_id in rows), dtype=np.intp)
+
+    def _allocate_row(self) -> int:
+        if self.free_rows:
+            return self.free_rows.pop()
+        if self.high_water == self.capacity:
+            self._grow()
+        row = self.high_water
+        self.high_water += 1
+        return row
+
+    def _grow(self):
+        capacity = self.capacity * 2
+        self.latitudes = np.resize(self.latitudes, capacity)
+        self.longitudes = np.resize(self.longitudes, capacity)
+        self.velocities_east = np.resize(self.velocities_east, capacity)
+        self.velocities_north = np.resize(self.velocities_north, capacity)
+        self.dispositions = np.resize(self.dispositions, capacity)
+        self.environments = np.resize(self.environments, capacity)
+        self.updated_at = np.resize(self.updated_at, capacity)
+        self.records.extend([None] * (capacity - len(self.records)))
@@ -0,0 +1,158 @@
+import argparse
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+from server import FakeLatticeServer, read_config
+
+REPOSITORY_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# the processes under test and their default configuration files, relative to the repository root
+PROCESSES = {
+    "ears": ("auto-reconnaissance/main.py", "auto-reconnaissance/var/config.yml"),
+    "asset": ("simulated_asset/asset.py", "simulated_asset/var/config.yml"),
+    "track": ("simulated_track/track.py", "simulated_track/var/config.yml"),
+    "swarm": ("simulated_swarm/swarm.py", "simulated_swarm/var/config.yml"),
+}
+DEFAULT_PROCESSES = "ears,asset,track"
+HARNESS_TOKEN = "fake-lattice-token"
+STOP_TIMEOUT_SECONDS = 10
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def write_config(directory: str, name: str, config_path: str, address: str) -> str:
+    """
+    Copy a process configuration with its lattice connection pointed at the fake server. The files a process
+    writes are moved into the run directory and its metrics endpoint to a free port, so a run neither picks up the
+    state of an earlier one nor clashes with a process running outside the harness.
+    """
+    with open(os.path.join(REPOSITORY_ROOT, config_path), 'r') as ymlfile:
+        cfg = yaml.safe_load(ymlfile)
+    cfg.update({
+        "lattice-ip": address,
+        "lattice-scheme": "http",
+        "lattice-bearer-token": HARNESS_TOKEN,
+        "sandbox-token": HARNESS_TOKEN,
+    })
+    for key in ("snapshot-path", "lease-store-path", "trace-dump-dir"):
+        if cfg.get(key):
+            cfg[key] = os.path.join(directory, f"{name}-{os.path.basename(cfg[key])}")
+    if cfg.get("metrics-port"):
+        cfg["metrics-port"] = free_port()
+    path = os.path.join(directory, f"{name}.yml")
+    with open(path, 'w') as ymlfile:
+        yaml.safe_dump(cfg, ymlfile)
+    return path
+
+
+def start_process(directory: str, name: str, script: str, config_path: str) -> subprocess.Popen:
+    log = open(os.path.join(directory, f"{name}.log"), 'w')
+    return subprocess.Popen([sys.executable, os.path.join(REPOSITORY_ROOT, script), "--config", config_path],
+                            cwd=REPOSITORY_ROOT, stdout=log, stderr=subprocess.STDOUT)
+
+
+def stop_process(process: subprocess.Popen):
+    if process.poll() is not None:
+        return
+    process.terminate()
+    try:
+        process.wait(timeout=STOP_TIMEOUT_SECONDS)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def run(logger: logging.Logger, settings: dict, names: list, duration_seconds: float, directory: str) -> dict:
+    """
+    Start the fake server and the processes under test against it, let them run for the given duration and
+    collect the server statistics.
+
+    Args:
+        logger (logging.Logger): The logger.
+        settings (dict): The fake server settings.
+        names (list): The processes to start, keys of PROCESSES.
+        duration_seconds (float): How long the processes run.
+        directory (str): The directory the generated configurations and process logs are written to.
+
+    Returns:
+        dict: The run parameters, the api call volume and the ingest-to-task latency.
+    """
+    # the server always listens on a free port, so a harness run does not clash with a standalone fake server
+    server = FakeLatticeServer(logger, {**settings, "port": 0})
+    server.start()
+    processes = {}
+    try:
+        for name in names:
+            script, config_path = PROCESSES[name]
+            processes[name] = start_process(directory, name, script,
+                                            write_config(directory, name, config_path, server.address))
+        started_at = time.monotonic()
+        deadline = started_at + duration_seconds
+        while time.monotonic() < deadline:
+            exited = [name for name, process in processes.items() if process.poll() is not None]
+            if exited:
+                logger.error(f"{', '.join(exited)} exited early, see the logs in {directory}")
+                break
+            time.sleep(0.5)
+        stats = server.lattice.stats()
+        elapsed_seconds = time.monotonic() - started_at
+    finally:
+        for process in processes.values():
+            stop_process(process)
+        server.stop()
+    return {
+        "duration_seconds": elapsed_seconds,
+        "processes": {name: process.returncode for name, process in processes.items()},
+        "logs": directory,
+        "settings": server.settings,
+        "total_calls": sum(stats["calls"].values()),
+        "calls_per_second": {name: count / elapsed_seconds for name, count in stats["calls"].items()},
+        **stats,
+    }
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Fake Lattice End-to-End Harness')
+    parser.add_argument('--config', type=str, help='Path to the fake lattice server configuration file')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds to run the processes for')
+    parser.add_argument('--processes', type=str, default=DEFAULT_PROCESSES,
+                        help='Comma separated processes to start')
+    parser.add_argument('--output', type=str, help='Path of the JSON report, defaults to stdout')
+    return parser.parse_args()
+
+
+def main():
+    logging.basicConfig()
+    logger = logging.getLogger("HARNESS")
+    logger.setLevel(logging.INFO)
+
+    args = parse_arguments()
+    settings = read_config(args.config)
+    names = [name.strip() for name in args.processes.split(",")]
+    for name in names:
+        if name not in PROCESSES:
+            raise ValueError(f"unknown process {name}, expected one of {', '.join(PROCESSES)}")
+
+    directory = tempfile.mkdtemp(prefix="fake-lattice-")
+    report = run(logger, settings, names, args.duration, directory)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(report, output, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
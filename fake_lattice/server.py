@@ -0,0 +1,465 @@
+import argparse
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+import yaml
+
+API_PREFIX = "/api/v1"
+DEFAULT_SETTINGS = {
+    "host": "127.0.0.1",
+    "port": 8080,
+    # latency added to every api call, the jitter is drawn uniformly from [0, latency-jitter-ms]
+    "latency-ms": 0,
+    "latency-jitter-ms": 0,
+    # probability of answering an api call with error-status instead of handling it
+    "error-rate": 0.0,
+    "error-status": 503,
+    # how long the entity event and agent long polls wait for something to return
+    "long-poll-timeout-seconds": 5,
+    "event-batch-size": 1000,
+    # number of entity events kept for session resumes, older sessions are answered with 410
+    "event-log-size": 100000,
+    # time after which an executing task is completed by the server, 0 leaves tasks executing
+    "task-completion-seconds": 0,
+    # synthetic tracks published by the server itself, on top of the ones published by clients
+    "generated-tracks": 0,
+    "generated-event-rate": 0,
+    "generated-latitude": 1.0,
+    "generated-longitude": 1.0,
+    "generated-radius-degrees": 0.5,
+    "generated-expiry-seconds": 15,
+    "seed": 0,
+}
+# standard deviation of the position change of a generated track per update in degrees
+GENERATED_MOVE_DEGREES = 0.0005
+PERCENTILES = (50, 90, 99)
+
+ROUTES = [
+    ("POST", re.compile(r"^/entities/events$"), "long_poll_entity_events"),
+    ("PUT", re.compile(r"^/entities$"), "publish_entity_rest"),
+    ("PUT", re.compile(r"^/entities/(?P<entity_id>[^/]+)/override/(?P<field_path>[^/]+)$"),
+     "put_entity_override_rest"),
+    ("POST", re.compile(r"^/tasks$"), "create_task"),
+    ("GET", re.compile(r"^/tasks/(?P<task_id>[^/]+)$"), "get_task_by_id"),
+    ("PUT", re.compile(r"^/tasks/(?P<task_id>[^/]+)/status$"), "update_task_status_by_id"),
+    ("POST", re.compile(r"^/agent/listen$"), "long_poll_listen_as_agent"),
+]
+
+
+class ApiError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def parse_time(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except (AttributeError, ValueError):
+        return None
+
+
+def camel_case(name: str) -> str:
+    head, *tail = name.split("_")
+    return head + "".join(part[:1].upper() + part[1:] for part in tail)
+
+
+def percentiles(values: list) -> dict:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+    summary = {"count": len(ordered), "max": ordered[-1]}
+    for percentile in PERCENTILES:
+        summary[f"p{percentile}"] = ordered[min(len(ordered) - 1, math.ceil(percentile / 100 * len(ordered)) - 1)]
+    return summary
+
+
+class FakeLattice:
+    def __init__(self, settings: dict):
+        """
+        The in-memory state of the fake Lattice environment: the published entities, the entity event log the
+        long polls read from, and the tasks with their delivery queues per assignee. Every method is safe to call
+        from the request threads, long polls wait on a shared condition that is notified on every change.
+
+        Args:
+            settings (dict): The server settings, see DEFAULT_SETTINGS.
+        """
+        self.settings = settings
+        self.condition = threading.Condition()
+        self.instance = uuid.uuid4().hex[:8]
+        self.entities = {}
+        self.events = deque(maxlen=settings["event-log-size"])
+        # sequence number of the next event, the event at events[i] has sequence next_sequence - len(events) + i
+        self.next_sequence = 0
+        self.tasks = {}
+        self.pending_tasks = {}
+        self.first_published = {}
+        self.calls = {name: 0 for _, _, name in ROUTES}
+        self.errors = {name: 0 for _, _, name in ROUTES}
+        self.ingest_to_task_seconds = []
+        self.started_at = time.time()
+
+    def append_event(self, event_type: str, entity: dict):
+        self.events.append({"eventType": event_type, "time": now_iso(), "entity": entity})
+        self.next_sequence += 1
+        self.condition.notify_all()
+
+    def session_token(self, sequence: int) -> str:
+        return f"{self.instance}:{sequence}"
+
+    def parse_session_token(self, token: str) -> int:
+        instance, _, sequence = token.partition(":")
+        if instance != self.instance or not sequence.isdigit():
+            raise ApiError(400, "invalid session token")
+        sequence = int(sequence)
+        if sequence < self.next_sequence - len(self.events) or sequence > self.next_sequence:
+            raise ApiError(410, "session expired")
+        return sequence
+
+    def live_entities(self) -> list:
+        now = time.time()
+        return [entity for entity in self.entities.values()
+                if (parse_time(entity.get("expiryTime")) or math.inf) > now]
+
+    def long_poll_entity_events(self, body: dict) -> dict:
+        token = (body or {}).get("sessionToken") or ""
+        batch_size = (body or {}).get("batchSize") or self.settings["event-batch-size"]
+        with self.condition:
+            if not token:
+                # a new session starts with a snapshot of the live entities
+                events = [{"eventType": "EVENT_TYPE_PREEXISTING", "time": now_iso(), "entity": entity}
+                          for entity in self.live_entities()]
+                return {"sessionToken": self.session_token(self.next_sequence), "entityEvents": events}
+            sequence = self.parse_session_token(token)
+            self.condition.wait_for(lambda: self.next_sequence > sequence,
+                                    timeout=self.settings["long-poll-timeout-seconds"])
+            sequence = max(sequence, self.next_sequence - len(self.events))
+            start = len(self.events) - (self.next_sequence - sequence)
+            count = min(batch_size, len(self.events) - start)
+            events = [self.events[start + offset] for offset in range(count)]
+            return {"sessionToken": self.session_token(sequence + count), "entityEvents": events}
+
+    def publish_entity_rest(self, body: dict) -> dict:
+        entity_id = body.get("entityId")
+        if not entity_id:
+            raise ApiError(400, "missing entityId")
+        with self.condition:
+            self.first_published.setdefault(entity_id, time.time())
+            if body.get("isLive") is False:
+                self.entities.pop(entity_id, None)
+                self.append_event("EVENT_TYPE_DELETED", body)
+                return {}
+            event_type = "EVENT_TYPE_UPDATE" if entity_id in self.entities else "EVENT_TYPE_CREATED"
+            self.entities[entity_id] = body
+            self.append_event(event_type, body)
+        return {}
+
+    def put_entity_override_rest(self, entity_id: str, field_path: str, body: dict) -> dict:
+        path = [camel_case(part) for part in field_path.split(".")]
+        value = (body or {}).get("entity") or {}
+        for part in path:
+            if not isinstance(value, dict) or part not in value:
+                raise ApiError(400, f"override entity does not set {field_path}")
+            value = value[part]
+        with self.condition:
+            entity = self.entities.get(entity_id)
+            if entity is None:
+                raise ApiError(404, f"entity {entity_id} not found")
+            entity = json.loads(json.dumps(entity))
+            target = entity
+            for part in path[:-1]:
+                target = target.setdefault(part, {})
+            target[path[-1]] = value
+            self.entities[entity_id] = entity
+            self.append_event("EVENT_TYPE_UPDATE", entity)
+        return entity
+
+    def create_task(self, body: dict) -> dict:
+        # a client supplied task id makes creation idempotent, a repeated request is rejected like Lattice does
+        task_id = body.get("taskId") or str(uuid.uuid4())
+        assignee = (((body.get("relations") or {}).get("assignee") or {}).get("system") or {}).get("entityId")
+        task = {
+            "version": {"taskId": task_id, "definitionVersion": 1, "statusVersion": 1},
+            "displayName": body.get("displayName"),
+            "description": body.get("description"),
+            "specification": body.get("specification"),
+            "createdBy": body.get("author"),
+            "relations": body.get("relations"),
+            "status": {"status": "STATUS_CREATED"},
+            "createTime": now_iso(),
+            "isExecutedElsewhere": body.get("isExecutedElsewhere", False),
+            "initialEntities": body.get("initialEntities"),
+        }
+        objective = ((body.get("specification") or {}).get("objective") or {})
+        track_id = objective.get("entity_id") or objective.get("entityId")
+        with self.condition:
+            if task_id in self.tasks:
+                raise ApiError(409, f"task {task_id} already exists")
+            self.tasks[task_id] = task
+            if assignee:
+                self.pending_tasks.setdefault(assignee, deque()).append(task_id)
+            published = [self.first_published[entity_id] for entity_id in (assignee, track_id)
+                         if entity_id in self.first_published]
+            if published:
+                # the pair became taskable once both entities had been published
+                self.ingest_to_task_seconds.append(time.time() - max(published))
+            self.condition.notify_all()
+        return task
+
+    def get_task_by_id(self, task_id: str) -> dict:
+        with self.condition:
+            task = self.tasks.get(task_id)
+        if task is None:
+            raise ApiError(404, f"task {task_id} not found")
+        return task
+
+    def update_task_status_by_id(self, task_id: str, body: dict) -> dict:
+        status = ((body or {}).get("newStatus") or {}).get("status")
+        if not status:
+            raise ApiError(400, "missing newStatus")
+        with self.condition:
+            task = self.tasks.get(task_id)
+            if task is None:
+                raise ApiError(404, f"task {task_id} not found")
+            self.set_task_status(task, status)
+        completion_seconds = self.settings["task-completion-seconds"]
+        if status == "STATUS_EXECUTING" and completion_seconds > 0:
+            timer = threading.Timer(completion_seconds, self.complete_task, args=(task_id,))
+            timer.daemon = True
+            timer.start()
+        return task
+
+    def set_task_status(self, task: dict, status: str):
+        task["status"] = {"status": status}
+        task["version"]["statusVersion"] += 1
+        self.condition.notify_all()
+
+    def complete_task(self, task_id: str):
+        with self.condition:
+            task = self.tasks.get(task_id)
+            if task is not None and task["status"]["status"] == "STATUS_EXECUTING":
+                self.set_task_status(task, "STATUS_DONE_OK")
+
+    def long_poll_listen_as_agent(self, body: dict) -> dict:
+        entity_ids = (((body or {}).get("agentSelector") or {}).get("entityIds")) or []
+
+        def next_task_id():
+            for entity_id in entity_ids:
+                pending = self.pending_tasks.get(entity_id)
+                if pending:
+                    return pending.popleft()
+            return None
+
+        with self.condition:
+            task_id = next_task_id()
+            if task_id is None:
+                self.condition.wait_for(lambda: any(self.pending_tasks.get(entity_id) for entity_id in entity_ids),
+                                        timeout=self.settings["long-poll-timeout-seconds"])
+                task_id = next_task_id()
+            if task_id is None:
+                return {}
+            task = self.tasks[task_id]
+            self.set_task_status(task, "STATUS_SENT")
+            return {"executeRequest": {"task": task}}
+
+    def stats(self) -> dict:
+        with self.condition:
+            statuses = {}
+            for task in self.tasks.values():
+                statuses[task["status"]["status"]] = statuses.get(task["status"]["status"], 0) + 1
+            return {
+                "uptime_seconds": time.time() - self.started_at,
+                "calls": dict(self.calls),
+                "errors": dict(self.errors),
+                "entities": len(self.entities),
+                "events": self.next_sequence,
+                "tasks": len(self.tasks),
+                "task_statuses": statuses,
+                "ingest_to_task_seconds": percentiles(self.ingest_to_task_seconds),
+            }
+
+
+class FakeLatticeHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        self.server.logger.debug(format % args)
+
+    def do_GET(self):
+        self.dispatch("GET")
+
+    def do_POST(self):
+        self.dispatch("POST")
+
+    def do_PUT(self):
+        self.dispatch("PUT")
+
+    def dispatch(self, method: str):
+        path = urlsplit(self.path).path
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+        if method == "GET" and path == "/stats":
+            self.respond(200, self.server.lattice.stats())
+            return
+        if not path.startswith(API_PREFIX):
+            self.respond(404, {"message": f"unknown path {path}"})
+            return
+        path = path[len(API_PREFIX):]
+        for route_method, pattern, name in ROUTES:
+            match = pattern.match(path)
+            if route_method == method and match:
+                self.handle_api_call(method, name,
+                                     {key: unquote(value) for key, value in match.groupdict().items()}, raw_body)
+                return
+        self.respond(404, {"message": f"unknown endpoint {method} {path}"})
+
+    def handle_api_call(self, method: str, name: str, params: dict, raw_body: bytes):
+        lattice = self.server.lattice
+        settings = self.server.settings
+        with lattice.condition:
+            lattice.calls[name] += 1
+        delay_ms = settings["latency-ms"] + random.uniform(0, settings["latency-jitter-ms"])
+        if delay_ms > 0:
+            time.sleep(delay_ms / 1000)
+        if random.random() < settings["error-rate"]:
+            with lattice.condition:
+                lattice.errors[name] += 1
+            self.respond(settings["error-status"], {"message": "injected error"})
+            return
+        try:
+            if method != "GET":
+                params["body"] = json.loads(raw_body) if raw_body else {}
+            self.respond(200, getattr(lattice, name)(**params))
+        except ApiError as error:
+            self.respond(error.status, {"message": error.message})
+        except json.JSONDecodeError as error:
+            self.respond(400, {"message": f"invalid json {error}"})
+        except Exception as error:
+            self.server.logger.error(f"fake lattice {name} error {error}")
+            self.respond(500, {"message": str(error)})
+
+    def respond(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeLatticeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, logger: logging.Logger, settings: dict):
+        """
+        A local stand-in for the Lattice REST endpoints used by the auto reconnaissance system and the simulators,
+        with injected latency and errors and an optional generator of synthetic track traffic. GET /stats returns
+        the api call volume, the task statuses and the latency from publishing an asset-track pair to its task.
+
+        Args:
+            logger (logging.Logger): The logger.
+            settings (dict): The server settings, missing keys fall back to DEFAULT_SETTINGS.
+        """
+        self.logger = logger
+        self.settings = {**DEFAULT_SETTINGS, **(settings or {})}
+        self.lattice = FakeLattice(self.settings)
+        self.stopped = threading.Event()
+        super().__init__((self.settings["host"], self.settings["port"]), FakeLatticeHandler)
+
+    @property
+    def address(self) -> str:
+        host, port = self.server_address[:2]
+        return f"{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name="fake-lattice", daemon=True).start()
+        if self.settings["generated-tracks"] > 0 and self.settings["generated-event-rate"] > 0:
+            threading.Thread(target=self.generate_tracks, name="fake-lattice-generator", daemon=True).start()
+        self.logger.info(f"fake lattice listening on http://{self.address}")
+
+    def stop(self):
+        self.stopped.set()
+        self.shutdown()
+        self.server_close()
+
+    def generate_tracks(self):
+        settings = self.settings
+        rng = random.Random(settings["seed"])
+        radius = settings["generated-radius-degrees"]
+        positions = [(settings["generated-latitude"] + rng.uniform(-radius, radius),
+                      settings["generated-longitude"] + rng.uniform(-radius, radius))
+                     for _ in range(settings["generated-tracks"])]
+        interval = 1 / settings["generated-event-rate"]
+        next_at = time.monotonic()
+        index = 0
+        while not self.stopped.is_set():
+            latitude, longitude = positions[index]
+            latitude += rng.gauss(0, GENERATED_MOVE_DEGREES)
+            longitude += rng.gauss(0, GENERATED_MOVE_DEGREES)
+            positions[index] = (latitude, longitude)
+            expiry_time = datetime.now(timezone.utc) + timedelta(seconds=settings["generated-expiry-seconds"])
+            self.lattice.publish_entity_rest({
+                "entityId": f"generated-track-{index}",
+                "isLive": True,
+                "expiryTime": expiry_time.isoformat(),
+                "location": {"position": {"latitudeDegrees": latitude, "longitudeDegrees": longitude,
+                                          "altitudeHaeMeters": 0},
+                             "speedMps": 1},
+                "milView": {"disposition": "DISPOSITION_UNKNOWN", "environment": "ENVIRONMENT_SURFACE"},
+                "provenance": {"dataType": "Generated Track", "integrationName": "fake-lattice",
+                               "sourceUpdateTime": now_iso()},
+                "ontology": {"template": "TEMPLATE_TRACK", "platformType": "UNKNOWN"},
+            })
+            index = (index + 1) % len(positions)
+            next_at += interval
+            self.stopped.wait(max(0.0, next_at - time.monotonic()))
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Fake Lattice Server')
+    parser.add_argument('--config', type=str, help='Path to the configuration file')
+    return parser.parse_args()
+
+
+def read_config(config_path):
+    if not config_path:
+        return {}
+    with open(config_path, 'r') as ymlfile:
+        return yaml.safe_load(ymlfile) or {}
+
+
+def main():
+    logging.basicConfig()
+    logger = logging.getLogger("FAKELATTICE")
+    logger.setLevel(logging.INFO)
+
+    args = parse_arguments()
+    server = FakeLatticeServer(logger, read_config(args.config))
+    server.start()
+    try:
+        server.stopped.wait()
+    except KeyboardInterrupt:
+        logger.info("keyboard interrupt detected")
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
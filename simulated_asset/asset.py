@@ -183,7 +183,7 @@ def main():
 
     # ENTITIES API (REST)
     entities_configuration = anduril_entities.Configuration(
-        host=f"https://{cfg['lattice-ip']}/api/v1"
+        host=f"{cfg.get('lattice-scheme', 'https')}://{cfg['lattice-ip']}/api/v1"
     )
     entities_api_client = anduril_entities.ApiClient(configuration=entities_configuration)
     entities_api_client.default_headers["Authorization"] = f"Bearer {cfg['lattice-bearer-token']}"
@@ -192,7 +192,7 @@ def main():
 
     # TASKS API (gRPC/gRPC-Web) — must also set both headers
     tasks_configuration = anduril_tasks.Configuration(
-        host=f"https://{cfg['lattice-ip']}/api/v1"
+        host=f"{cfg.get('lattice-scheme', 'https')}://{cfg['lattice-ip']}/api/v1"
     )
     tasks_api_client = anduril_tasks.ApiClient(configuration=tasks_configuration)
     tasks_api_client.default_headers["Authorization"] = f"Bearer {cfg['lattice-bearer-token']}"
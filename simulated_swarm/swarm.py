@@ -0,0 +1,371 @@
+import argparse
+import asyncio
+import logging
+import math
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+
+import entities_api as anduril_entities
+import tasks_api as anduril_tasks
+import yaml
+
+EXPIRY_OFFSET = 15
+REFRESH_INTERVAL = 5
+MAX_CONCURRENCY = 32
+# how often the scheduler looks for entities that are due, publishes are spread over the interval at this resolution
+SCHEDULER_TICK_SECONDS = 0.01
+STATS_INTERVAL_SECONDS = 10
+METERS_PER_DEGREE_LATITUDE = 111320.0
+STATUS_VERSION_COUNTER = 1
+
+
+class SwarmMember:
+    """
+    One simulated entity of the swarm. The entity model is built once and only its position, speed and timestamps
+    are patched before each publish. The position moves along the velocity since the previous publish and bounces
+    off the edges of the swarm area.
+    """
+    __slots__ = ("entity", "latitude", "longitude", "east_mps", "north_mps", "next_publish_at", "updated_at",
+                 "in_flight")
+
+    def __init__(self, entity: anduril_entities.Entity, latitude: float, longitude: float, east_mps: float,
+                 north_mps: float, next_publish_at: float):
+        self.entity = entity
+        self.latitude = latitude
+        self.longitude = longitude
+        self.east_mps = east_mps
+        self.north_mps = north_mps
+        self.next_publish_at = next_publish_at
+        self.updated_at = next_publish_at
+        self.in_flight = False
+
+    def move(self, now: float, bounds: tuple):
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        min_latitude, max_latitude, min_longitude, max_longitude = bounds
+        self.latitude += self.north_mps * elapsed / METERS_PER_DEGREE_LATITUDE
+        meters_per_degree_longitude = METERS_PER_DEGREE_LATITUDE * math.cos(math.radians(self.latitude))
+        self.longitude += self.east_mps * elapsed / meters_per_degree_longitude
+        if not min_latitude <= self.latitude <= max_latitude:
+            self.north_mps = -self.north_mps
+            self.latitude = min(max(self.latitude, min_latitude), max_latitude)
+        if not min_longitude <= self.longitude <= max_longitude:
+            self.east_mps = -self.east_mps
+            self.longitude = min(max(self.longitude, min_longitude), max_longitude)
+
+    def patch(self, now: datetime):
+        location = self.entity.location
+        location.position.latitude_degrees = self.latitude
+        location.position.longitude_degrees = self.longitude
+        location.velocity_enu.e = self.east_mps
+        location.velocity_enu.n = self.north_mps
+        location.speed_mps = math.hypot(self.east_mps, self.north_mps)
+        self.entity.expiry_time = now + timedelta(seconds=EXPIRY_OFFSET)
+        self.entity.provenance.source_update_time = now
+
+
+class SimulatedSwarm:
+    def __init__(self,
+                 logger: logging.Logger,
+                 entities_api_client: anduril_entities.EntityApi,
+                 tasks_api_client: anduril_tasks.TaskApi,
+                 cfg: dict):
+        """
+        Simulates a swarm of assets and tracks from one process. Each member is published once per refresh
+        interval at its own offset within the interval, so the load is spread evenly, and the blocking publish calls
+        run on a bounded thread pool. A member whose previous publish is still in flight skips its turn.
+        The assets listen for tasks together through one agent long poll.
+
+        Args:
+            logger (logging.Logger): The logger.
+            entities_api_client (anduril_entities.EntityApi): The Entities API client.
+            tasks_api_client (anduril_tasks.TaskApi): The Tasks API client.
+            cfg (dict): The swarm configuration.
+        """
+        self.logger = logger
+        self.entities_api_client = entities_api_client
+        self.tasks_api_client = tasks_api_client
+        self.refresh_interval = cfg.get("refresh-interval", REFRESH_INTERVAL)
+        self.max_concurrency = cfg.get("max-concurrency", MAX_CONCURRENCY)
+        self.executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="swarm-publisher")
+        # the agent long poll and the status updates get their own threads so they never hold up publishing
+        self.task_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="swarm-tasks")
+        radius = cfg.get("radius-degrees", 0.1)
+        self.bounds = (cfg["latitude"] - radius, cfg["latitude"] + radius,
+                       cfg["longitude"] - radius, cfg["longitude"] + radius)
+        self.rng = random.Random(cfg.get("seed", 0))
+        self.max_speed_mps = cfg.get("max-speed-mps", 10)
+        self.track_disposition = cfg.get("track-disposition", "DISPOSITION_UNKNOWN")
+        self.asset_ids = [f"swarm-asset-{index:05d}" for index in range(cfg.get("assets", 0))]
+        self.track_ids = [f"swarm-track-{index:05d}" for index in range(cfg.get("tracks", 0))]
+        self.members = self.build_members()
+        self.published = 0
+        self.errors = 0
+        self.skipped = 0
+        self.max_lag_seconds = 0.0
+
+    def build_members(self) -> list:
+        entity_ids = self.asset_ids + self.track_ids
+        members = []
+        for index, entity_id in enumerate(entity_ids):
+            min_latitude, max_latitude, min_longitude, max_longitude = self.bounds
+            latitude = self.rng.uniform(min_latitude, max_latitude)
+            longitude = self.rng.uniform(min_longitude, max_longitude)
+            speed = self.rng.uniform(0, self.max_speed_mps)
+            heading = self.rng.uniform(0, 2 * math.pi)
+            east_mps, north_mps = speed * math.sin(heading), speed * math.cos(heading)
+            is_asset = index < len(self.asset_ids)
+            entity = self.generate_asset_entity(entity_id) if is_asset else self.generate_track_entity(entity_id)
+            members.append(SwarmMember(entity, latitude, longitude, east_mps, north_mps, 0))
+        # spread the first publish of every member evenly over the interval, starting once all models are built
+        start = time.monotonic()
+        for index, member in enumerate(members):
+            member.next_publish_at = member.updated_at = start + self.refresh_interval * index / len(members)
+        return members
+
+    def generate_asset_entity(self, entity_id: str):
+        return anduril_entities.Entity(
+            entity_id=entity_id,
+            is_live=True,
+            expiry_time=datetime.now(timezone.utc) + timedelta(seconds=EXPIRY_OFFSET),
+            aliases=anduril_entities.Aliases(
+                name=f"Simulated Asset {entity_id}",
+            ),
+            location=anduril_entities.Location(
+                position=anduril_entities.Position(
+                    latitudeDegrees=0,
+                    longitudeDegrees=0,
+                    altitudeHaeMeters=55
+                ),
+                speedMps=0,
+                velocityEnu=anduril_entities.ENU(
+                    e=0,
+                    n=0,
+                    u=0
+                )
+            ),
+            mil_view=anduril_entities.MilView(
+                disposition="DISPOSITION_FRIENDLY",
+                environment="ENVIRONMENT_SURFACE",
+            ),
+            provenance=anduril_entities.Provenance(
+                data_type="Simulated Asset",
+                integration_name="auto-reconnaissance-sample-app",
+                source_update_time=datetime.now(timezone.utc),
+            ),
+            ontology=anduril_entities.Ontology(
+                template="TEMPLATE_ASSET",
+                platform_type="USV"
+            ),
+            task_catalog=anduril_entities.TaskCatalog(
+                task_definitions=[
+                    anduril_entities.TaskDefinition(
+                        task_specification_url="type.googleapis.com/anduril.tasks.v2.Investigate"
+                    )
+                ]
+            )
+        )
+
+    def generate_track_entity(self, entity_id: str):
+        return anduril_entities.Entity(
+            entity_id=entity_id,
+            is_live=True,
+            expiry_time=datetime.now(timezone.utc) + timedelta(seconds=EXPIRY_OFFSET),
+            aliases=anduril_entities.Aliases(
+                name=f"Simulated Track {entity_id}",
+            ),
+            location=anduril_entities.Location(
+                position=anduril_entities.Position(
+                    latitudeDegrees=0,
+                    longitudeDegrees=0,
+                    altitudeHaeMeters=0
+                ),
+                speedMps=0,
+                velocityEnu=anduril_entities.ENU(
+                    e=0,
+                    n=0,
+                    u=0
+                )
+            ),
+            mil_view=anduril_entities.MilView(
+                disposition=self.track_disposition,
+                environment="ENVIRONMENT_SURFACE",
+            ),
+            provenance=anduril_entities.Provenance(
+                data_type="Simulated Track",
+                integration_name="auto-reconnaissance-sample-app",
+                source_update_time=datetime.now(timezone.utc),
+            ),
+            ontology=anduril_entities.Ontology(
+                template="TEMPLATE_TRACK",
+                platform_type="UNKNOWN"
+            )
+        )
+
+    async def run(self):
+        self.logger.info(f"starting swarm of {len(self.asset_ids)} assets and {len(self.track_ids)} tracks")
+        tasks = [
+            asyncio.create_task(self.publish_members()),
+            asyncio.create_task(self.report_stats())
+        ]
+        if self.asset_ids:
+            tasks.append(asyncio.create_task(self.listen_for_tasks()))
+        try:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.task_executor.shutdown(wait=False, cancel_futures=True)
+            self.logger.info("Shutting down Simulated Swarm")
+
+    async def publish_members(self):
+        if not self.members:
+            return
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        # members ordered by their next publish time, which only ever advances by one interval
+        queue = list(self.members)
+        position = 0
+
+        def published(member: SwarmMember, future):
+            member.in_flight = False
+            semaphore.release()
+            if future.cancelled() or future.exception() is not None:
+                self.errors += 1
+            else:
+                self.published += 1
+
+        while True:
+            now = time.monotonic()
+            while queue[position].next_publish_at <= now:
+                member = queue[position]
+                self.max_lag_seconds = max(self.max_lag_seconds, now - member.next_publish_at)
+                member.next_publish_at += self.refresh_interval
+                position = (position + 1) % len(queue)
+                if member.in_flight:
+                    self.skipped += 1
+                    continue
+                await semaphore.acquire()
+                member.in_flight = True
+                member.move(time.monotonic(), self.bounds)
+                member.patch(datetime.now(timezone.utc))
+                future = loop.run_in_executor(self.executor, self.publish, member)
+                future.add_done_callback(lambda future, member=member: published(member, future))
+                now = time.monotonic()
+            await asyncio.sleep(SCHEDULER_TICK_SECONDS)
+
+    def publish(self, member: SwarmMember):
+        try:
+            self.entities_api_client.publish_entity_rest(entity=member.entity)
+        except Exception as error:
+            self.logger.error(f"lattice api publish swarm entity error {error}")
+            raise
+
+    async def report_stats(self):
+        published = 0
+        while True:
+            await asyncio.sleep(STATS_INTERVAL_SECONDS)
+            rate = (self.published - published) / STATS_INTERVAL_SECONDS
+            published = self.published
+            self.logger.info(f"published {rate:.0f} entities/s, {self.errors} errors, {self.skipped} skipped, "
+                             f"max lag {self.max_lag_seconds:.2f}s")
+            self.max_lag_seconds = 0.0
+
+    async def listen_for_tasks(self):
+        self.logger.info(f"starting listen task for tasking {len(self.asset_ids)} swarm assets")
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                agent_listener = anduril_tasks.AgentListener(
+                    agent_selector=anduril_tasks.EntityIdsSelector(entity_ids=self.asset_ids))
+                agent_request = await loop.run_in_executor(
+                    self.task_executor,
+                    lambda: self.tasks_api_client.long_poll_listen_as_agent(agent_listener=agent_listener)
+                )
+                if agent_request and agent_request.execute_request:
+                    await self.confirm_execution(agent_request.execute_request.task)
+            except Exception as error:
+                self.logger.error(f"simulated swarm task processing error {error}")
+
+    async def confirm_execution(self, task: anduril_tasks.Task):
+        global STATUS_VERSION_COUNTER
+        STATUS_VERSION_COUNTER += 1
+        assignee = task.relations.assignee.system.entity_id
+        self.logger.info(f"received execute request for {assignee}, sending execute confirmation")
+        task_execute_update = anduril_tasks.TaskStatusUpdate(
+            new_status=anduril_tasks.TaskStatus(status="STATUS_EXECUTING"),
+            author=anduril_tasks.models.Principal(system=anduril_tasks.models.System(entity_id=assignee)),
+            status_version=STATUS_VERSION_COUNTER
+        )
+        await asyncio.get_running_loop().run_in_executor(
+            self.task_executor,
+            lambda: self.tasks_api_client.update_task_status_by_id(task_id=task.version.task_id,
+                                                                   task_status_update=task_execute_update)
+        )
+
+
+def validate_config(cfg):
+    if "lattice-ip" not in cfg:
+        raise ValueError("missing lattice-ip")
+    if "lattice-bearer-token" not in cfg:
+        raise ValueError("missing lattice-bearer-token")
+    if "sandbox-token" not in cfg:
+        raise ValueError("missing sandbox-token")
+    if "latitude" not in cfg:
+        raise ValueError("missing latitude")
+    if "longitude" not in cfg:
+        raise ValueError("missing longitude")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description='Simulated Swarm')
+    parser.add_argument('--config', type=str, help='Path to the configuration file', required=True)
+    return parser.parse_args()
+
+
+def read_config(config_path):
+    with open(config_path, 'r') as ymlfile:
+        cfg = yaml.safe_load(ymlfile)
+        validate_config(cfg)
+    return cfg
+
+
+def main():
+    logging.basicConfig()
+    logger = logging.getLogger("SIMSWARM")
+    logger.setLevel(logging.INFO)
+    logger.info("starting simulated swarm")
+
+    args = parse_arguments()
+    cfg = read_config(args.config)
+    max_concurrency = cfg.get("max-concurrency", MAX_CONCURRENCY)
+
+    entities_configuration = anduril_entities.Configuration(
+        host=f"{cfg.get('lattice-scheme', 'https')}://{cfg['lattice-ip']}/api/v1"
+    )
+    # one pooled keep-alive connection per publisher thread
+    entities_configuration.connection_pool_maxsize = max_concurrency
+    entities_api_client = anduril_entities.ApiClient(configuration=entities_configuration)
+    entities_api_client.default_headers["Authorization"] = f"Bearer {cfg['lattice-bearer-token']}"
+    entities_api_client.default_headers["anduril-sandbox-authorization"] = f"Bearer {cfg['sandbox-token']}"
+    entities_api = anduril_entities.EntityApi(api_client=entities_api_client)
+
+    tasks_configuration = anduril_tasks.Configuration(
+        host=f"{cfg.get('lattice-scheme', 'https')}://{cfg['lattice-ip']}/api/v1"
+    )
+    tasks_api_client = anduril_tasks.ApiClient(configuration=tasks_configuration)
+    tasks_api_client.default_headers["Authorization"] = f"Bearer {cfg['lattice-bearer-token']}"
+    tasks_api_client.default_headers["anduril-sandbox-authorization"] = f"Bearer {cfg['sandbox-token']}"
+    tasks_api = anduril_tasks.TaskApi(api_client=tasks_api_client)
+
+    swarm = SimulatedSwarm(logger, entities_api, tasks_api, cfg)
+
+    try:
+        asyncio.run(swarm.run())
+    except KeyboardInterrupt:
+        logger.info("keyboard interrupt detected")
+
+
+if __name__ == "__main__":
+    main()
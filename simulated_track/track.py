@@ -106,7 +106,7 @@ def main():
     cfg = read_config(args.config)
 
     entities_configuration = anduril_entities.Configuration(
-        host=f"https://{cfg['lattice-ip']}/api/v1"
+        host=f"{cfg.get('lattice-scheme', 'https')}://{cfg['lattice-ip']}/api/v1"
     )
     entities_api_client = anduril_entities.ApiClient(configuration=entities_configuration)
     entities_api_client.default_headers["Authorization"] = f"Bearer {cfg['lattice-bearer-token']}"